@@ -0,0 +1,425 @@
+"""
+Adventurer's Impact - Batch Environment
+
+Runs many independent game sessions in parallel for automated
+playthroughs, such as bot testing and level balance sweeps.
+The sessions are split across a pool of headless worker processes.
+Observations, rewards and done flags are written by the workers
+straight into shared memory, so stepping the batch only sends the
+actions through a pipe and never copies observations around.
+
+Each worker keeps one GameView per session and drives it through the
+same on_key_press/on_key_release handlers and simulation tick that
+the game uses. Textures and parsed maps are cached inside each
+worker, so resetting a session does not load them from disk again.
+
+Usage:
+    with BatchEnv(num_envs=64) as env:
+        observations = env.reset(level=1)
+        observations, rewards, dones = env.step([ACTION_RIGHT] * 64)
+
+    python batch_env.py --envs 64 --workers 8 --steps 500
+"""
+
+# Importing the libraries that are used for the batch environment.
+import argparse
+import array
+import multiprocessing
+import os
+import random
+import time
+from multiprocessing import shared_memory
+
+# Constants for the actions. Each action is the set of keys
+# that are held down for the whole step.
+ACTIONS = (
+    (),
+    ("LEFT",),
+    ("RIGHT",),
+    ("UP",),
+    ("SPACE",),
+    ("LEFT", "UP"),
+    ("RIGHT", "UP"),
+)
+ACTION_NOOP = 0
+ACTION_LEFT = 1
+ACTION_RIGHT = 2
+ACTION_JUMP = 3
+ACTION_ATTACK = 4
+ACTION_LEFT_JUMP = 5
+ACTION_RIGHT_JUMP = 6
+
+# Constants for the observations
+NEAREST_ENEMIES = 4
+PLAYER_FEATURES = 6
+ENEMY_FEATURES = 3
+OBSERVATION_SIZE = PLAYER_FEATURES + NEAREST_ENEMIES * ENEMY_FEATURES
+
+# Constants for the rewards
+PROGRESS_REWARD = 0.01
+DAMAGE_DEALT_REWARD = 1.0
+DAMAGE_TAKEN_PENALTY = 1.0
+DEATH_PENALTY = 10.0
+FINISH_REWARD = 100.0
+
+# Constants for the episodes
+TICKS_PER_STEP = 4
+MAX_EPISODE_TICKS = 60 * 60 * 5
+
+
+class GameSession:
+    """
+    This class wraps a single GameView so that it can be driven
+    by actions instead of a keyboard. It must run in a process
+    that has a (headless) arcade window open.
+    """
+    def __init__(self, window, ticks_per_step=TICKS_PER_STEP):
+        """
+        Initializes the session with the window the game view
+        belongs to and how many ticks each step simulates.
+        """
+        import arcade
+
+        self.window = window
+        self.ticks_per_step = ticks_per_step
+        self.keys = {
+            name: getattr(arcade.key, name)
+            for action in ACTIONS
+            for name in action
+        }
+        self.game_view = None
+        self.held_keys = set()
+        self.level = 1
+        self.seed = 0
+
+    def reset(self, level, seed=0):
+        """
+        Starts a new episode on the given level and returns
+        its first observation.
+        """
+        import main
+
+        random.seed(seed)
+        if self.game_view is None:
+            self.game_view = main.GameView()
+        self.game_view.map_path = None
+        self.game_view.level = level
+        self.game_view.tick = 0
+        self.game_view.accumulator = 0.0
+        self.game_view.setup()
+        self.held_keys = set()
+        self.level = level
+        self.seed = seed
+        return self.observe()
+
+    def step(self, action):
+        """
+        Holds down the keys of the action for one step and returns
+        the observation, the reward and whether the episode is done.
+        """
+        import main
+
+        game_view = self.game_view
+        player = game_view.player_sprite
+        if self.window.current_view is not game_view:
+            self.window.show_view(game_view)
+
+        # Presses and releases keys so that exactly the keys of the
+        # action are held, going through the game's own handlers.
+        wanted = set(ACTIONS[action])
+        for name in self.held_keys - wanted:
+            game_view.on_key_release(self.keys[name], 0)
+        for name in wanted - self.held_keys:
+            game_view.on_key_press(self.keys[name], 0)
+        self.held_keys = wanted
+
+        start_x = player.center_x
+        start_health = player.current_health
+        enemy_health = sum(
+            enemy.current_health for enemy in game_view.enemy_list
+        )
+
+        finished = False
+        for _ in range(self.ticks_per_step):
+            game_view.fixed_update()
+            if (
+                game_view.level != self.level
+                or isinstance(self.window.current_view, main.EndScreen)
+            ):
+                finished = True
+            if finished or self.window.current_view is not game_view:
+                break
+
+        reward = 0.0
+        died = isinstance(self.window.current_view, main.DeathScreen)
+        if finished:
+            reward += FINISH_REWARD
+        else:
+            reward += (player.center_x - start_x) * PROGRESS_REWARD
+            reward += DAMAGE_DEALT_REWARD * (
+                enemy_health
+                - sum(enemy.current_health for enemy in game_view.enemy_list)
+            )
+            reward -= DAMAGE_TAKEN_PENALTY * (
+                start_health - player.current_health
+            )
+            if died:
+                reward -= DEATH_PENALTY
+
+        done = finished or died or game_view.tick >= MAX_EPISODE_TICKS
+        return self.observe(), reward, done
+
+    def observe(self):
+        """
+        Returns the observation of the current state as a list of
+        floats: the player's position, velocity, health and the
+        tick, followed by the relative position and health of
+        the nearest living enemies.
+        """
+        player = self.game_view.player_sprite
+        observation = [
+            player.center_x,
+            player.center_y,
+            player.change_x,
+            player.change_y,
+            player.current_health,
+            self.game_view.tick,
+        ]
+        nearest = sorted(
+            (
+                enemy
+                for enemy in self.game_view.enemy_list
+                if not enemy.is_dead
+            ),
+            key=lambda enemy: abs(enemy.center_x - player.center_x)
+            + abs(enemy.center_y - player.center_y),
+        )[:NEAREST_ENEMIES]
+        for enemy in nearest:
+            observation += [
+                enemy.center_x - player.center_x,
+                enemy.center_y - player.center_y,
+                enemy.current_health,
+            ]
+        observation += [0.0] * (OBSERVATION_SIZE - len(observation))
+        return observation
+
+
+def buffer_views(memory, num_envs):
+    """
+    Returns the observation, reward and done views of a shared
+    memory block laid out by BatchEnv.
+    """
+    doubles = memory.buf.cast("d")
+    observations_end = num_envs * OBSERVATION_SIZE
+    observations = doubles[:observations_end]
+    rewards = doubles[observations_end:observations_end + num_envs]
+    dones = doubles[observations_end + num_envs:]
+    return doubles, observations, rewards, dones
+
+
+def worker(connection, memory_name, num_envs, first, count, ticks_per_step):
+    """
+    Runs a slice of the sessions in a worker process. It opens
+    its own headless window, then answers reset and step commands
+    by writing the results into the shared memory buffers.
+    """
+    os.environ["ARCADE_HEADLESS"] = "1"
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # Sound is not needed for automated playthroughs.
+    import pyglet
+    pyglet.options["audio"] = ("silent",)
+
+    import arcade
+    import main
+
+    window = arcade.Window(
+        main.WINDOW_WIDTH, main.WINDOW_HEIGHT, main.WINDOW_TITLE,
+        visible=False,
+    )
+    window.input_recorder = None
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    doubles, observations, rewards, dones = buffer_views(memory, num_envs)
+    sessions = [GameSession(window, ticks_per_step) for _ in range(count)]
+
+    def write(index, observation):
+        start = (first + index) * OBSERVATION_SIZE
+        observations[start:start + OBSERVATION_SIZE] = array.array(
+            "d", observation
+        )
+
+    while True:
+        command, payload = connection.recv()
+        if command == "reset":
+            for index, (level, seed) in enumerate(payload):
+                write(index, sessions[index].reset(level, seed))
+                rewards[first + index] = 0.0
+                dones[first + index] = 0.0
+        elif command == "step":
+            for index, action in enumerate(payload):
+                session = sessions[index]
+                observation, reward, done = session.step(action)
+                # Finished sessions are reset straight away, so the
+                # observation returned is the start of the next episode.
+                if done:
+                    observation = session.reset(session.level, session.seed)
+                write(index, observation)
+                rewards[first + index] = reward
+                dones[first + index] = float(done)
+        elif command == "close":
+            break
+        connection.send(None)
+
+    # Views must be released before the shared memory is closed.
+    del observations, rewards, dones
+    doubles.release()
+    memory.close()
+    window.close()
+
+
+class BatchEnv:
+    """
+    This class runs a batch of independent game sessions across
+    a pool of worker processes. reset() and step() return views
+    into shared memory that are overwritten by the next call,
+    so copy them if they need to be kept.
+    """
+    def __init__(
+        self, num_envs, workers=None, ticks_per_step=TICKS_PER_STEP
+    ):
+        """
+        Starts the worker processes and allocates the shared
+        memory for the observations, rewards and done flags.
+        """
+        self.num_envs = num_envs
+        workers = min(workers or os.cpu_count() or 1, num_envs)
+
+        size = num_envs * (OBSERVATION_SIZE + 2) * 8
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        (
+            self.doubles,
+            observations,
+            self.rewards,
+            self.dones,
+        ) = buffer_views(self.memory, num_envs)
+        self.observations = observations.cast(
+            "B"
+        ).cast("d", [num_envs, OBSERVATION_SIZE])
+
+        # Each worker is given an even slice of the sessions.
+        # Processes are spawned rather than forked, since every
+        # worker needs its own GL context.
+        context = multiprocessing.get_context("spawn")
+        self.slices = []
+        self.connections = []
+        self.processes = []
+        first = 0
+        for index in range(workers):
+            count = num_envs // workers + (index < num_envs % workers)
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=worker,
+                args=(
+                    child,
+                    self.memory.name,
+                    num_envs,
+                    first,
+                    count,
+                    ticks_per_step,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.slices.append((first, count))
+            self.connections.append(parent)
+            self.processes.append(process)
+            first += count
+
+    def _broadcast(self, command, values):
+        """
+        Sends each worker its slice of the values and waits
+        for all of them to finish.
+        """
+        for connection, (first, count) in zip(self.connections, self.slices):
+            connection.send((command, values[first:first + count]))
+        for connection in self.connections:
+            connection.recv()
+
+    def reset(self, level=1, seed=0):
+        """
+        Resets every session on the given level, or on a list
+        of levels with one level per session.
+        """
+        levels = level if isinstance(level, (list, tuple)) else (
+            [level] * self.num_envs
+        )
+        self._broadcast(
+            "reset",
+            [(levels[index], seed + index) for index in range(self.num_envs)],
+        )
+        return self.observations
+
+    def step(self, actions):
+        """
+        Applies one action per session and returns the
+        observations, rewards and done flags. Sessions that are
+        done have already been reset to start a new episode.
+        """
+        self._broadcast("step", list(actions))
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        """
+        Stops the worker processes and frees the shared memory.
+        """
+        for connection in self.connections:
+            connection.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.observations.release()
+        self.rewards.release()
+        self.dones.release()
+        self.doubles.release()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    """
+    Measures the throughput of the batch environment with
+    random actions.
+    """
+    parser = argparse.ArgumentParser(description="Batch env throughput.")
+    parser.add_argument("--envs", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--level", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with BatchEnv(args.envs, args.workers) as env:
+        env.reset(args.level)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            actions = [rng.randrange(len(ACTIONS)) for _ in range(args.envs)]
+            env.step(actions)
+        elapsed = time.perf_counter() - start
+
+    steps = args.envs * args.steps
+    print(
+        f"{steps} steps ({steps * TICKS_PER_STEP} ticks) with "
+        f"{len(env.processes)} workers in {elapsed:.2f}s: "
+        f"{steps / elapsed:.0f} steps/s"
+    )
+
+
+# Runs the throughput measurement.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1254 @@
+"""
+Adventurer's Impact - Benchmark Suite
+
+Times the loading, simulation and rendering hot paths of the game.
+It runs headless with software GL by default so results from
+different machines can be compared, and saves the results as JSON.
+
+Usage:
+    python benchmark.py run [--output results.json] [--repeat N]
+    python benchmark.py compare baseline.json results.json [--threshold 0.1]
+    python benchmark.py scaling [--enemies 100 1000 5000] [--output ...]
+    python benchmark.py chase [--enemies 10 1000 10000] [--output ...]
+    python benchmark.py hitboxes [--repeat N] [--output ...]
+    python benchmark.py soak [--cycles 200] [--output ...]
+    python benchmark.py rewind [--enemies 100 500 1000] [--output ...]
+    python benchmark.py streaming [--widths 200 2000 6000] [--output ...]
+    python benchmark.py input [--frames 1200] [--output ...]
+    python benchmark.py animation [--enemies 100 1000 5000] [--output ...]
+    python benchmark.py lifecycle [--enemies 100 1000 5000] [--output ...]
+    python benchmark.py startup [--runs 5] [--budget 2.5] [--output ...]
+"""
+
+# Importing the libraries that are used for the benchmarks.
+import argparse
+import gc
+import gzip
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Constants for the benchmarks
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+SIMULATION_TICKS = 1000
+HEALTH_BAR_ENEMY_COUNTS = (10, 100, 1000)
+OBSERVATIONS = 10000
+LEVELS = (1, 2, 3)
+SCALING_ENEMY_COUNTS = (100, 1000, 5000)
+SCALING_WIDTH = 1000
+SCALING_HEIGHT = 200
+SCALING_PLATFORMS_PER_ENEMY = 0.1
+SCALING_TICKS = 100
+CHASE_ENEMY_COUNTS = (10, 1000, 10000)
+CHASE_WIDTH = 40
+CHASE_HEIGHT = 100
+CHASE_TICKS = 100
+HIT_BOX_TICKS = 300
+SOAK_CYCLES = 200
+SOAK_WARMUP_CYCLES = 5
+SOAK_REPORT_EVERY = 20
+SOAK_RSS_LIMIT = 32 * 1024 * 1024
+SOAK_HEAP_LIMIT = 8 * 1024 * 1024
+REWIND_ENEMY_COUNTS = (100, 500, 1000)
+REWIND_WIDTH = 200
+REWIND_TICKS = 1200
+STREAMING_WIDTHS = (200, 2000, 6000)
+STREAMING_TICKS = 100
+INPUT_FRAMES = 1200
+INPUT_EVENTS_PER_FRAME = 0.25
+INPUT_SEED = 0
+ANIMATION_ENEMY_COUNTS = (100, 1000, 5000)
+ANIMATION_WIDTH = 1000
+ANIMATION_TICKS = 100
+ANIMATION_WARMUP_TICKS = 20
+LIFECYCLE_ENEMY_COUNTS = (100, 1000, 5000)
+LIFECYCLE_WIDTH = 1000
+LIFECYCLE_TICKS = 100
+STARTUP_RUNS = 5
+STARTUP_BUDGET = 2.5
+
+
+def parse_args():
+    """
+    Reads the command line options for the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(description="Run the benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks")
+    run.add_argument("--output", default="benchmark_results.json")
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run.add_argument(
+        "--window",
+        action="store_true",
+        help="use a visible window and hardware GL instead of headless",
+    )
+
+    scaling = commands.add_parser(
+        "scaling", help="time generated levels with more and more enemies"
+    )
+    scaling.add_argument("--output", default="benchmark_scaling.json")
+    scaling.add_argument(
+        "--enemies", type=int, nargs="+", default=SCALING_ENEMY_COUNTS
+    )
+    scaling.add_argument("--width", type=int, default=SCALING_WIDTH)
+    scaling.add_argument("--height", type=int, default=SCALING_HEIGHT)
+    scaling.add_argument("--window", action="store_true")
+
+    chase = commands.add_parser(
+        "chase", help="time the enemy chase AI with many chasing enemies"
+    )
+    chase.add_argument("--output", default="benchmark_chase.json")
+    chase.add_argument(
+        "--enemies", type=int, nargs="+", default=CHASE_ENEMY_COUNTS
+    )
+    chase.add_argument("--window", action="store_true")
+
+    hitboxes = commands.add_parser(
+        "hitboxes", help="compare pixel and box hit boxes"
+    )
+    hitboxes.add_argument("--output", default="benchmark_hitboxes.json")
+    hitboxes.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    hitboxes.add_argument("--window", action="store_true")
+
+    soak = commands.add_parser(
+        "soak", help="check memory stays flat over many level changes"
+    )
+    soak.add_argument("--output", default="benchmark_soak.json")
+    soak.add_argument("--cycles", type=int, default=SOAK_CYCLES)
+    soak.add_argument("--window", action="store_true")
+
+    rewind = commands.add_parser(
+        "rewind", help="measure the memory and time used by rewinding"
+    )
+    rewind.add_argument("--output", default="benchmark_rewind.json")
+    rewind.add_argument(
+        "--enemies", type=int, nargs="+", default=REWIND_ENEMY_COUNTS
+    )
+    rewind.add_argument("--window", action="store_true")
+
+    streaming = commands.add_parser(
+        "streaming", help="compare loading wide levels with and without "
+        "tile streaming"
+    )
+    streaming.add_argument("--output", default="benchmark_streaming.json")
+    streaming.add_argument(
+        "--widths", type=int, nargs="+", default=STREAMING_WIDTHS
+    )
+    streaming.add_argument(
+        "--streaming-only",
+        action="store_true",
+        help="skip loading the levels without streaming",
+    )
+    streaming.add_argument("--window", action="store_true")
+
+    input_latency = commands.add_parser(
+        "input", help="measure the latency of key events in real time"
+    )
+    input_latency.add_argument("--output", default="benchmark_input.json")
+    input_latency.add_argument("--frames", type=int, default=INPUT_FRAMES)
+    input_latency.add_argument("--window", action="store_true")
+
+    animation = commands.add_parser(
+        "animation", help="compare animating characters on the GPU and CPU"
+    )
+    animation.add_argument("--output", default="benchmark_animation.json")
+    animation.add_argument(
+        "--enemies", type=int, nargs="+", default=ANIMATION_ENEMY_COUNTS
+    )
+    animation.add_argument("--window", action="store_true")
+
+    lifecycle = commands.add_parser(
+        "lifecycle", help="compare the tick of a cleared level with an "
+        "empty one"
+    )
+    lifecycle.add_argument("--output", default="benchmark_lifecycle.json")
+    lifecycle.add_argument(
+        "--enemies", type=int, nargs="+", default=LIFECYCLE_ENEMY_COUNTS
+    )
+    lifecycle.add_argument("--window", action="store_true")
+
+    startup = commands.add_parser(
+        "startup", help="time how long the game takes to show its first "
+        "frame"
+    )
+    startup.add_argument("--output", default="benchmark_startup.json")
+    startup.add_argument("--runs", type=int, default=STARTUP_RUNS)
+    startup.add_argument(
+        "--budget",
+        type=float,
+        default=STARTUP_BUDGET,
+        help="allowed seconds for the median run of the whole process",
+    )
+    startup.add_argument("--window", action="store_true")
+
+    compare = commands.add_parser(
+        "compare", help="flag regressions against a baseline"
+    )
+    compare.add_argument("baseline")
+    compare.add_argument("results")
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="allowed slowdown as a fraction of the baseline time",
+    )
+    return parser.parse_args()
+
+
+def measure(function, repeat):
+    """
+    Calls the function the given number of times and returns
+    the summary statistics of the wall time of each call.
+    A function can return its own timing to leave out set up work.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        elapsed = function()
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+        timings.append(elapsed)
+    return {
+        "min": min(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+        "repeat": repeat,
+    }
+
+
+def new_game_view(level):
+    """
+    Creates a game view on the given level and shows it.
+    """
+    import arcade
+    import main
+
+    game_view = main.GameView()
+    game_view.level = level
+    game_view.setup()
+    arcade.get_window().show_view(game_view)
+    return game_view
+
+
+def make_benchmarks():
+    """
+    Returns a list of (name, function) pairs for every benchmark.
+    """
+    import arcade
+    import main
+    import observation
+
+    window = arcade.get_window()
+    benchmarks = []
+
+    for level in LEVELS:
+        map_path = main.level_catalog.map_path(level)
+        game_view = new_game_view(level)
+
+        def setup(game_view=game_view):
+            game_view.setup()
+
+        def load_tilemap(map_path=map_path):
+            arcade.load_tilemap(map_path, main.TILE_SCALING)
+
+        def simulate(level=level):
+            # A fresh view is used so every run starts at the spawn.
+            game_view = new_game_view(level)
+            start = time.perf_counter()
+            for _ in range(SIMULATION_TICKS):
+                game_view.on_update(main.SIMULATION_TICK_RATE)
+            return time.perf_counter() - start
+
+        def draw(game_view=game_view):
+            window.show_view(game_view)
+            game_view.on_draw()
+            window.ctx.finish()
+
+        def observe(game_view=game_view):
+            grid = observation.ObservationGrid(game_view)
+            start = time.perf_counter()
+            for _ in range(OBSERVATIONS):
+                grid.update()
+                grid.window()
+            return time.perf_counter() - start
+
+        benchmarks += [
+            (f"setup_level{level}", setup),
+            (f"load_tilemap_level{level}", load_tilemap),
+            (f"simulate_{SIMULATION_TICKS}_ticks_level{level}", simulate),
+            (f"draw_level{level}", draw),
+            (f"observe_{OBSERVATIONS}_level{level}", observe),
+        ]
+
+    game_view = new_game_view(1)
+
+    def load_textures(game_view=game_view):
+        # Empties the texture and hit box caches first, so every run
+        # loads the images and reads the compiled hit boxes again,
+        # the same as the first game view of a session.
+        main.texture_pair_cache.clear()
+        arcade.texture.default_texture_cache.flush(hit_boxes=True)
+        main.hit_box_cache.flush()
+        main.hit_box_cache_state["loaded"] = False
+        start = time.perf_counter()
+        game_view.load_textures()
+        return time.perf_counter() - start
+
+    benchmarks.append(("load_textures", load_textures))
+
+    # Draws health bars for increasing numbers of enemies to
+    # show how the batched drawing scales.
+    for count in HEALTH_BAR_ENEMY_COUNTS:
+        enemies = [
+            main.EnemyCharacter(
+                x=i * 10,
+                y=0,
+                archetype=game_view.enemy_archetype(main.DEFAULT_ENEMY_TYPE),
+                left_boundary=0,
+                right_boundary=count * 10,
+            )
+            for i in range(count)
+        ]
+
+        render_queue = main.RenderQueue()
+
+        def draw_health_bars(enemies=enemies, render_queue=render_queue):
+            game_view.camera.use()
+            for enemy in enemies:
+                enemy.queue_health_bar(render_queue)
+            render_queue.draw()
+            window.ctx.finish()
+
+        benchmarks.append((f"draw_health_bar_{count}", draw_health_bars))
+
+    def restart():
+        # Restarts the level the same way the death screen does.
+        dead_view = new_game_view(1)
+        main.DeathScreen(dead_view).on_key_press(arcade.key.R, 0)
+
+    benchmarks.append(("restart_from_death_screen", restart))
+    return benchmarks
+
+
+def enemy_bytes(game_view):
+    """
+    Returns the Python memory each enemy of a game view takes. It
+    is measured by loading the enemies of the level once more
+    while tracing allocations, then putting the old ones back.
+    """
+    import arcade
+
+    enemy_list = game_view.enemy_list
+    game_view.enemy_list = arcade.SpriteList()
+    gc.collect()
+    tracemalloc.start()
+    game_view.load_enemies_from_map()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    count = len(game_view.enemy_list)
+    game_view.enemy_list = enemy_list
+    return size / count if count else 0.0
+
+
+def open_window(args):
+    """
+    Opens the window the benchmarks draw into. Unless a visible
+    window is asked for, it is headless and uses software GL.
+    """
+    if not args.window:
+        os.environ["ARCADE_HEADLESS"] = "1"
+        os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+
+    # The game loads its resources relative to its own folder.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    import arcade
+    import main
+
+    window = arcade.Window(
+        main.WINDOW_WIDTH, main.WINDOW_HEIGHT, main.WINDOW_TITLE,
+        visible=args.window,
+    )
+    window.input_recorder = None
+    return window
+
+
+def run(args):
+    """
+    Runs every benchmark and saves the results as JSON.
+    """
+    window = open_window(args)
+
+    import arcade
+
+    results = {}
+    for name, function in make_benchmarks():
+        results[name] = measure(function, args.repeat)
+        line = f"{name:40} {results[name]['min'] * 1000:10.2f} ms"
+        if name.startswith("observe_"):
+            rate = OBSERVATIONS / results[name]["min"]
+            results[name]["per_second"] = rate
+            line += f" ({rate:.0f} observations/s)"
+        if name.startswith("draw_level"):
+            # The render queue counts what the last frame drew.
+            stats = window.current_view.render_queue.stats
+            results[name].update(stats)
+            line += (
+                f" ({stats['draw_calls']} draw calls,"
+                f" {stats['texture_binds']} texture binds,"
+                f" {stats['vertices']} vertices)"
+            )
+        print(line)
+
+    report = {
+        "python": platform.python_version(),
+        "arcade": arcade.version.VERSION,
+        "platform": platform.platform(),
+        "gl_renderer": window.ctx.info.RENDERER,
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def scaling(args):
+    """
+    Generates stress levels with increasing numbers of enemies and
+    moving platforms, then times loading, a simulation tick and a
+    frame for each so they can be charted against entity count.
+    The memory each enemy takes is measured too.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for enemies in args.enemies:
+            map_path = os.path.join(folder, f"stress_{enemies}.tmx")
+            counts = level_generator.generate_level(
+                map_path,
+                width=args.width,
+                height=args.height,
+                enemies=enemies,
+                platforms=int(enemies * SCALING_PLATFORMS_PER_ENEMY),
+            )
+
+            game_view = main.GameView()
+            game_view.map_path = map_path
+            start = time.perf_counter()
+            game_view.setup()
+            load_time = time.perf_counter() - start
+            window.show_view(game_view)
+            bytes_per_enemy = enemy_bytes(game_view)
+
+            start = time.perf_counter()
+            for _ in range(SCALING_TICKS):
+                game_view.on_update(main.SIMULATION_TICK_RATE)
+            tick_time = (time.perf_counter() - start) / SCALING_TICKS
+
+            start = time.perf_counter()
+            game_view.on_draw()
+            window.ctx.finish()
+            frame_time = time.perf_counter() - start
+
+            row = dict(
+                counts,
+                load_time=load_time,
+                tick_time=tick_time,
+                frame_time=frame_time,
+                bytes_per_enemy=bytes_per_enemy,
+            )
+            rows.append(row)
+            print(
+                f"{enemies:8} enemies {counts['platforms']:7} platforms "
+                f"load {load_time:8.3f}s tick {tick_time * 1000:8.2f}ms "
+                f"frame {frame_time * 1000:8.2f}ms "
+                f"{bytes_per_enemy:7.0f}B/enemy"
+            )
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def chase(args):
+    """
+    Times the enemy chase AI on small generated levels where every
+    enemy can reach the player, with and without the navigation
+    flow field. The flow field refresh is timed separately, since
+    it only runs when the player moves to a different cell.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for enemies in args.enemies:
+            map_path = os.path.join(folder, f"chase_{enemies}.tmx")
+            level_generator.generate_level(
+                map_path,
+                width=CHASE_WIDTH,
+                height=CHASE_HEIGHT,
+                enemies=enemies,
+                platforms=0,
+                spikes=0,
+                step_height=1,
+            )
+            game_view = main.GameView()
+            game_view.map_path = map_path
+            game_view.setup()
+            window.show_view(game_view)
+            navigation = game_view.navigation
+            player = game_view.player_sprite
+
+            # Stands the player on the floor in the middle of the
+            # level, and lets every enemy chase across the level.
+            column = CHASE_WIDTH // 2
+            row = next(
+                row for row in range(navigation.height)
+                if navigation.is_walkable(column, row)
+            )
+            player.center_x = (column + 0.5) * navigation.cell_size
+            player.bottom = row * navigation.cell_size
+            for enemy in game_view.enemy_list:
+                enemy.left_boundary = 0
+                enemy.right_boundary = CHASE_WIDTH * navigation.cell_size
+
+            start = time.perf_counter()
+            for _ in range(CHASE_TICKS):
+                navigation.target = None
+                navigation.refresh(player)
+            refresh_time = (time.perf_counter() - start) / CHASE_TICKS
+            chasing = sum(
+                enemy.chase_direction(player.center_x - enemy.center_x)
+                is not None
+                for enemy in game_view.enemy_list
+            )
+
+            def tick_time():
+                start = time.perf_counter()
+                for _ in range(CHASE_TICKS):
+                    navigation.refresh(player)
+                    for enemy in game_view.enemy_list:
+                        enemy.update()
+                        enemy.detect_player(player)
+                        enemy.update_animation(main.SIMULATION_TICK_RATE)
+                return (time.perf_counter() - start) / CHASE_TICKS
+
+            navigated_time = tick_time()
+            for enemy in game_view.enemy_list:
+                enemy.navigation = None
+            direct_time = tick_time()
+
+            row = {
+                "enemies": enemies,
+                "chasing": chasing,
+                "refresh_time": refresh_time,
+                "tick_time": navigated_time,
+                "direct_tick_time": direct_time,
+            }
+            rows.append(row)
+            print(
+                f"{enemies:8} enemies {chasing:8} chasing "
+                f"refresh {refresh_time * 1000:8.3f}ms "
+                f"tick {navigated_time * 1000:8.2f}ms "
+                f"direct {direct_time * 1000:8.2f}ms"
+            )
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def hitboxes(args):
+    """
+    Compares the hit box modes. For each mode it times loading the
+    textures and maps while computing every hit box, loading them
+    from the compiled cache file, simulating each level and
+    checking the player against every wall and enemy.
+    """
+    window = open_window(args)
+
+    import arcade
+    import main
+
+    def flush(from_disk):
+        # Forgets every loaded texture and hit box, so the next load
+        # either reads the cache file or computes the hit boxes.
+        main.texture_pair_cache.clear()
+        arcade.texture.default_texture_cache.flush()
+        main.hit_box_cache.flush()
+        main.hit_box_cache_state["loaded"] = not from_disk
+
+    def new_view(mode, level):
+        window.hit_box_mode = mode
+        game_view = main.GameView()
+        game_view.level = level
+        game_view.setup()
+        window.show_view(game_view)
+        return game_view
+
+    results = {}
+    for mode in main.HIT_BOX_MODES:
+        for from_disk, name in ((False, "compute"), (True, "cached")):
+            def load(mode=mode, from_disk=from_disk):
+                flush(from_disk)
+                start = time.perf_counter()
+                for level in LEVELS:
+                    new_view(mode, level)
+                return time.perf_counter() - start
+
+            results[f"{mode}_load_{name}"] = measure(load, args.repeat)
+
+        for level in LEVELS:
+            def simulate(mode=mode, level=level):
+                game_view = new_view(mode, level)
+                start = time.perf_counter()
+                for _ in range(HIT_BOX_TICKS):
+                    game_view.fixed_update()
+                return time.perf_counter() - start
+
+            def collide(mode=mode, level=level):
+                game_view = new_view(mode, level)
+                player = game_view.player_sprite
+                sprite_lists = [game_view.wall_list, game_view.enemy_list]
+                # Sinks the player into the floor so that the checks
+                # get past the bounding box tests to the hit boxes.
+                player.center_y -= player.height / 4
+                start = time.perf_counter()
+                for _ in range(HIT_BOX_TICKS):
+                    arcade.check_for_collision_with_lists(
+                        player, sprite_lists
+                    )
+                return time.perf_counter() - start
+
+            results[f"{mode}_simulate_level{level}"] = measure(
+                simulate, args.repeat
+            )
+            results[f"{mode}_collide_level{level}"] = measure(
+                collide, args.repeat
+            )
+    window.hit_box_mode = main.HIT_BOX_MODE
+
+    for name, result in results.items():
+        print(f"{name:40} {result['min'] * 1000:10.2f} ms")
+    with open(args.output, "w") as file:
+        json.dump({"results": results}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def soak(args):
+    """
+    Plays through every level, restarts from the end screen, dies
+    and restarts from the death screen, over and over. Memory is
+    measured after each cycle, and the command fails if live
+    sprites or textures pile up or memory keeps growing.
+    """
+    window = open_window(args)
+
+    import arcade
+    import main
+    import memory_telemetry
+
+    memory_telemetry.start()
+
+    def draw_frame():
+        # Draws a frame like the game loop does. Flipping the frame
+        # also frees the OpenGL objects of released sprite lists.
+        window.current_view.on_draw()
+        window.flip()
+
+    def finish_level(game_view):
+        # Stands the player on the finish door for one tick.
+        finish = game_view.finish_list[0]
+        game_view.player_sprite.position = finish.position
+        game_view.fixed_update()
+        draw_frame()
+
+    def cycle():
+        game_view = new_game_view(1)
+        draw_frame()
+        for _ in range(len(main.level_catalog)):
+            finish_level(game_view)
+        end_screen = window.current_view
+        assert isinstance(end_screen, main.EndScreen), end_screen
+        end_screen.on_key_press(arcade.key.R, 0)
+
+        # Kills the player and waits for the death screen.
+        game_view = window.current_view
+        draw_frame()
+        game_view.player_sprite.current_health = 0
+        game_view.player_sprite.is_dead = True
+        while window.current_view is game_view:
+            game_view.fixed_update()
+        draw_frame()
+        window.current_view.on_key_press(arcade.key.R, 0)
+        draw_frame()
+
+    for _ in range(SOAK_WARMUP_CYCLES):
+        cycle()
+    first = memory_telemetry.snapshot()
+    rows = [first]
+    start = time.perf_counter()
+    for number in range(1, args.cycles + 1):
+        cycle()
+        if number % SOAK_REPORT_EVERY == 0 or number == args.cycles:
+            rows.append(memory_telemetry.snapshot())
+            growth = memory_telemetry.difference(first, rows[-1])
+            print(
+                f"cycle {number:5} "
+                + memory_telemetry.format_snapshot(growth, signed=True)
+            )
+    elapsed = time.perf_counter() - start
+
+    growth = memory_telemetry.difference(first, rows[-1])
+    failures = [
+        name
+        for name in (
+            "sprites", "sprite_lists", "textures", "gpu_textures"
+        )
+        if growth[name] > 0
+    ]
+    if growth["rss"] > SOAK_RSS_LIMIT:
+        failures.append("rss")
+    if growth.get("python_heap", 0) > SOAK_HEAP_LIMIT:
+        failures.append("python_heap")
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {"cycles": args.cycles, "time": elapsed, "results": rows},
+            file,
+            indent=2,
+        )
+    print(
+        f"{args.cycles} cycles in {elapsed:.1f}s, "
+        f"{'grew: ' + ', '.join(failures) if failures else 'flat'}"
+    )
+    print(f"Saved results to {args.output}")
+    return 1 if failures else 0
+
+
+def rewind(args):
+    """
+    Plays generated levels with more and more enemies for longer
+    than the rewind history holds, then rewinds the whole history.
+    It reports the memory allocated for the history, the memory
+    each second of history uses and the time taken to store a
+    tick and to step back one.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for enemies in args.enemies:
+            map_path = os.path.join(folder, f"rewind_{enemies}.tmx")
+            level_generator.generate_level(
+                map_path, width=REWIND_WIDTH, enemies=enemies, spikes=0
+            )
+            game_view = main.GameView()
+            game_view.map_path = map_path
+            game_view.setup()
+            window.show_view(game_view)
+            history = game_view.rewind
+
+            # Times storing the ticks apart from the rest of the tick.
+            capture_time = 0.0
+            for _ in range(REWIND_TICKS):
+                game_view.rewind = None
+                game_view.fixed_update()
+                game_view.rewind = history
+                start = time.perf_counter()
+                history.capture(game_view.tick)
+                capture_time += time.perf_counter() - start
+            seconds = history.seconds()
+            per_second = history.bytes_per_second()
+
+            game_view.rewind_pressed = True
+            steps = 0
+            start = time.perf_counter()
+            while history.count > 1:
+                game_view.fixed_update()
+                steps += 1
+            step_time = (time.perf_counter() - start) / steps
+
+            row = {
+                "enemies": enemies,
+                "record_values": history.record_size,
+                "memory_bytes": history.memory_bytes(),
+                "seconds": seconds,
+                "bytes_per_second": per_second,
+                "capture_time": capture_time / REWIND_TICKS,
+                "step_back_time": step_time,
+            }
+            rows.append(row)
+            print(
+                f"{enemies:8} enemies "
+                f"{row['memory_bytes'] / 1024 / 1024:6.2f}MB allocated "
+                f"{seconds:5.1f}s held "
+                f"{per_second / 1024:8.1f}KB/s "
+                f"capture {row['capture_time'] * 1000:6.3f}ms "
+                f"step back {step_time * 1000:6.3f}ms"
+            )
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def streaming(args):
+    """
+    Generates wider and wider levels and loads each of them with
+    the tile layers streamed in chunks and, unless skipped, built
+    whole. It reports the load time, the sprites and memory the
+    level holds once loaded and the time of a simulation tick, so
+    streamed levels can be checked to stay flat as they grow.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+    import memory_telemetry
+
+    modes = {"streaming": 0, "full": None}
+    if args.streaming_only:
+        del modes["full"]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for width in args.widths:
+            map_path = os.path.join(folder, f"wide_{width}.tmx")
+            level_generator.generate_level(map_path, width=width)
+            for mode, min_tiles in modes.items():
+                window.streaming_min_tiles = (
+                    min_tiles if min_tiles is not None
+                    else width * level_generator.DEFAULT_HEIGHT + 1
+                )
+
+                # The first load reads the tilesets and textures, the
+                # second is timed and the third measures the memory
+                # held, as tracing allocations slows loading down.
+                game_view = None
+                for load in ("warm", "time", "memory"):
+                    if game_view is not None:
+                        window.show_view(main.StartScreen())
+                        game_view.teardown()
+                    if load == "memory":
+                        memory_telemetry.start()
+                        before = memory_telemetry.snapshot()
+                    game_view = main.GameView()
+                    game_view.map_path = map_path
+                    start = time.perf_counter()
+                    game_view.setup()
+                    if load == "time":
+                        load_time = time.perf_counter() - start
+                    window.show_view(game_view)
+                after = memory_telemetry.snapshot()
+                tracemalloc.stop()
+
+                start = time.perf_counter()
+                for _ in range(STREAMING_TICKS):
+                    game_view.on_update(main.SIMULATION_TICK_RATE)
+                tick_time = time.perf_counter() - start
+                tick_time /= STREAMING_TICKS
+
+                growth = memory_telemetry.difference(before, after)
+                row = {
+                    "width": width,
+                    "mode": mode,
+                    "load_time": load_time,
+                    "tick_time": tick_time,
+                    "sprites": growth["sprites"],
+                    "python_heap": growth.get("python_heap"),
+                    "rss": growth["rss"],
+                }
+                rows.append(row)
+                print(
+                    f"{width:6} wide {mode:9} "
+                    f"load {load_time:7.3f}s "
+                    f"tick {tick_time * 1000:7.2f}ms "
+                    f"{row['sprites']:8} sprites "
+                    f"heap {(row['python_heap'] or 0) / 1024 / 1024:7.1f}MB"
+                )
+                window.show_view(main.StartScreen())
+                game_view.teardown()
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def input_latency(args):
+    """
+    Plays the first level in real time at the render rate, pressing
+    and releasing the movement keys at random moments within the
+    frames like a player would. It reports the histograms of the
+    time from each key event to the tick that simulated it and to
+    the frame that drew that tick.
+    """
+    window = open_window(args)
+
+    import arcade
+    import main
+
+    game_view = new_game_view(1)
+    queue = game_view.input_queue
+    queue.reset_counts()
+    rng = random.Random(INPUT_SEED)
+    keys = (arcade.key.LEFT, arcade.key.RIGHT, arcade.key.UP)
+    held = set()
+
+    last = time.perf_counter()
+    for _ in range(args.frames):
+        # Sends an event part way through the frame.
+        frame_start = time.perf_counter()
+        if rng.random() < INPUT_EVENTS_PER_FRAME:
+            time.sleep(rng.random() * main.RENDER_RATE)
+            key = rng.choice(keys)
+            if key in held:
+                held.discard(key)
+                game_view.on_key_release(key, 0)
+            else:
+                held.add(key)
+                game_view.on_key_press(key, 0)
+        remaining = main.RENDER_RATE - (time.perf_counter() - frame_start)
+        if remaining > 0:
+            time.sleep(remaining)
+
+        now = time.perf_counter()
+        game_view.on_update(now - last)
+        last = now
+        if window.current_view is not game_view:
+            break
+        game_view.on_draw()
+        window.flip()
+
+    histograms = queue.histograms()
+    labels = [f"<={bound}ms" for bound in histograms["buckets_ms"]]
+    labels.append(f">{histograms['buckets_ms'][-1]}ms")
+    print(f"{'latency':12}" + "".join(f"{label:>9}" for label in labels))
+    for name in ("simulation", "present"):
+        print(
+            f"{name:12}"
+            + "".join(f"{count:9}" for count in histograms[name])
+        )
+
+    with open(args.output, "w") as file:
+        json.dump({"frames": args.frames, "results": histograms}, file)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def animation(args):
+    """
+    Times the animation of generated levels with more and more
+    enemies, with the frames picked on the GPU and on the CPU.
+    Each tick steps the animation of every enemy and draws them
+    all, so the time spent uploading changed textures is counted.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        for enemies in args.enemies:
+            map_path = os.path.join(folder, f"animation_{enemies}.tmx")
+            level_generator.generate_level(
+                map_path,
+                width=ANIMATION_WIDTH,
+                enemies=enemies,
+                platforms=0,
+                spikes=0,
+            )
+            row = {"enemies": enemies}
+            for mode, gpu in (("gpu", True), ("cpu", False)):
+                window.gpu_animation = gpu
+                game_view = main.GameView()
+                game_view.map_path = map_path
+                game_view.setup()
+                window.show_view(game_view)
+                enemy_list = game_view.enemy_list
+
+                # Plays a few ticks first, so the first uploads and
+                # the first use of the shaders are not timed.
+                update_time = 0.0
+                draw_time = 0.0
+                for tick in range(ANIMATION_WARMUP_TICKS + ANIMATION_TICKS):
+                    if tick == ANIMATION_WARMUP_TICKS:
+                        update_time = 0.0
+                        draw_time = 0.0
+                    start = time.perf_counter()
+                    game_view.tick += 1
+                    game_view.set_animation_clock()
+                    for enemy in enemy_list:
+                        enemy.update_animation(main.SIMULATION_TICK_RATE)
+                    update_time += time.perf_counter() - start
+                    start = time.perf_counter()
+                    enemy_list.draw(pixelated=True)
+                    window.ctx.finish()
+                    draw_time += time.perf_counter() - start
+                row[f"{mode}_update_time"] = update_time / ANIMATION_TICKS
+                row[f"{mode}_draw_time"] = draw_time / ANIMATION_TICKS
+                game_view.teardown()
+            window.gpu_animation = True
+            rows.append(row)
+            print(
+                f"{enemies:8} enemies "
+                f"gpu update {row['gpu_update_time'] * 1000:7.3f}ms "
+                f"draw {row['gpu_draw_time'] * 1000:7.3f}ms "
+                f"cpu update {row['cpu_update_time'] * 1000:7.3f}ms "
+                f"draw {row['cpu_draw_time'] * 1000:7.3f}ms"
+            )
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def lifecycle(args):
+    """
+    Times a tick of generated levels with more and more enemies,
+    first while every enemy is alive and then once they have all
+    died and been baked into the corpse layer, against the same
+    level without any enemies. A cleared level should take about
+    as long as an empty one.
+    """
+    window = open_window(args)
+
+    import main
+    import level_generator
+
+    def new_view(map_path):
+        game_view = main.GameView()
+        game_view.map_path = map_path
+        game_view.setup()
+        window.show_view(game_view)
+        # Keeps the player alive while the enemies attack.
+        game_view.player_sprite.invulnerable_timer = float("inf")
+        return game_view
+
+    def tick_time(game_view):
+        start = time.perf_counter()
+        for _ in range(LIFECYCLE_TICKS):
+            game_view.fixed_update()
+        return (time.perf_counter() - start) / LIFECYCLE_TICKS
+
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        map_path = os.path.join(folder, "lifecycle_empty.tmx")
+        level_generator.generate_level(
+            map_path, width=LIFECYCLE_WIDTH, enemies=0, spikes=0
+        )
+        empty_time = tick_time(new_view(map_path))
+        print(f"{0:8} enemies empty {empty_time * 1000:8.3f}ms")
+
+        for enemies in args.enemies:
+            map_path = os.path.join(folder, f"lifecycle_{enemies}.tmx")
+            level_generator.generate_level(
+                map_path, width=LIFECYCLE_WIDTH, enemies=enemies, spikes=0
+            )
+            game_view = new_view(map_path)
+            enemy_lifecycle = game_view.enemy_lifecycle
+            alive_time = tick_time(game_view)
+
+            # Kills every enemy the way take_damage does, without
+            # playing the hit sound for each of them.
+            for enemy in enemy_lifecycle.living:
+                enemy.current_health = 0
+                enemy.is_dead = True
+                enemy.cur_texture = 0
+            game_view.fixed_update()
+            while enemy_lifecycle.dying or enemy_lifecycle.buried:
+                game_view.fixed_update()
+            cleared_time = tick_time(game_view)
+
+            row = {
+                "enemies": enemies,
+                "corpses": len(enemy_lifecycle.corpse_list),
+                "alive_tick_time": alive_time,
+                "cleared_tick_time": cleared_time,
+                "empty_tick_time": empty_time,
+            }
+            rows.append(row)
+            print(
+                f"{enemies:8} enemies "
+                f"alive {alive_time * 1000:8.3f}ms "
+                f"cleared {cleared_time * 1000:8.3f}ms "
+                f"({cleared_time / empty_time:.2f}x empty)"
+            )
+            game_view.teardown()
+
+    with open(args.output, "w") as file:
+        json.dump({"results": rows}, file, indent=2)
+    print(f"Saved results to {args.output}")
+    return 0
+
+
+def startup(args):
+    """
+    Starts the game in a new process a few times and reads back the
+    startup event it sends to the telemetry, so the imports, the
+    window and the start screen are timed from a cold start. The
+    telemetry starts its clock after the interpreter has started, so
+    the budget is checked against the wall time of the whole process
+    instead, and the command fails if the median run took longer.
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    environment = dict(os.environ)
+    if not args.window:
+        environment["ARCADE_HEADLESS"] = "1"
+        environment.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+
+    runs = []
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for run_index in range(args.runs):
+            telemetry_path = os.path.join(
+                temp_folder, f"startup_{run_index}.jsonl.gz"
+            )
+            start = time.perf_counter()
+            subprocess.run(
+                [
+                    sys.executable, "main.py",
+                    "--quit-after-startup",
+                    "--telemetry", telemetry_path,
+                ],
+                cwd=folder,
+                env=environment,
+                check=True,
+            )
+            wall_time = time.perf_counter() - start
+
+            with gzip.open(telemetry_path, "rt", encoding="utf-8") as file:
+                events = [json.loads(line) for line in file]
+            event = next(
+                event for event in events if event["event"] == "startup"
+            )
+            run = {
+                "first_frame": event["first_frame"],
+                "total": event["total"],
+                "wall_time": wall_time,
+                "phases": event["phases"],
+            }
+            runs.append(run)
+            print(
+                f"run {run_index + 1}: "
+                f"first frame {run['first_frame'] * 1000:8.1f}ms "
+                f"total {run['total'] * 1000:8.1f}ms "
+                f"process {wall_time * 1000:8.1f}ms"
+            )
+
+    # Reports the median time of each phase over all of the runs.
+    for name in runs[0]["phases"]:
+        seconds = statistics.median(run["phases"][name] for run in runs)
+        print(f"{name:24} {seconds * 1000:8.1f}ms")
+
+    first_frame = statistics.median(run["first_frame"] for run in runs)
+    wall_time = statistics.median(run["wall_time"] for run in runs)
+    over_budget = wall_time > args.budget
+    print(
+        f"Median first frame after {first_frame * 1000:.1f}ms, "
+        f"median process {wall_time * 1000:.1f}ms, "
+        f"budget {args.budget * 1000:.0f}ms"
+        + (" OVER BUDGET" if over_budget else "")
+    )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "budget": args.budget,
+                "first_frame": first_frame,
+                "wall_time": wall_time,
+                "results": runs,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Saved results to {args.output}")
+    return 1 if over_budget else 0
+
+
+def compare(args):
+    """
+    Compares a set of results against a baseline. Any benchmark
+    that got slower by more than the threshold is flagged as a
+    regression and makes the command exit with an error code.
+    """
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    with open(args.results) as file:
+        results = json.load(file)["results"]
+
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:40} {'new':>10}")
+            continue
+        change = result["min"] / baseline[name]["min"] - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        print(f"{name:40} {change:+10.1%} {flag}")
+
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    """
+    Main function of the benchmark suite.
+    """
+    args = parse_args()
+    if args.command == "run":
+        return run(args)
+    if args.command == "scaling":
+        return scaling(args)
+    if args.command == "chase":
+        return chase(args)
+    if args.command == "hitboxes":
+        return hitboxes(args)
+    if args.command == "soak":
+        return soak(args)
+    if args.command == "rewind":
+        return rewind(args)
+    if args.command == "streaming":
+        return streaming(args)
+    if args.command == "input":
+        return input_latency(args)
+    if args.command == "animation":
+        return animation(args)
+    if args.command == "lifecycle":
+        return lifecycle(args)
+    if args.command == "startup":
+        return startup(args)
+    return compare(args)
+
+
+# Runs the benchmark suite.
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Adventurer's Impact - Hit Box Compiler
+
+Computes the hit boxes of every sprite frame and every map tile in
+each hit box mode, and saves them to the hit box cache file. When
+the game loads a texture whose hit box is in the cache, it uses the
+cached points instead of scanning the pixels of the image again.
+
+The cache is keyed by a hash of each image, so it stays valid when
+files are renamed, and images that changed are simply computed
+again the next time they are loaded. Run it again after adding or
+editing sprites or maps to keep the cache complete.
+
+Usage:
+    python compile_hit_boxes.py [--output resources/hit_boxes.json.gz]
+"""
+
+# Importing the libraries that are used for the hit box compiler.
+import argparse
+import glob
+import os
+
+
+def parse_args():
+    """
+    Reads the command line options for the hit box compiler.
+    """
+    parser = argparse.ArgumentParser(description="Compile the hit boxes.")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+def main():
+    """
+    Main function of the hit box compiler.
+    """
+    args = parse_args()
+
+    # Tile maps need a GL context, so a hidden headless window is
+    # opened. The game loads its resources relative to its folder.
+    os.environ["ARCADE_HEADLESS"] = "1"
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    import arcade
+    import main
+
+    window = arcade.Window(
+        main.WINDOW_WIDTH, main.WINDOW_HEIGHT, main.WINDOW_TITLE,
+        visible=False,
+    )
+    output = args.output or main.HIT_BOX_CACHE_PATH
+    main.load_hit_box_cache(output)
+    cached = len(main.hit_box_cache)
+
+    sprites = sorted(glob.glob("resources/sprites/**/*.png", recursive=True))
+    maps = sorted(glob.glob("resources/maps/*.tmx"))
+    for mode in main.HIT_BOX_MODES:
+        for path in sprites:
+            main.load_texture_pair(path, mode)
+        for map_path in maps:
+            arcade.TileMap(
+                tiled_map=main.load_tiled_map(map_path),
+                scaling=main.TILE_SCALING,
+                hit_box_algorithm=main.hit_box_algorithms[mode],
+            )
+
+    main.save_hit_box_cache(output)
+    window.close()
+    print(
+        f"{len(sprites)} sprites and {len(maps)} maps in "
+        f"{len(main.HIT_BOX_MODES)} modes: "
+        f"{len(main.hit_box_cache)} hit boxes "
+        f"({len(main.hit_box_cache) - cached} new) in {output}"
+    )
+
+
+# Runs the hit box compiler.
+if __name__ == "__main__":
+    main()
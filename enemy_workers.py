@@ -0,0 +1,551 @@
+"""
+Adventurer's Impact - Multi-Process Enemy Simulation
+
+An optional mode for stress levels with tens of thousands of enemies,
+enabled with `python main.py --enemy-workers N`. The enemies are split
+by map region across worker processes. Their state lives in a
+shared memory array of doubles with one record per enemy.
+
+Every tick the main process writes the player's state, the
+visible area and the area the player's attack and spells can reach
+into the shared header, and the workers step their enemies between
+two barrier waits. The workers run the enemy rules by calling the
+EnemyCharacter methods on plain state records, so the rules are
+exactly the same as in the single process game.
+Only the damage dealt to the player and the records of enemies
+inside the visible area or the player's reach are read back by the
+main process, and only those enemies can be hit by the player.
+
+If a worker stops answering, the main process copies back every
+record and carries on simulating the enemies by itself.
+"""
+
+# Importing the libraries that are used for the enemy workers.
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import main
+
+# Constants for the shared memory layout
+HEADER_FIELDS = (
+    "player_x",
+    "player_y",
+    "player_bottom",
+    "invulnerable_timer",
+    "player_is_dead",
+    "view_left",
+    "view_right",
+    "view_bottom",
+    "view_top",
+    "reach_left",
+    "reach_right",
+    "reach_bottom",
+    "reach_top",
+    "running",
+)
+ENEMY_FIELDS = (
+    "center_x",
+    "center_y",
+    "change_x",
+    "left_boundary",
+    "right_boundary",
+    "current_health",
+    "is_attacking",
+    "is_taking_damage",
+    "is_dead",
+    "has_dealt_damage",
+    "cur_texture",
+    "direction",
+    "takedamage_frame",
+    "attack_cooldown",
+    "ground_column",
+    "ground_row",
+    "archetype",
+    "navigated",
+    "animation",
+    "frame",
+    "dirty",
+)
+HEADER = {name: index for index, name in enumerate(HEADER_FIELDS)}
+FIELD = {name: index for index, name in enumerate(ENEMY_FIELDS)}
+RECORD_SIZE = len(ENEMY_FIELDS)
+
+# Only these fields are copied back into the main process sprites.
+# The flags are stored as floats in shared memory and turned back
+# into booleans when they are copied.
+SYNCED_FIELDS = ENEMY_FIELDS[:-5]
+BOOLEAN_FIELDS = (
+    "is_attacking",
+    "is_taking_damage",
+    "is_dead",
+    "has_dealt_damage",
+)
+INTEGER_FIELDS = (
+    "current_health",
+    "cur_texture",
+    "direction",
+    "takedamage_frame",
+    "attack_cooldown",
+    "ground_column",
+    "ground_row",
+)
+
+# Constants for the worker output slots
+# Each slot has room for the index of every enemy of its region.
+MAX_DAMAGE_EVENTS = 16
+SLOT_HEADER_SIZE = 2 + MAX_DAMAGE_EVENTS
+SYNC_MARGIN = 200
+
+# Constants for the barrier timeouts, in seconds. The first tick
+# waits for the workers to start, which includes importing arcade.
+WORKER_START_TIMEOUT = 60.0
+WORKER_TIMEOUT = 5.0
+
+# Animation ids used in place of textures inside the workers.
+WALK = 0
+ATTACK = 1
+TAKEDAMAGE = 2
+DEATH = 3
+
+
+# The archetype of every enemy type, in the order of their ids,
+# holding (animation, frame, direction) tuples in place of textures
+# to tell the main process which texture to show.
+ARCHETYPES = [
+    main.EnemyArchetype(
+        name,
+        None,
+        [((WALK, i, 0), (WALK, i, 1)) for i in range(main.ENEMY_WALK_FRAMES)],
+        [
+            ((ATTACK, i, 0), (ATTACK, i, 1))
+            for i in range(main.ENEMY_ATTACK_FRAMES)
+        ],
+        [
+            ((TAKEDAMAGE, i, 0), (TAKEDAMAGE, i, 1))
+            for i in range(main.ENEMY_TAKEDAMAGE_FRAMES)
+        ],
+        [
+            ((DEATH, i, 0), (DEATH, i, 1))
+            for i in range(main.ENEMY_DEATH_FRAMES)
+        ],
+    )
+    for name in main.ENEMY_ARCHETYPES
+]
+
+
+class EnemyState:
+    """
+    This class is a plain record with the same attributes as
+    EnemyCharacter, so the EnemyCharacter methods can run on it.
+    Its archetype is one of ARCHETYPES, with the same tuning as
+    in the main process but no textures.
+    """
+    # The helpers the enemy rules call on themselves.
+    follow_ground = main.EnemyCharacter.follow_ground
+    chase_direction = main.EnemyCharacter.chase_direction
+    play_animation = main.EnemyCharacter.play_animation
+    is_corpse = main.EnemyCharacter.is_corpse
+
+    # Records have no animator, so the animations set their texture.
+    animator = None
+    playing_textures = None
+
+    def __init__(self, archetype=0):
+        """
+        Initializes the record of an enemy of the archetype with
+        the given id, showing its walking texture.
+        """
+        self.archetype = ARCHETYPES[archetype]
+        self.texture = self.archetype.walk_textures[0][0]
+        self.navigation = None
+
+
+class PlayerProxy:
+    """
+    This class stands in for the player inside a worker. It has
+    the attributes the enemy rules read, and records the damage
+    the enemies deal instead of applying it.
+    """
+    def __init__(self):
+        """
+        Initializes the proxy with an empty list of damage events.
+        """
+        self.center_x = 0.0
+        self.center_y = 0.0
+        self.bottom = 0.0
+        self.invulnerable_timer = 0
+        self.is_dead = False
+        self.damage_events = []
+
+    def take_damage(self, damage):
+        """
+        Records the damage and becomes invulnerable, the same
+        way the player does, so later enemies in the same tick
+        cannot deal damage either.
+        """
+        if self.is_dead or self.invulnerable_timer > 0:
+            return
+        self.damage_events.append(damage)
+        self.invulnerable_timer = main.INVULNERABILITY_FRAMES
+
+
+def load_record(state, values, start):
+    """
+    Copies an enemy record from shared memory into a state object.
+    """
+    for name in SYNCED_FIELDS:
+        setattr(state, name, values[start + FIELD[name]])
+    for name in BOOLEAN_FIELDS:
+        setattr(state, name, bool(getattr(state, name)))
+    for name in INTEGER_FIELDS:
+        setattr(state, name, int(getattr(state, name)))
+
+
+def store_record(state, values, start):
+    """
+    Copies a state object into its enemy record in shared memory.
+    """
+    for name in SYNCED_FIELDS:
+        values[start + FIELD[name]] = float(getattr(state, name))
+    animation, frame, _ = state.texture
+    values[start + FIELD["animation"]] = animation
+    values[start + FIELD["frame"]] = frame
+    values[start + FIELD["dirty"]] = 0.0
+
+
+def worker(memory_name, layout, first, count, barrier, grid):
+    """
+    Steps one region of enemies every time the main process
+    releases the barrier, until the running flag is cleared or the
+    main process breaks the barrier.
+    The grid holds the arguments of the level's NavigationGrid,
+    which every worker builds and refreshes for itself.
+    """
+    memory = shared_memory.SharedMemory(name=memory_name)
+    values = memory.buf.cast("d")
+    records_start, slot_start = layout
+    navigation = main.NavigationGrid(*grid)
+
+    states = []
+    for index in range(first, first + count):
+        start = records_start + index * RECORD_SIZE
+        state = EnemyState(int(values[start + FIELD["archetype"]]))
+        load_record(state, values, start)
+        if values[start + FIELD["navigated"]]:
+            state.navigation = navigation
+        states.append(state)
+    player = PlayerProxy()
+    synced_before = set()
+
+    while True:
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            break
+        if not values[HEADER["running"]]:
+            break
+
+        player.center_x = values[HEADER["player_x"]]
+        player.center_y = values[HEADER["player_y"]]
+        player.bottom = values[HEADER["player_bottom"]]
+        player.invulnerable_timer = values[HEADER["invulnerable_timer"]]
+        player.is_dead = bool(values[HEADER["player_is_dead"]])
+        player.damage_events = []
+        left = values[HEADER["view_left"]] - SYNC_MARGIN
+        right = values[HEADER["view_right"]] + SYNC_MARGIN
+        bottom = values[HEADER["view_bottom"]] - SYNC_MARGIN
+        top = values[HEADER["view_top"]] + SYNC_MARGIN
+        reach_left = values[HEADER["reach_left"]] - SYNC_MARGIN
+        reach_right = values[HEADER["reach_right"]] + SYNC_MARGIN
+        reach_bottom = values[HEADER["reach_bottom"]] - SYNC_MARGIN
+        reach_top = values[HEADER["reach_top"]] + SYNC_MARGIN
+
+        navigation.refresh(player)
+        synced = set()
+        for offset, state in enumerate(states):
+            start = records_start + (first + offset) * RECORD_SIZE
+
+            # Picks up changes the main process made, such as
+            # damage from the player's attacks.
+            if values[start + FIELD["dirty"]]:
+                load_record(state, values, start)
+
+            # The same calls, in the same order, as the enemy
+            # loop in GameView.fixed_update. Corpses never change,
+            # so they are not stepped.
+            if not state.is_corpse:
+                main.EnemyCharacter.update(state)
+                main.EnemyCharacter.detect_player(state, player)
+                main.EnemyCharacter.update_animation(
+                    state, main.SIMULATION_TICK_RATE
+                )
+                store_record(state, values, start)
+
+            # Enemies the player can see or hit are synced.
+            x = state.center_x
+            y = state.center_y
+            if (
+                left <= x <= right and bottom <= y <= top
+            ) or (
+                reach_left <= x <= reach_right
+                and reach_bottom <= y <= reach_top
+            ):
+                synced.add(first + offset)
+
+        # Enemies that just left the synced area are reported once
+        # more so their sprites are left outside of it.
+        reported = list(synced | synced_before)
+        synced_before = synced
+
+        events = player.damage_events[:MAX_DAMAGE_EVENTS]
+        values[slot_start] = len(events)
+        values[slot_start + 1] = len(reported)
+        for index, damage in enumerate(events):
+            values[slot_start + 2 + index] = damage
+        synced_start = slot_start + SLOT_HEADER_SIZE
+        for index, enemy_index in enumerate(reported):
+            values[synced_start + index] = enemy_index
+
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            break
+
+    del values
+    memory.close()
+
+
+class EnemyWorkerPool:
+    """
+    This class owns the shared enemy state and the worker
+    processes that step it, and keeps the enemy sprites of the
+    main process in sync with the part of it the player can see
+    or hit. The living enemies among those are kept in targets,
+    in the order of the enemy list, for the player's attacks.
+    """
+    def __init__(self, enemy_list, workers, navigation):
+        """
+        Splits the enemies into regions ordered by their x
+        position and starts one worker process per region.
+        """
+        ordered = sorted(
+            enumerate(enemy_list), key=lambda item: item[1].center_x
+        )
+        self.enemies = [enemy for _, enemy in ordered]
+        self.list_index = [index for index, _ in ordered]
+        count = len(self.enemies)
+        workers = max(1, min(workers, count))
+        regions = [
+            count // workers + (slot < count % workers)
+            for slot in range(workers)
+        ]
+
+        # Every slot has room for the whole region of its worker,
+        # so every enemy in reach can always be reported.
+        self.records_start = len(HEADER_FIELDS)
+        self.slot_starts = []
+        size = self.records_start + count * RECORD_SIZE
+        for region in regions:
+            self.slot_starts.append(size)
+            size += SLOT_HEADER_SIZE + region
+        self.memory = shared_memory.SharedMemory(create=True, size=size * 8)
+        self.values = self.memory.buf.cast("d")
+        self.values[HEADER["running"]] = 1.0
+        for index, enemy in enumerate(self.enemies):
+            state = EnemyState(enemy.archetype.index)
+            for name in SYNCED_FIELDS:
+                setattr(state, name, getattr(enemy, name))
+            start = self.records_start + index * RECORD_SIZE
+            store_record(state, self.values, start)
+            self.values[start + FIELD["archetype"]] = enemy.archetype.index
+            self.values[start + FIELD["navigated"]] = float(
+                enemy.navigation is not None
+            )
+
+        # Every sprite is up to date until the first tick.
+        self.synced = list(range(count))
+        self.targets = [enemy for enemy in enemy_list if not enemy.is_dead]
+        self.timeout = WORKER_START_TIMEOUT
+        self.abandoned = False
+
+        # Processes are spawned so they do not inherit the GL context.
+        context = multiprocessing.get_context("spawn")
+        self.barrier = context.Barrier(workers + 1)
+        self.processes = []
+        grid = (
+            navigation.width,
+            navigation.height,
+            navigation.cell_size,
+            navigation.solid,
+            navigation.chase_radius,
+        )
+        first = 0
+        for region, slot_start in zip(regions, self.slot_starts):
+            process = context.Process(
+                target=worker,
+                args=(
+                    self.memory.name,
+                    (self.records_start, slot_start),
+                    first,
+                    region,
+                    self.barrier,
+                    grid,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+            first += region
+
+    def write_back(self):
+        """
+        Writes the sprites that were synced last tick back into
+        shared memory, so any damage the player dealt to them is
+        picked up by the workers.
+        """
+        for index in self.synced:
+            enemy = self.enemies[index]
+            start = self.records_start + index * RECORD_SIZE
+            for name in SYNCED_FIELDS:
+                self.values[start + FIELD[name]] = float(getattr(enemy, name))
+            self.values[start + FIELD["dirty"]] = 1.0
+
+    def step(self, player_sprite, view, reach):
+        """
+        Runs one tick of every enemy in the workers. The damage
+        the enemies dealt is applied to the player, and the
+        sprites of the enemies in view or in reach are updated
+        from their records. The view is the (left, right, bottom,
+        top) visible area, and the reach is the area the player's
+        attack and spells can hit enemies in.
+
+        Returns whether the enemies were stepped. If a worker stops
+        answering, the pool is abandoned, and the enemies that were
+        not stepped have to be stepped by the main process.
+        """
+        self.write_back()
+
+        values = self.values
+        values[HEADER["player_x"]] = player_sprite.center_x
+        values[HEADER["player_y"]] = player_sprite.center_y
+        values[HEADER["player_bottom"]] = player_sprite.bottom
+        values[HEADER["invulnerable_timer"]] = (
+            player_sprite.invulnerable_timer
+        )
+        values[HEADER["player_is_dead"]] = float(player_sprite.is_dead)
+        for name, value in zip(
+            ("view_left", "view_right", "view_bottom", "view_top"), view
+        ):
+            values[HEADER[name]] = value
+        for name, value in zip(
+            ("reach_left", "reach_right", "reach_bottom", "reach_top"), reach
+        ):
+            values[HEADER[name]] = value
+
+        # The workers only start once every one of them is waiting,
+        # so if the first wait fails none of them stepped.
+        if not self.wait():
+            return False
+        if not self.wait():
+            return True
+        self.timeout = WORKER_TIMEOUT
+
+        self.synced = []
+        for slot_start in self.slot_starts:
+            for index in range(int(values[slot_start])):
+                player_sprite.take_damage(
+                    int(values[slot_start + 2 + index])
+                )
+            synced_start = slot_start + SLOT_HEADER_SIZE
+            for index in range(int(values[slot_start + 1])):
+                self.synced.append(int(values[synced_start + index]))
+
+        for index in self.synced:
+            self.sync_sprite(index)
+
+        # The targets are updated in place, as the player holds them.
+        list_index = self.list_index
+        self.targets[:] = [
+            self.enemies[index]
+            for index in sorted(self.synced, key=list_index.__getitem__)
+            if not self.enemies[index].is_dead
+        ]
+        return True
+
+    def wait(self):
+        """
+        Waits for every worker at the barrier. If one does not get
+        there in time, the pool is abandoned and False is returned.
+        """
+        try:
+            self.barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.abandon()
+            return False
+        return True
+
+    def sync_sprite(self, index):
+        """
+        Copies an enemy record into its sprite in the main process.
+        """
+        enemy = self.enemies[index]
+        start = self.records_start + index * RECORD_SIZE
+        values = self.values
+        for name in SYNCED_FIELDS:
+            setattr(enemy, name, values[start + FIELD[name]])
+        for name in BOOLEAN_FIELDS:
+            setattr(enemy, name, bool(getattr(enemy, name)))
+        for name in INTEGER_FIELDS:
+            setattr(enemy, name, int(getattr(enemy, name)))
+
+        archetype = enemy.archetype
+        textures = (
+            archetype.walk_textures,
+            archetype.attack_textures,
+            archetype.takedamage_textures,
+            archetype.death_textures,
+        )[int(values[start + FIELD["animation"]])]
+        enemy.show_frame(
+            textures, enemy.direction, int(values[start + FIELD["frame"]])
+        )
+
+    def close(self):
+        """
+        Copies every record back into its sprite, so the enemies
+        can carry on in the main process, then stops the worker
+        processes and frees the shared memory.
+        """
+        for index in range(len(self.enemies)):
+            self.sync_sprite(index)
+        self.values[HEADER["running"]] = 0.0
+        if self.wait():
+            for process in self.processes:
+                process.join()
+            self.free()
+
+    def abandon(self):
+        """
+        Gives up on the workers after one of them stopped answering.
+        Every record is copied back into its sprite as it is, the
+        workers that are still running are stopped, and the shared
+        memory is freed.
+        """
+        self.abandoned = True
+        self.barrier.abort()
+        for index in range(len(self.enemies)):
+            self.sync_sprite(index)
+        for process in self.processes:
+            process.join(WORKER_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.free()
+
+    def free(self):
+        """
+        Frees the shared memory of the pool.
+        """
+        self.values.release()
+        self.memory.close()
+        self.memory.unlink()
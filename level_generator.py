@@ -0,0 +1,411 @@
+"""
+Adventurer's Impact - Stress Level Generator
+
+Writes synthetic TMX levels in the same schema as the shipped maps,
+so scaling problems can be measured with far more enemies and
+moving platforms than the hand made levels contain.
+The tilesets, tile ids and background images are taken from one
+of the shipped levels, which is used as a template.
+
+The generated level has a flat floor with raised steps, spikes,
+a kill boundary along the bottom, a finish door at the far right,
+mushroom enemies and moving platforms, and can be loaded through
+GameView.setup() by setting GameView.map_path.
+
+Usage:
+    python level_generator.py stress.tmx --width 1000 --height 200
+        --enemies 5000 --platforms 500
+"""
+
+# Importing the libraries that are used for the level generator.
+import argparse
+import collections
+import os
+import random
+import xml.etree.ElementTree as ET
+
+# Constants for the level generator
+TEMPLATE_LEVEL = "resources/maps/level3.tmx"
+DEFAULT_WIDTH = 200
+DEFAULT_HEIGHT = 100
+DEFAULT_ENEMIES = 100
+DEFAULT_PLATFORMS = 20
+DEFAULT_SPIKES = 20
+DEFAULT_SEED = 0
+FLOOR_DEPTH = 3
+STEP_SPACING = 12
+STEP_HEIGHT = 2
+SPAWN_CLEARANCE = 10
+ENEMY_PATROL_TILES = 4
+PLATFORM_TILES = 4
+PLATFORM_HEIGHT_TILES = 5
+PLATFORM_TRAVEL_TILES = 6
+
+# Constants copied from main.py so the level lines up with the
+# player spawn point without importing arcade.
+TILE_SCALING = 2.5
+PLAYER_SPAWN_Y = 4800
+
+
+def parse_args():
+    """
+    Reads the command line options for the level generator.
+    """
+    parser = argparse.ArgumentParser(description="Generate a stress level.")
+    parser.add_argument("output", help="path of the .tmx file to write")
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH)
+    parser.add_argument("--height", type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument("--enemies", type=int, default=DEFAULT_ENEMIES)
+    parser.add_argument("--platforms", type=int, default=DEFAULT_PLATFORMS)
+    parser.add_argument("--spikes", type=int, default=DEFAULT_SPIKES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    if args.height < minimum_height():
+        parser.error(f"--height must be at least {minimum_height()}")
+    return args
+
+
+def minimum_height(step_height=STEP_HEIGHT):
+    """
+    Returns the lowest level height that fits the floor, a raised
+    step above it and the kill boundary below it.
+    """
+    return FLOOR_DEPTH + step_height + 2
+
+
+def read_layer(root, name):
+    """
+    Returns the tile ids of a CSV tile layer as a list of rows.
+    """
+    for layer in root.findall("layer"):
+        if layer.get("name") == name:
+            width = int(layer.get("width"))
+            cells = [
+                int(cell) for cell in layer.find("data").text.split(",")
+            ]
+            return [
+                cells[row:row + width] for row in range(0, len(cells), width)
+            ]
+    return []
+
+
+def most_common(values):
+    """
+    Returns the most common value that is not an empty tile.
+    """
+    counter = collections.Counter(value for value in values if value)
+    return counter.most_common(1)[0][0]
+
+
+def template_gids(root):
+    """
+    Picks the tile ids used for each kind of tile from the template,
+    so that the generated level looks like the shipped levels.
+    """
+    ground = read_layer(root, "Ground")
+    surface = [
+        row[x]
+        for above, row in zip(ground, ground[1:])
+        for x in range(len(row))
+        if row[x] and not above[x]
+    ]
+    objects = {
+        group.get("name"): group for group in root.findall("objectgroup")
+    }
+    return {
+        "fill": most_common(cell for row in ground for cell in row),
+        "surface": most_common(surface),
+        "spike": most_common(
+            cell for row in read_layer(root, "Spikes") for cell in row
+        ),
+        "boundary": most_common(
+            cell for row in read_layer(root, "Boundaries") for cell in row
+        ),
+        "filler": most_common(
+            cell
+            for row in read_layer(root, "Background_Filler")
+            for cell in row
+        ),
+        "finish": object_tile(objects["Finish"][0]),
+        "decoration": object_tile(objects["Decorations"][0]),
+        "background": {
+            name: object_tile(objects[name][0])
+            for name in ("Background", "Midground", "Foreground")
+        },
+    }
+
+
+def relocate_sources(root, template_dir, output_dir):
+    """
+    Rewrites the relative image and tileset paths of the template
+    so that they still resolve from the folder of the new level.
+    """
+    for element in root.iter():
+        source = element.get("source")
+        if source:
+            absolute = os.path.normpath(os.path.join(template_dir, source))
+            element.set(
+                "source",
+                os.path.relpath(absolute, output_dir).replace(os.sep, "/"),
+            )
+
+
+def add_tile_layer(root, layer_id, name, grid):
+    """
+    Adds a CSV encoded tile layer to the map.
+    """
+    layer = ET.SubElement(
+        root,
+        "layer",
+        id=str(layer_id),
+        name=name,
+        width=str(len(grid[0])),
+        height=str(len(grid)),
+    )
+    data = ET.SubElement(layer, "data", encoding="csv")
+    data.text = "\n" + ",\n".join(
+        ",".join(str(cell) for cell in row) for row in grid
+    ) + "\n"
+
+
+def add_object(group, object_id, x, y, tile=None, properties=None):
+    """
+    Adds an object to an object group. A tile object is added when
+    a (gid, width, height) tuple is given, otherwise a point is added.
+    Properties are written as float properties like in Tiled.
+    """
+    obj = ET.SubElement(group, "object", id=str(object_id))
+    if tile is not None:
+        gid, width, height = tile
+        obj.set("gid", str(gid))
+        obj.set("width", str(width))
+        obj.set("height", str(height))
+    obj.set("x", str(x))
+    obj.set("y", str(y))
+    if properties:
+        props = ET.SubElement(obj, "properties")
+        for name, value in properties.items():
+            ET.SubElement(
+                props, "property", name=name, type="float", value=str(value)
+            )
+    if tile is None:
+        ET.SubElement(obj, "point")
+    return obj
+
+
+def object_tile(template_object):
+    """
+    Returns the (gid, width, height) tuple of a tile object.
+    """
+    return (
+        template_object.get("gid"),
+        template_object.get("width"),
+        template_object.get("height"),
+    )
+
+
+def generate_level(
+    path,
+    width=DEFAULT_WIDTH,
+    height=DEFAULT_HEIGHT,
+    enemies=DEFAULT_ENEMIES,
+    platforms=DEFAULT_PLATFORMS,
+    spikes=DEFAULT_SPIKES,
+    seed=DEFAULT_SEED,
+    template=TEMPLATE_LEVEL,
+    step_height=STEP_HEIGHT,
+):
+    """
+    Generates a stress level and writes it to the given path.
+    Returns a dictionary with the number of each kind of entity.
+    Enemies can walk up steps one tile high but not higher ones.
+    Raises a ValueError if the level is not high enough to fit
+    the floor and its steps.
+    """
+    if height < minimum_height(step_height):
+        raise ValueError(
+            f"A level with steps {step_height} tiles high must be at "
+            f"least {minimum_height(step_height)} tiles high"
+        )
+    rng = random.Random(seed)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    template_path = os.path.join(base_dir, template)
+    template_root = ET.parse(template_path).getroot()
+    gids = template_gids(template_root)
+    tile_size = int(template_root.get("tilewidth"))
+    world_tile = tile_size * TILE_SCALING
+
+    # Places the floor so that its surface is just below the
+    # player's spawn point, leaving room above it for the steps.
+    floor_row = height - int(PLAYER_SPAWN_Y / world_tile)
+    floor_row = max(
+        step_height + 1, min(floor_row, height - FLOOR_DEPTH - 1)
+    )
+
+    # The map keeps the template's tilesets so the tile ids match.
+    root = ET.Element("map", template_root.attrib)
+    root.set("width", str(width))
+    root.set("height", str(height))
+    root.set("infinite", "0")
+    for tileset in template_root.findall("tileset"):
+        root.append(tileset)
+    relocate_sources(
+        root,
+        os.path.dirname(template_path),
+        os.path.dirname(os.path.abspath(path)),
+    )
+
+    empty = [[0] * width for _ in range(height)]
+    ground = [row[:] for row in empty]
+    spike_grid = [row[:] for row in empty]
+    boundaries = [row[:] for row in empty]
+    filler = [row[:] for row in empty]
+
+    # The floor is built column by column, with a raised step
+    # every few columns so the terrain is not completely flat.
+    surface_rows = []
+    for x in range(width):
+        top = floor_row
+        if x > SPAWN_CLEARANCE and (x // STEP_SPACING) % 2:
+            top -= step_height
+        surface_rows.append(top)
+        ground[top][x] = gids["surface"]
+        for y in range(top + 1, min(floor_row + FLOOR_DEPTH, height - 1)):
+            ground[y][x] = gids["fill"]
+        filler[min(floor_row + FLOOR_DEPTH, height - 2)][x] = gids["filler"]
+
+    # A boundary along the bottom kills the player if they fall.
+    boundaries[height - 1] = [gids["boundary"]] * width
+
+    # Spikes are placed on top of the floor away from the spawn.
+    spike_columns = range(SPAWN_CLEARANCE, width - SPAWN_CLEARANCE)
+    for x in rng.sample(spike_columns, min(spikes, len(spike_columns))):
+        spike_grid[surface_rows[x] - 1][x] = gids["spike"]
+
+    object_id = 1
+    layer_id = 1
+
+    def new_group(name):
+        nonlocal layer_id
+        layer_id += 1
+        return ET.SubElement(
+            root, "objectgroup", id=str(layer_id), name=name
+        )
+
+    # Tiles the background images across the width of the level.
+    for name, tile in gids["background"].items():
+        group = new_group(name)
+        image_width = float(tile[1])
+        x = 0.0
+        while x < width * tile_size:
+            add_object(group, object_id, x, floor_row * tile_size, tile)
+            object_id += 1
+            x += image_width
+
+    layer_id += 1
+    add_tile_layer(root, layer_id, "Background_Filler", filler)
+    layer_id += 1
+    add_tile_layer(root, layer_id, "Ground", ground)
+    layer_id += 1
+    add_tile_layer(root, layer_id, "Spikes", spike_grid)
+
+    group = new_group("Decorations")
+    add_object(
+        group, object_id, tile_size, surface_rows[1] * tile_size,
+        gids["decoration"],
+    )
+    object_id += 1
+
+    # Enemies stand on the floor and patrol a few tiles either side.
+    group = new_group("Mushroom_Enemies")
+    patrol = ENEMY_PATROL_TILES * world_tile
+    for _ in range(enemies):
+        x = rng.randrange(SPAWN_CLEARANCE, width - 1)
+        world_x = (x + 0.5) * world_tile
+        add_object(
+            group,
+            object_id,
+            (x + 0.5) * tile_size,
+            surface_rows[x] * tile_size,
+            properties={
+                "left_boundary": world_x - patrol,
+                "right_boundary": world_x + patrol,
+            },
+        )
+        object_id += 1
+
+    group = new_group("Finish")
+    add_object(
+        group,
+        object_id,
+        (width - 3) * tile_size,
+        surface_rows[width - 3] * tile_size,
+        gids["finish"],
+    )
+    object_id += 1
+
+    layer_id += 1
+    add_tile_layer(root, layer_id, "Boundaries", boundaries)
+
+    # Moving platforms are rows of ground tiles floating above the
+    # floor that move back and forth between their boundaries.
+    group = new_group("Moving_Platforms")
+    travel = PLATFORM_TRAVEL_TILES * world_tile
+    platform_tile = (gids["surface"], tile_size, tile_size)
+    for _ in range(platforms):
+        x = rng.randrange(SPAWN_CLEARANCE, width - PLATFORM_TILES - 1)
+        y = max(1, surface_rows[x] - PLATFORM_HEIGHT_TILES)
+        change_x = rng.choice((-1, 1))
+        for tile in range(PLATFORM_TILES):
+            # Each tile keeps its own edges between its boundaries,
+            # so the tiles of a platform move together.
+            world_x = (x + tile) * world_tile
+            add_object(
+                group,
+                object_id,
+                (x + tile) * tile_size,
+                (y + 1) * tile_size,
+                platform_tile,
+                properties={
+                    "change_x": change_x,
+                    "boundary_left": world_x - travel,
+                    "boundary_right": world_x + world_tile + travel,
+                },
+            )
+            object_id += 1
+
+    root.set("nextlayerid", str(layer_id + 1))
+    root.set("nextobjectid", str(object_id))
+
+    ET.indent(root, space=" ")
+    ET.ElementTree(root).write(path, encoding="UTF-8", xml_declaration=True)
+
+    return {
+        "width": width,
+        "height": height,
+        "enemies": enemies,
+        "platforms": platforms * PLATFORM_TILES,
+        "spikes": min(spikes, len(spike_columns)),
+    }
+
+
+def main():
+    """
+    Main function of the level generator.
+    """
+    args = parse_args()
+    counts = generate_level(
+        args.output,
+        width=args.width,
+        height=args.height,
+        enemies=args.enemies,
+        platforms=args.platforms,
+        spikes=args.spikes,
+        seed=args.seed,
+    )
+    print(f"Wrote {args.output}: {counts}")
+
+
+# Runs the level generator.
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,36 @@ This game features:
 """
 
 # Importing the libraries that are used for this game.
+# The clock is read before anything else is imported, so the
+# startup trace can tell how long the imports took. The interpreter's
+# own start-up happens before this line and is not in the trace, so
+# benchmark.py startup judges the wall time of the whole process.
+import time
+
+STARTUP_START = time.perf_counter()
+
+import argparse
+import array
+import base64
+import bisect
+import collections
+import copy
+import gzip
+import hashlib
+import io
+import json
+import operator
+import random
+import threading
 import arcade
+import arcade.gl as gl
 import os
+import pyglet
+import pytiled_parser
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from PIL import Image, ImageDraw
 
 # Constants
 TILE_SCALING = 2.5
@@ -34,7 +62,6 @@ PLAYER_SPAWN_X = 196
 PLAYER_SPAWN_Y = 4800
 RIGHT_FACING = 0
 LEFT_FACING = 1
-FINAL_LEVEL = 3
 
 PLAYER_ATTACK_RANGE = 80
 PLAYER_ATTACK_HEIGHT = 40
@@ -65,6 +92,41 @@ ENEMY_ATTACK_RANGE_X = 50
 ENEMY_ATTACK_RANGE_Y = 50
 ENEMY_DETECTION_RANGE_X = 50
 ENEMY_DETECTION_RANGE_Y = 40
+ENEMY_PATROL_SPEED = 1
+
+# Constants for the enemy archetypes
+# The tuning of every type of enemy, and the folder its textures are
+# loaded from. An object of the Mushroom_Enemies layer picks its type
+# with a "type" property, and is of DEFAULT_ENEMY_TYPE without one.
+DEFAULT_ENEMY_TYPE = "mushroom"
+ENEMY_ARCHETYPES = {
+    "mushroom": {
+        "textures": "mushroom",
+        "health": MUSHROOM_ENEMY_HEALTH,
+        "damage": MUSHROOM_ENEMY_DAMAGE,
+        "patrol_speed": ENEMY_PATROL_SPEED,
+        "chase_speed": ENEMY_CHASE_SPEED,
+        "attack_cooldown": ENEMY_ATTACK_COOLDOWN,
+        "attack_range": (ENEMY_ATTACK_RANGE_X, ENEMY_ATTACK_RANGE_Y),
+        "detection_range": (
+            ENEMY_DETECTION_RANGE_X, ENEMY_DETECTION_RANGE_Y
+        ),
+        "color": (255, 255, 255),
+    },
+    "toadstool": {
+        "textures": "mushroom",
+        "health": 6,
+        "damage": 2,
+        "patrol_speed": ENEMY_PATROL_SPEED,
+        "chase_speed": 2,
+        "attack_cooldown": 90,
+        "attack_range": (ENEMY_ATTACK_RANGE_X, ENEMY_ATTACK_RANGE_Y),
+        "detection_range": (
+            ENEMY_DETECTION_RANGE_X, ENEMY_DETECTION_RANGE_Y
+        ),
+        "color": (255, 150, 150),
+    },
+}
 
 # Constants for player invulnerability
 INVULNERABILITY_FRAMES = 60
@@ -77,11 +139,20 @@ PLAYER_IDLE_FRAMES = 6
 PLAYER_ATTACK_FRAMES = 6
 PLAYER_TAKEDAMAGE_FRAMES = 4
 PLAYER_DEATH_FRAMES = 12
+PLAYER_MAGICSPELL_FRAMES = 11
 ENEMY_WALK_FRAMES = 4
 ENEMY_ATTACK_FRAMES = 8
 ENEMY_DEATH_FRAMES = 4
 ENEMY_TAKEDAMAGE_FRAMES = 4
 ENEMY_ATTACKING_FRAME = 6
+# The characters are drawn by sprite lists that pick the frames of
+# their animations on the GPU, from a table of the atlas slots of
+# every frame. The table is a texture ANIMATION_TABLE_WIDTH wide.
+ANIMATED_SPRITE_SHADER = "resources/shaders/animated_sprite_vs.glsl"
+ANIMATION_TABLE_WIDTH = 256
+# Those sprite lists extend the internals of arcade's SpriteList,
+# which can change in any release, so they only run on this one.
+ANIMATED_SPRITE_ARCADE_VERSION = "3.3.3"
 
 # Constants for UI
 TITLE_FONT_SIZE = 80
@@ -90,58 +161,3113 @@ INSTRUCTION_FONT_SIZE = 18
 GAME_OVER_FONT_SIZE = 72
 END_SCREEN_TITLE_SIZE = 54
 END_SCREEN_OPTION_SIZE = 36
+# The window runs at this rate while it is unfocused or minimized,
+# and while nothing on the start, death and end screens moves.
+# While the game is played only its frames are slowed down.
+MENU_IDLE_RATE = 1 / 4
 
 # Constant for camera
 CAMERA_BOUNDS_PADDING = 2.0
 
+# Constants for the fixed timestep loop
+# The simulation always advances in ticks of SIMULATION_TICK_RATE
+# seconds, while the window is free to draw at RENDER_RATE.
+SIMULATION_TICK_RATE = 1 / 60
+MAX_CATCHUP_TICKS = 5
+RENDER_RATE = 1 / 120
+
+# Constants for frame pacing
+# The frame pacer sleeps until PACING_SPIN_TIME before an update or
+# frame is due and spins for the rest, since sleeping is not that
+# precise. A frame starting more than PACING_MISS_TOLERANCE after it
+# was due has missed its deadline. Missed deadlines and the jitter
+# of frame times are reported every PACING_REPORT_INTERVAL seconds.
+PACING_SPIN_TIME = 0.002
+PACING_MISS_TOLERANCE = 0.001
+PACING_REPORT_INTERVAL = 10.0
+
+# Constants for the input pipeline
+# Key events are queued with the time they arrived and applied at
+# the start of the next simulation tick. A jump pressed up to
+# JUMP_BUFFER_TICKS before landing still happens on landing, and a
+# jump pressed up to COYOTE_TICKS after walking off a ledge still
+# happens. Input latencies are counted in buckets with these upper
+# bounds in milliseconds, plus one bucket for longer latencies.
+JUMP_BUFFER_TICKS = 6
+COYOTE_TICKS = 6
+INPUT_LATENCY_BUCKETS = (1, 2, 4, 8, 12, 17, 25, 34, 50)
+
+# Constants for input recording and replay
+RECORDING_SEED = 0
+RECORDING_HASH_INTERVAL = 60
+
+# Constants for session telemetry
+# Events are queued by the game and written to disk by a background
+# thread, so the game never waits for the disk. Events arriving while
+# the queue is full are dropped and counted. Frame times are counted
+# in buckets with these upper bounds in milliseconds, plus one bucket
+# for longer frames, and written every TELEMETRY_HISTOGRAM_INTERVAL.
+TELEMETRY_QUEUE_SIZE = 4096
+TELEMETRY_FLUSH_INTERVAL = 0.25
+TELEMETRY_HISTOGRAM_INTERVAL = 10.0
+FRAME_TIME_BUCKETS = (4, 8, 12, 17, 20, 25, 34, 50, 100)
+
+# Constants for the multi-process enemy mode. Levels with fewer
+# enemies than this are always simulated in the main process.
+ENEMY_WORKER_MIN_ENEMIES = 500
+
+# Constants for the enemy lifecycle
+# Enemies whose death animation has finished are baked into the
+# corpse layer at once, and up to CORPSE_REMOVALS_PER_TICK of them
+# are taken out of the enemy list every tick.
+CORPSE_REMOVALS_PER_TICK = 16
+
+# Constants for enemy navigation
+# The flow field only reaches this many cells from the player, so
+# refreshing it costs the same on a small level and a huge one.
+NAVIGATION_CHASE_RADIUS = 24
+MOVE_NONE = 0
+MOVE_HERE = 1
+MOVE_LEFT = 2
+MOVE_RIGHT = 3
+
+# Constants for the magic spell
+# The spell leaves the player's hand on PLAYER_SPELL_FRAME of the
+# cast animation, and flies for SPELL_LIFETIME ticks.
+PLAYER_SPELL_FRAME = 4
+SPELL_POOL_SIZE = 512
+SPELL_SPEED = 12
+SPELL_DAMAGE = 1
+SPELL_LIFETIME = 60
+SPELL_RADIUS = 12
+SPELL_COLOR = arcade.color.LIGHT_YELLOW
+SPELL_BROAD_PHASE_CELL = 128
+
+# Constants for moving platforms
+# Platforms within PLATFORM_COLLISION_RANGE of the player are given
+# to the physics engine, and platforms within PLATFORM_SYNC_RANGE of
+# the player or inside the camera view have their sprites moved.
+PLATFORM_TRAVEL_DISTANCE = 100
+PLATFORM_DEFAULT_SPEED = 1
+PLATFORM_COLLISION_RANGE = 300
+PLATFORM_SYNC_RANGE = 1000
+PLATFORM_CARRY_TOLERANCE = 1.0
+
+# Constants for rewinding
+# The last REWIND_SECONDS of play are kept while R is held down.
+# Every REWIND_KEYFRAME_INTERVAL ticks the whole state is stored,
+# and the ticks in between only store the values that changed, in
+# a pool of REWIND_DELTA_CAPACITY values. When the pool is full the
+# oldest history is dropped, so the memory used never grows.
+REWIND_KEY = arcade.key.R
+REWIND_SECONDS = 10
+REWIND_KEYFRAME_INTERVAL = 30
+REWIND_DELTA_CAPACITY = 1 << 18
+PLAYER_REWIND_FIELDS = (
+    ("center_x", float),
+    ("center_y", float),
+    ("change_x", float),
+    ("change_y", float),
+    ("current_health", int),
+    ("character_face_direction", int),
+    ("cur_texture", int),
+    ("jump_frame", int),
+    ("attack_frame", int),
+    ("takedamage_frame", int),
+    ("death_frame", int),
+    ("cast_frame", int),
+    ("invulnerable_timer", int),
+    ("is_attacking", bool),
+    ("is_casting", bool),
+    ("is_taking_damage", bool),
+    ("is_dead", bool),
+    ("has_dealt_damage", bool),
+)
+ENEMY_REWIND_FIELDS = (
+    ("center_x", float),
+    ("center_y", float),
+    ("change_x", float),
+    ("current_health", int),
+    ("is_attacking", bool),
+    ("is_taking_damage", bool),
+    ("is_dead", bool),
+    ("has_dealt_damage", bool),
+    ("cur_texture", int),
+    ("direction", int),
+    ("takedamage_frame", int),
+    ("attack_cooldown", int),
+    ("ground_column", int),
+    ("ground_row", int),
+)
+
+# Constants for hit boxes
+# "pixel" hit boxes outline the opaque pixels of each image, while
+# "aabb" hit boxes are the box around them, which is cheaper to
+# test for collisions. Computed hit boxes are kept in a cache file
+# keyed by a hash of the image.
+HIT_BOX_MODE = "pixel"
+HIT_BOX_MODES = ("pixel", "aabb")
+HIT_BOX_CACHE_PATH = "resources/hit_boxes.json.gz"
+
+# Constants for the tile map layers
+# Layers that are used for collision checks are given a spatial
+# hash, while layers that are only drawn or that move do not.
+LAYER_OPTIONS = {
+    "Mushroom_Enemies": {"use_spatial_hash": True},
+    "Finish": {"use_spatial_hash": True},
+    "Spikes": {"use_spatial_hash": True},
+    "Ground": {"use_spatial_hash": True},
+    "Boundaries": {"use_spatial_hash": True},
+    "Decorations": {"use_spatial_hash": False},
+    "Background_Filler": {"use_spatial_hash": False},
+    "Background": {"use_spatial_hash": False},
+    "Midground": {"use_spatial_hash": False},
+    "Foreground": {"use_spatial_hash": False},
+    "Moving_Platforms": {"use_spatial_hash": False},
+}
+
+# Constants for the render queue
+# Sprite lists are drawn by layer, lowest first, and every sprite
+# or glyph is drawn as a quad. A frame with more draw calls than
+# the budget is reported once for each level.
+RENDER_LAYER_LEVEL = 0
+RENDER_LAYER_CHARACTERS = 1
+RENDER_LAYER_EFFECTS = 2
+QUAD_VERTICES = 4
+DRAW_CALL_BUDGET = 16
+
+# Constants for streaming the tile layers of large levels
+# Levels with at least STREAMING_MIN_TILES cells keep the layers in
+# STREAMED_LAYERS as grids, and only have sprites for the chunks of
+# STREAMING_CHUNK_TILES by STREAMING_CHUNK_TILES tiles that are
+# within STREAMING_RADIUS pixels of the player.
+STREAMING_MIN_TILES = 40000
+STREAMING_CHUNK_TILES = 16
+STREAMING_RADIUS = WINDOW_WIDTH
+STREAMED_LAYERS = ("Background_Filler", "Ground", "Spikes", "Boundaries")
+
+# Constants for reloading levels while the game runs
+# The files of the level are checked for changes this often.
+HOT_RELOAD_INTERVAL = 0.5
+
+# Constants for the level catalog
+# The levels are the Tiled maps in LEVEL_FOLDER, played in the order
+# of the number in their file name. What is known about each level
+# is kept in LEVEL_CATALOG_PATH with a hash of its file, so a map is
+# only parsed again after it changes. The thumbnail of a level has
+# one pixel per tile, scaled to fit LEVEL_THUMBNAIL_SIZE, with the
+# tile layers in LEVEL_THUMBNAIL_LAYERS coloured over the sky.
+LEVEL_FOLDER = "resources/maps"
+LEVEL_CATALOG_PATH = "resources/maps/catalog.json"
+LEVEL_CATALOG_VERSION = 1
+LEVEL_THUMBNAIL_SIZE = (240, 160)
+LEVEL_THUMBNAIL_SKY = (28, 32, 48)
+LEVEL_THUMBNAIL_LAYERS = (
+    ("Background_Filler", (52, 60, 76)),
+    ("Ground", (138, 106, 74)),
+    ("Spikes", (222, 64, 64)),
+)
+LEVEL_THUMBNAIL_MARKERS = {
+    "Moving_Platforms": (120, 180, 232),
+    "Mushroom_Enemies": (236, 120, 200),
+    "Finish": (250, 210, 60),
+}
+LEVEL_THUMBNAIL_SPAWN = (90, 220, 110)
+LEVEL_SELECT_COLUMNS = 3
+LEVEL_SELECT_ROWS = 2
+LEVEL_SELECT_FONT_SIZE = 14
+
+
+class OpaqueBoundsHitBoxAlgorithm(arcade.hitbox.HitBoxAlgorithm):
+    """
+    This hit box algorithm returns the axis aligned box around the
+    opaque pixels of an image, so sprites with transparent margins
+    still get a tight box.
+    """
+    def calculate(self, image, **kwargs):
+        """
+        Returns the four corners of the box, relative to the
+        centre of the image with y pointing up.
+        """
+        bounds = image.getchannel("A").getbbox()
+        if bounds is None:
+            return self.create_bounding_box(image)
+        left, top, right, bottom = bounds
+        half_width = image.width / 2
+        half_height = image.height / 2
+        return (
+            (left - half_width, half_height - bottom),
+            (right - half_width, half_height - bottom),
+            (right - half_width, half_height - top),
+            (left - half_width, half_height - top),
+        )
+
+
+class CachedHitBoxAlgorithm(arcade.hitbox.HitBoxAlgorithm):
+    """
+    This class wraps a hit box algorithm so that the points it
+    calculates are stored in hit_box_cache, keyed by a hash of the
+    image and the name of the algorithm. The cache is read from
+    HIT_BOX_CACHE_PATH the first time a hit box is needed, so
+    images that were compiled before are never scanned again.
+    """
+    def __init__(self, algorithm):
+        """
+        Initializes the wrapper with the algorithm it caches. It
+        keeps the algorithm's name, so textures made with either
+        mode are told apart by arcade's texture cache.
+        """
+        super().__init__()
+        self.algorithm = algorithm
+        self._cache_name = algorithm.cache_name
+
+    def calculate(self, image, **kwargs):
+        """
+        Returns the cached points for an image, calculating and
+        caching them first if the image has not been seen before.
+        """
+        if not hit_box_cache_state["loaded"]:
+            load_hit_box_cache()
+        key = (
+            hashlib.sha1(image.tobytes()).hexdigest()
+            + "|"
+            + self.cache_name
+        )
+        points = hit_box_cache.get(key)
+        if points is None:
+            points = self.algorithm.calculate(image, **kwargs)
+            hit_box_cache.put(key, points)
+        return points
+
+
+# Caches for loaded resources. Textures and parsed maps are kept
+# between game views so that restarting a level, or running many
+# game sessions in one process, does not load the same files again.
+texture_pair_cache = {}
+tiled_map_cache = {}
+sound_cache = {}
+
+# The hit box cache and the algorithm used for each hit box mode.
+# The state remembers how many entries were read from disk, so the
+# cache is only written back when new hit boxes were added.
+hit_box_cache = arcade.cache.HitBoxCache()
+hit_box_cache_state = {"loaded": False, "saved_entries": 0}
+hit_box_algorithms = {
+    "pixel": CachedHitBoxAlgorithm(arcade.hitbox.algo_simple),
+    "aabb": CachedHitBoxAlgorithm(OpaqueBoundsHitBoxAlgorithm()),
+}
+
+
+def load_hit_box_cache(path=HIT_BOX_CACHE_PATH):
+    """
+    Reads the compiled hit boxes from disk, if the file exists.
+    """
+    hit_box_cache_state["loaded"] = True
+    if os.path.exists(path):
+        hit_box_cache.load(Path(path))
+    hit_box_cache_state["saved_entries"] = len(hit_box_cache)
+
+
+def save_hit_box_cache(path=HIT_BOX_CACHE_PATH):
+    """
+    Writes the hit box cache to disk if hit boxes were added
+    since it was read.
+    """
+    if len(hit_box_cache) > hit_box_cache_state["saved_entries"]:
+        hit_box_cache.save(Path(path))
+        hit_box_cache_state["saved_entries"] = len(hit_box_cache)
+
+
+def load_texture_pair(path, hit_box_mode=HIT_BOX_MODE):
+    """
+    This is a helper function to load textures
+    for the player and enemy sprites. It returns the texture
+    and its mirrored version so that sprites can face both ways.
+    The hit box of the texture is made with the given mode.
+    """
+    key = (path, hit_box_mode)
+    if key not in texture_pair_cache:
+        tex = arcade.load_texture(
+            path, hit_box_algorithm=hit_box_algorithms[hit_box_mode]
+        )
+        texture_pair_cache[key] = (tex, tex.flip_left_right())
+    return texture_pair_cache[key]
+
+
+def load_sound(path):
+    """
+    Loads a sound effect, or returns it from the cache if it was
+    loaded by an earlier game view.
+    """
+    if path not in sound_cache:
+        sound_cache[path] = arcade.load_sound(path)
+    return sound_cache[path]
+
+
+def load_tiled_map(path):
+    """
+    Parses a Tiled map file, reusing the previous result unless
+    the file has been modified since it was parsed.
+    """
+    modified = os.path.getmtime(path)
+    cached = tiled_map_cache.get(path)
+    if cached is None or cached[0] != modified:
+        cached = (modified, pytiled_parser.parse_map(Path(path)))
+        tiled_map_cache[path] = cached
+    return cached[1]
+
+
+def level_spawn(tiled_map):
+    """
+    Returns where the player starts on a map. A map can set it with
+    its spawn_x and spawn_y properties, otherwise the player starts
+    at the default spawn point.
+    """
+    properties = tiled_map.properties or {}
+    return (
+        float(properties.get("spawn_x", PLAYER_SPAWN_X)),
+        float(properties.get("spawn_y", PLAYER_SPAWN_Y)),
+    )
+
+
+class LevelCatalog:
+    """
+    This class keeps track of the levels of the game. The maps in
+    the level folder are numbered in the order of the number in
+    their file name, and what the level select screen shows about
+    each of them is read from the catalog file, so no map has to be
+    parsed for it. A map is only parsed again when the hash of its
+    file no longer matches the one in the catalog, and the catalog
+    file is then written again.
+    """
+    def __init__(self, folder=LEVEL_FOLDER, path=LEVEL_CATALOG_PATH):
+        """
+        Initializes the catalog with the folder of the maps and the
+        path of the catalog file, relative to the game's folder.
+        The catalog is read the first time a level is looked up.
+        """
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.folder = os.path.join(base_dir, folder)
+        self.path = os.path.join(base_dir, path)
+        self.levels = None
+
+    def __len__(self):
+        """
+        Returns the number of levels.
+        """
+        return len(self.entries())
+
+    @staticmethod
+    def level_order(file_name):
+        """
+        Sorts maps by the number in their file name, so level10.tmx
+        comes after level9.tmx. Maps without a number come last.
+        """
+        number = re.search(r"\d+", file_name)
+        return (
+            int(number.group()) if number else float("inf"),
+            file_name,
+        )
+
+    def entries(self):
+        """
+        Returns the entries of every level, in the order they are
+        played, reading the catalog first if it has not been read.
+        """
+        if self.levels is None:
+            self.refresh()
+        return self.levels
+
+    def refresh(self):
+        """
+        Reads the catalog file and checks it against the maps in
+        the level folder. Maps that are new or have changed are
+        parsed and the catalog file is written again, while the
+        entries of the others are used as they are.
+        """
+        indexed = {}
+        try:
+            with open(self.path, encoding="utf-8") as catalog_file:
+                catalog = json.load(catalog_file)
+            if catalog.get("version") == LEVEL_CATALOG_VERSION:
+                indexed = {
+                    entry["file"]: entry for entry in catalog["levels"]
+                }
+        except (OSError, ValueError, KeyError):
+            pass
+
+        file_names = sorted(
+            (
+                file_name
+                for file_name in os.listdir(self.folder)
+                if file_name.endswith(".tmx")
+            ),
+            key=self.level_order,
+        )
+        levels = []
+        changed = set(indexed) != set(file_names)
+        for file_name in file_names:
+            with open(os.path.join(self.folder, file_name), "rb") as tmx:
+                digest = hashlib.sha1(tmx.read()).hexdigest()
+            entry = indexed.get(file_name)
+            if entry is None or entry["hash"] != digest:
+                try:
+                    entry = self.scan(file_name, digest)
+                except Exception as error:
+                    # A map that can not be parsed is left out, like
+                    # a broken map is when reloading a level.
+                    print(f"Skipped level {file_name}: {error}")
+                    continue
+                changed = True
+            levels.append(entry)
+        self.levels = levels
+
+        if changed:
+            try:
+                with open(self.path, "w", encoding="utf-8") as catalog_file:
+                    json.dump(
+                        {
+                            "version": LEVEL_CATALOG_VERSION,
+                            "levels": levels,
+                        },
+                        catalog_file,
+                        indent=1,
+                    )
+                    catalog_file.write("\n")
+            except OSError as error:
+                print(f"Could not write the level catalog: {error}")
+        return levels
+
+    def scan(self, file_name, digest):
+        """
+        Parses a map and returns its entry: the size of the map and
+        of its tiles, the spawn point, the number of enemies,
+        moving platform tiles and spikes, and a thumbnail.
+        """
+        tiled_map = pytiled_parser.parse_map(
+            Path(os.path.join(self.folder, file_name))
+        )
+        layers = {layer.name: layer for layer in tiled_map.layers}
+
+        def objects(name):
+            layer = layers.get(name)
+            if isinstance(layer, pytiled_parser.ObjectLayer):
+                return layer.tiled_objects
+            return []
+
+        def cells(name):
+            layer = layers.get(name)
+            if isinstance(layer, pytiled_parser.TileLayer) and layer.data:
+                return layer.data
+            return []
+
+        return {
+            "file": file_name,
+            "hash": digest,
+            "width": tiled_map.map_size.width,
+            "height": tiled_map.map_size.height,
+            "tile_width": tiled_map.tile_size.width,
+            "tile_height": tiled_map.tile_size.height,
+            "spawn": list(level_spawn(tiled_map)),
+            "enemies": len(objects("Mushroom_Enemies")),
+            "platforms": len(objects("Moving_Platforms")),
+            "spikes": sum(
+                1 for row in cells("Spikes") for cell in row if cell
+            ),
+            "thumbnail": self.make_thumbnail(tiled_map, objects, cells),
+        }
+
+    @staticmethod
+    def make_thumbnail(tiled_map, objects, cells):
+        """
+        Draws a map with one pixel per tile, scales it to fit
+        LEVEL_THUMBNAIL_SIZE and marks the objects and the spawn
+        point on it. Returns the image as base64 encoded PNG data.
+        """
+        width = tiled_map.map_size.width
+        height = tiled_map.map_size.height
+        tile_width = tiled_map.tile_size.width
+        tile_height = tiled_map.tile_size.height
+
+        # Each pixel holds the index of the colour of its tile.
+        pixels = bytearray(width * height)
+        palette = list(LEVEL_THUMBNAIL_SKY)
+        for index, (name, color) in enumerate(LEVEL_THUMBNAIL_LAYERS, 1):
+            palette += color
+            for y, row in enumerate(cells(name)):
+                start = y * width
+                for x, cell in enumerate(row):
+                    if cell:
+                        pixels[start + x] = index
+        image = Image.frombytes("P", (width, height), bytes(pixels))
+        image.putpalette(palette)
+
+        scale = min(
+            LEVEL_THUMBNAIL_SIZE[0] / width,
+            LEVEL_THUMBNAIL_SIZE[1] / height,
+        )
+        image = image.convert("RGB").resize(
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            Image.NEAREST,
+        )
+
+        # Objects are marked after scaling, so they stay visible
+        # on thumbnails of large maps.
+        draw = ImageDraw.Draw(image)
+
+        def mark(x, y, color):
+            x = int(x * scale)
+            y = int(y * scale)
+            draw.rectangle((x - 1, y - 1, x + 1, y + 1), fill=color)
+
+        for name, color in LEVEL_THUMBNAIL_MARKERS.items():
+            for tiled_object in objects(name):
+                mark(
+                    tiled_object.coordinates.x / tile_width,
+                    tiled_object.coordinates.y / tile_height - 0.5,
+                    color,
+                )
+        spawn_x, spawn_y = level_spawn(tiled_map)
+        mark(
+            spawn_x / (tile_width * TILE_SCALING),
+            height - spawn_y / (tile_height * TILE_SCALING),
+            LEVEL_THUMBNAIL_SPAWN,
+        )
+
+        data = io.BytesIO()
+        image.save(data, "PNG", optimize=True)
+        return base64.b64encode(data.getvalue()).decode("ascii")
+
+    def entry(self, level):
+        """
+        Returns the entry of a level, numbered from 1.
+        """
+        levels = self.entries()
+        if not 1 <= level <= len(levels):
+            raise ValueError(
+                f"There is no level {level}, the levels in "
+                f"{self.folder} are 1 to {len(levels)}"
+            )
+        return levels[level - 1]
+
+    def map_path(self, level):
+        """
+        Returns the path of the map of a level, numbered from 1.
+        """
+        return os.path.join(self.folder, self.entry(level)["file"])
+
+    @staticmethod
+    def thumbnail(entry):
+        """
+        Returns the thumbnail of an entry as an image.
+        """
+        return Image.open(io.BytesIO(base64.b64decode(entry["thumbnail"])))
+
+
+# The catalog of the levels in LEVEL_FOLDER.
+level_catalog = LevelCatalog()
+
+
+class InputRecorder:
+    """
+    This class records the key presses and releases handled by
+    GameView against the simulation tick they were processed on.
+    Every time a GameView is shown a new take is started, storing
+    the level and random seed it started from so that the take
+    can be replayed through the same code paths by replay.py.
+    State digests are also stored at a fixed tick interval
+    so a replay can detect when it diverges from the recording.
+    """
+    def __init__(self, path, seed=RECORDING_SEED):
+        """
+        Initializes the recorder with the file the recording
+        is saved to and the seed used for every take.
+        """
+        self.path = path
+        self.seed = seed
+        self.takes = []
+        self.current_take = None
+
+    def begin(self, level):
+        """
+        Starts a new take on the given level and seeds the
+        random number generator so the take is reproducible.
+        """
+        random.seed(self.seed)
+        self.current_take = {
+            "level": level,
+            "seed": self.seed,
+            "events": [],
+            "hashes": [],
+        }
+        self.takes.append(self.current_take)
+
+    def record(self, tick, action, key, modifiers):
+        """
+        Stores a single key event for the current take.
+        The action is either "press" or "release".
+        """
+        if self.current_take is None:
+            return
+        self.current_take["events"].append([tick, action, key, modifiers])
+
+    def checkpoint(self, tick, digest):
+        """
+        Stores the state digest of the game at the given tick.
+        """
+        if self.current_take is None:
+            return
+        self.current_take["hashes"].append([tick, digest])
+
+    def save(self):
+        """
+        Writes all the takes that have been recorded to disk as JSON.
+        """
+        with open(self.path, "w") as file:
+            json.dump(
+                {"tick_rate": SIMULATION_TICK_RATE, "takes": self.takes},
+                file,
+            )
+
+
+class InputQueue:
+    """
+    This class holds the key events GameView receives until the
+    start of the next simulation tick, so every event is applied
+    at the same point of a tick no matter when it arrived within
+    the frame. Each event is stamped with the time it arrived, and
+    the time it waited to be simulated and then to be drawn is
+    counted in histograms of INPUT_LATENCY_BUCKETS.
+    """
+    def __init__(self):
+        """
+        Initializes an empty queue and empty histograms.
+        """
+        self.events = collections.deque()
+        self.unpresented = []
+        self.reset_counts()
+
+    def reset_counts(self):
+        """
+        Empties the latency histograms.
+        """
+        self.simulation_counts = [0] * (len(INPUT_LATENCY_BUCKETS) + 1)
+        self.present_counts = [0] * (len(INPUT_LATENCY_BUCKETS) + 1)
+
+    def push(self, action, key, modifiers):
+        """
+        Queues a key event, stamped with the current time.
+        The action is either "press" or "release".
+        """
+        self.events.append((time.perf_counter(), action, key, modifiers))
+
+    def drain(self):
+        """
+        Yields the queued events in the order they arrived, as
+        (action, key, modifiers) tuples, counting how long each
+        waited to be simulated.
+        """
+        now = time.perf_counter()
+        while self.events:
+            stamp, action, key, modifiers = self.events.popleft()
+            self.simulation_counts[
+                bisect.bisect_left(
+                    INPUT_LATENCY_BUCKETS, (now - stamp) * 1000
+                )
+            ] += 1
+            self.unpresented.append(stamp)
+            yield action, key, modifiers
+
+    def presented(self):
+        """
+        Counts how long the events simulated since the last frame
+        waited to be drawn. It is called once a frame is drawn.
+        """
+        now = time.perf_counter()
+        for stamp in self.unpresented:
+            self.present_counts[
+                bisect.bisect_left(
+                    INPUT_LATENCY_BUCKETS, (now - stamp) * 1000
+                )
+            ] += 1
+        self.unpresented.clear()
+
+    def clear(self):
+        """
+        Drops the queued events without applying them.
+        """
+        self.events.clear()
+        self.unpresented.clear()
+
+    def histograms(self):
+        """
+        Returns the latency histograms counted since they were last
+        reset, from a key event to the tick that simulated it and
+        to the frame that drew that tick.
+        """
+        return {
+            "buckets_ms": INPUT_LATENCY_BUCKETS,
+            "simulation": list(self.simulation_counts),
+            "present": list(self.present_counts),
+        }
+
+
+class TelemetryWriter:
+    """
+    This class writes gameplay and performance events of a session
+    to a gzip compressed JSON lines file. The game only appends
+    events to a bounded queue, which a background thread empties
+    into the file, so emitting an event never waits for the disk.
+    When the queue is full the event is dropped, and the number of
+    dropped events of each kind is written when the session ends.
+    """
+    def __init__(self, path, queue_size=TELEMETRY_QUEUE_SIZE):
+        """
+        Opens the session and starts the writer thread.
+        """
+        self.path = path
+        self.queue_size = queue_size
+        # Appending to and popping from a deque are atomic, so the
+        # game and the writer thread share it without a lock.
+        self.events = collections.deque()
+        self.dropped = {}
+        self.start_time = time.perf_counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="telemetry", daemon=True
+        )
+        self.thread.start()
+        self.emit("session_start", wall_time=time.time())
+
+    def emit(self, event, **fields):
+        """
+        Queues an event with the given fields, or counts it as
+        dropped if the queue is full.
+        """
+        if len(self.events) >= self.queue_size:
+            self.dropped[event] = self.dropped.get(event, 0) + 1
+            return
+        fields["event"] = event
+        fields["time"] = round(time.perf_counter() - self.start_time, 4)
+        self.events.append(fields)
+
+    def run(self):
+        """
+        Writes the queued events to the file until the session is
+        closed. The file is appended to, so several sessions can
+        share one file.
+        """
+        with gzip.open(self.path, "at", encoding="utf-8") as file:
+            while not self.stopping.wait(TELEMETRY_FLUSH_INTERVAL):
+                self.drain(file)
+            self.drain(file)
+
+    def drain(self, file):
+        """
+        Writes every queued event to the file as one line of JSON.
+        """
+        if not self.events:
+            return
+        while self.events:
+            file.write(json.dumps(self.events.popleft()) + "\n")
+        file.flush()
+
+    def close(self):
+        """
+        Ends the session, with the counts of dropped events, and
+        waits for the writer thread to write everything out.
+        """
+        self.events.append({
+            "event": "session_end",
+            "time": round(time.perf_counter() - self.start_time, 4),
+            "dropped": self.dropped,
+        })
+        self.stopping.set()
+        self.thread.join()
+
+
+class StartupPipeline:
+    """
+    This class times how the game starts, from the first import to
+    the first frame of the start screen. Each phase is ended with
+    phase(), and work that is not needed for the first frame is
+    deferred with defer(). The deferred work runs one piece after
+    each frame that follows the first, so the start screen is shown
+    as early as it can be and keeps moving while the rest finishes.
+
+    Once nothing is left to do, the phases are printed if the trace
+    is enabled, and sent to the telemetry as a startup event.
+    """
+    def __init__(self, start, trace=False, quit_when_done=False):
+        """
+        Initializes the pipeline with the perf_counter() time the
+        game started at. The window is closed once the start has
+        finished when quit_when_done is set, for timing the start.
+        """
+        self.start = start
+        self.last = start
+        self.trace = trace
+        self.quit_when_done = quit_when_done
+        self.phases = []
+        self.deferred = collections.deque()
+        self.first_frame = None
+        self.finished = False
+
+    def phase(self, name):
+        """
+        Ends the current phase of the start under the given name.
+        """
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def defer(self, name, function):
+        """
+        Runs a function after the first frame, or at once if the
+        start has already finished.
+        """
+        if self.finished:
+            function()
+            return
+        self.deferred.append((name, function))
+
+    def frame_drawn(self, window):
+        """
+        Called after each frame until the start has finished. The
+        first frame ends the last phase before it, and every frame
+        after it runs the next piece of deferred work.
+        """
+        if self.first_frame is None:
+            self.phase("first frame")
+            self.first_frame = self.last - self.start
+        elif self.deferred:
+            name, function = self.deferred.popleft()
+            # The time spent waiting for the frame is not counted.
+            self.last = time.perf_counter()
+            function()
+            self.phase(f"deferred {name}")
+        if not self.deferred:
+            self.finish(window)
+
+    def finish(self, window):
+        """
+        Reports the phases of the start, and closes the window if
+        the game was only started to time it.
+        """
+        self.finished = True
+        total = sum(seconds for _, seconds in self.phases)
+        if self.trace:
+            for name, seconds in self.phases:
+                print(f"Startup {name:24} {seconds * 1000:8.1f} ms")
+            print(
+                f"Startup showed the first frame after "
+                f"{self.first_frame * 1000:.1f} ms, and took "
+                f"{total * 1000:.1f} ms of work in all"
+            )
+        telemetry = getattr(window, "telemetry", None)
+        if telemetry:
+            telemetry.emit(
+                "startup",
+                first_frame=round(self.first_frame, 4),
+                total=round(total, 4),
+                phases={
+                    name: round(seconds, 4) for name, seconds in self.phases
+                },
+            )
+        if self.quit_when_done:
+            window.close()
+
+
+class FramePacer(pyglet.app.EventLoop):
+    """
+    This class runs the game loop in place of arcade.run, so that
+    updates and frames start when they are due. Between them it
+    waits for window events with a timeout, so key presses are
+    still handled as soon as they happen, and it spins through the
+    last PACING_SPIN_TIME before a deadline.
+
+    While the window is unfocused or minimized, or a screen with
+    nothing moving is shown, it draws at the idle rate only and
+    never spins. Each of these reasons is kept in the low_power set
+    until it no longer applies. Updates slow down to the idle rate
+    too, unless the game is being played, since the game drops the
+    time it cannot catch up on and would run in slow motion.
+
+    Missed deadlines and the jitter of the time between frames are
+    counted, and reported to the console and to the telemetry.
+    """
+    def __init__(
+        self,
+        window,
+        update_rate=RENDER_RATE,
+        draw_rate=RENDER_RATE,
+        idle_rate=MENU_IDLE_RATE,
+        report=False,
+    ):
+        """
+        Initializes the pacer with the rates, in seconds, of updates
+        and frames, and of both while in low power. Like arcade, it
+        never draws more often than it updates.
+        """
+        super().__init__()
+        self.window = window
+        self.update_rate = update_rate
+        self.draw_rate = max(update_rate, draw_rate)
+        self.idle_rate = idle_rate
+        self.report = report
+        self.low_power = set()
+        self.simulating = False
+        self.next_update = None
+        self.next_draw = None
+        self.last_update = None
+        self.last_draw = None
+        self.reset_stats()
+
+        # Arcade schedules its own updates and frames on the pyglet
+        # clock, which the pacer replaces.
+        pyglet.clock.unschedule(window._dispatch_frame)
+        window.push_handlers(
+            on_activate=lambda: self.set_low_power("unfocused", False),
+            on_deactivate=lambda: self.set_low_power("unfocused", True),
+            on_show=lambda: self.set_low_power("minimized", False),
+            on_hide=lambda: self.set_low_power("minimized", True),
+        )
+
+    def reset_stats(self):
+        """
+        Starts counting frames, missed deadlines and jitter again.
+        """
+        self.stats_start = time.perf_counter()
+        self.frames = 0
+        self.missed = 0
+        self.error_squares = 0.0
+        self.worst_error = 0.0
+
+    def set_low_power(self, reason, enabled):
+        """
+        Adds or removes a reason to run at the idle rate. The stats
+        of the previous rate are reported, and the next update and
+        frame are due at once, so leaving low power is not delayed.
+        """
+        low_power = set(self.low_power)
+        if enabled:
+            low_power.add(reason)
+        else:
+            low_power.discard(reason)
+        if low_power == self.low_power:
+            return
+        self.emit_report()
+        self.low_power = low_power
+        self.next_update = self.next_draw = time.perf_counter()
+        self.last_draw = None
+
+    def set_simulating(self, simulating):
+        """
+        Sets whether the game is being played, which keeps updates
+        at the update rate while in low power. The next update is
+        due at once, so the game does not start late.
+        """
+        if simulating == self.simulating:
+            return
+        self.simulating = simulating
+        self.next_update = time.perf_counter()
+
+    def request_frame(self):
+        """
+        Makes the next frame due at once, so a screen that changes
+        while running at the idle rate is shown straight away.
+        """
+        self.next_draw = time.perf_counter()
+
+    def rates(self):
+        """
+        Returns the update and draw rates currently used.
+        """
+        if self.low_power and self.simulating:
+            return self.update_rate, self.idle_rate
+        if self.low_power:
+            return self.idle_rate, self.idle_rate
+        return self.update_rate, self.draw_rate
+
+    def run(self, interval=None):
+        """
+        Runs the game until the window is closed.
+        """
+        pyglet.app.event_loop = self
+        self.next_update = self.next_draw = time.perf_counter()
+        self.reset_stats()
+        super().run(None)
+        self.emit_report()
+
+    def idle(self):
+        """
+        Called by the event loop after handling window events.
+        Runs the update and draws the frame that are due, and
+        returns how long to wait for window events before the next
+        one is due.
+        """
+        # Runs the functions scheduled on the pyglet clock, such as
+        # the ones streaming sounds.
+        self.clock.call_scheduled_functions(self.clock.update_time())
+        if self.window.closed:
+            self.exit()
+            return None
+
+        now = time.perf_counter()
+        deadline = min(self.next_update, self.next_draw)
+        if now < deadline:
+            if self.low_power:
+                return self.wait_time(deadline - now)
+            if deadline - now > PACING_SPIN_TIME:
+                return self.wait_time(deadline - now - PACING_SPIN_TIME)
+            while time.perf_counter() < deadline:
+                pass
+            now = time.perf_counter()
+
+        update_rate, draw_rate = self.rates()
+        if now >= self.next_update:
+            delta_time = update_rate
+            if self.last_update is not None:
+                delta_time = now - self.last_update
+            self.last_update = now
+            self.next_update = self.next_deadline(
+                self.next_update, update_rate, now
+            )
+            self.window.dispatch_event("on_update", delta_time)
+
+        if now >= self.next_draw and not self.window.closed:
+            self.count_frame(now, draw_rate)
+            self.next_draw = self.next_deadline(
+                self.next_draw, draw_rate, now
+            )
+            self.window.draw(draw_rate)
+
+            # Lets the startup pipeline time the first frame and run
+            # its deferred work after the frames that follow.
+            startup = getattr(self.window, "startup", None)
+            if startup and not startup.finished:
+                startup.frame_drawn(self.window)
+        return 0.0
+
+    def wait_time(self, wait):
+        """
+        Returns how long to wait for window events, which is cut
+        short if a function scheduled on the pyglet clock is due.
+        """
+        scheduled = self.clock.get_sleep_time(True)
+        if scheduled is not None and scheduled < wait:
+            return scheduled
+        return wait
+
+    @staticmethod
+    def next_deadline(deadline, rate, now):
+        """
+        Returns when the next update or frame is due. A deadline
+        that has fallen more than one period behind is moved to a
+        period from now, instead of running late ones back to back.
+        """
+        deadline += rate
+        if deadline <= now:
+            deadline = now + rate
+        return deadline
+
+    def count_frame(self, now, draw_rate):
+        """
+        Counts a frame that is about to be drawn, whether it missed
+        its deadline and how far the time since the last frame was
+        from the draw rate. The stats are reported every
+        PACING_REPORT_INTERVAL.
+        """
+        if now - self.next_draw > PACING_MISS_TOLERANCE:
+            self.missed += 1
+        if self.last_draw is not None:
+            error = abs(now - self.last_draw - draw_rate)
+            self.frames += 1
+            self.error_squares += error * error
+            self.worst_error = max(self.worst_error, error)
+        self.last_draw = now
+        if now - self.stats_start >= PACING_REPORT_INTERVAL:
+            self.emit_report()
+
+    def emit_report(self):
+        """
+        Reports the frames, missed deadlines and jitter counted
+        since the last report, then starts counting again.
+        """
+        if self.frames:
+            draw_rate = self.rates()[1]
+            jitter = (self.error_squares / self.frames) ** 0.5
+            fields = {
+                "seconds": round(time.perf_counter() - self.stats_start, 3),
+                "target_fps": round(1 / draw_rate, 2),
+                "low_power": sorted(self.low_power),
+                "frames": self.frames,
+                "missed": self.missed,
+                "jitter_ms": round(jitter * 1000, 3),
+                "worst_ms": round(self.worst_error * 1000, 3),
+            }
+            telemetry = getattr(self.window, "telemetry", None)
+            if telemetry:
+                telemetry.emit("frame_pacing", **fields)
+            if self.report:
+                print(
+                    f"Frame pacing: {fields['frames']} frames at "
+                    f"{fields['target_fps']:g} fps"
+                    f"{' (low power)' if self.low_power else ''}, "
+                    f"{fields['missed']} missed deadlines, jitter "
+                    f"{fields['jitter_ms']:.3f}ms, worst "
+                    f"{fields['worst_ms']:.3f}ms"
+                )
+        self.reset_stats()
+
+
+class RenderQueue:
+    """
+    This class draws the level in as few draw calls as it can.
+    Sprite lists are added with a layer, and are drawn from the
+    lowest layer to the highest, in the order they were added.
+
+    Lists that always hold the same sprites, such as the layers of
+    the tile map, are static. When the queue is built, neighbouring
+    static lists that share a texture atlas and blend state are
+    merged into one batch, which is drawn with one draw call. The
+    other lists are drawn as they are.
+
+    Health bars are queued each frame and drawn after everything
+    else, the bars as one sprite list and their labels as one text
+    batch, instead of three draw calls for every bar.
+
+    The draw calls, texture binds and vertices of the last frame
+    are kept in stats. A texture bind is counted whenever a draw
+    call uses a different texture atlas than the one before it,
+    and every sprite and glyph counts as a quad of four vertices.
+    """
+    def __init__(self):
+        """
+        Creates an empty queue and the pools for the health bars.
+        """
+        self.entries = []
+        self.batches = []
+        self.merged = []
+        self.stats = {"draw_calls": 0, "texture_binds": 0, "vertices": 0}
+
+        # The sprites and labels of the health bars are reused
+        # from frame to frame, and only the ones that were shown
+        # in the last frame are hidden again.
+        self.bar_list = arcade.SpriteList()
+        self.bar_count = 0
+        self.bars_shown = 0
+        self.label_batch = pyglet.graphics.Batch()
+        self.labels = []
+
+    def add(self, layer, sprite_list, static=False, blend=None):
+        """
+        Adds a sprite list to the queue. The queue has to be built
+        again before the list is drawn.
+        """
+        self.entries.append(
+            (layer, len(self.entries), sprite_list, static, blend)
+        )
+
+    def build(self):
+        """
+        Sorts the sprite lists by layer and merges the static
+        lists that can be drawn together into batches.
+        """
+        self.release_batches()
+        run = None
+        for _, _, sprite_list, static, blend in sorted(
+            self.entries, key=operator.itemgetter(0, 1)
+        ):
+            atlas = sprite_list.atlas
+            if (
+                static
+                and run is not None
+                and run[1] == blend
+                and run[2] is atlas
+            ):
+                run[0].extend(sprite_list)
+                continue
+            if static:
+                merged = arcade.SpriteList(atlas=atlas)
+                merged.extend(sprite_list)
+                self.merged.append(merged)
+                run = (merged, blend, atlas)
+                self.batches.append(run)
+            else:
+                run = None
+                self.batches.append((sprite_list, blend, atlas))
+
+    def release_batches(self):
+        """
+        Empties the merged batches, so they do not keep the
+        sprites of a level alive once it has been unloaded.
+        """
+        for merged in self.merged:
+            merged.clear()
+        self.merged = []
+        self.batches = []
+
+    def clear(self):
+        """
+        Removes every sprite list from the queue.
+        """
+        self.release_batches()
+        self.entries = []
+
+    def add_health_bar(self, center_x, bottom, current, maximum):
+        """
+        Queues a health bar for this frame, made of a red bar for
+        the maximum health, a green bar for the current health and
+        a label with both values above them.
+        """
+        index = self.bar_count
+        self.bar_count += 1
+        if index == len(self.labels):
+            for color in (arcade.color.RED, arcade.color.GREEN):
+                self.bar_list.append(arcade.SpriteSolidColor(
+                    HEALTH_BAR_WIDTH, HEALTH_BAR_HEIGHT, color=color
+                ))
+            self.labels.append(arcade.Text(
+                "",
+                0,
+                0,
+                arcade.color.WHITE,
+                HEALTH_BAR_TEXT_SIZE,
+                anchor_x="center",
+                batch=self.label_batch,
+            ))
+
+        left = center_x - HEALTH_BAR_WIDTH / 2
+        center_y = bottom + HEALTH_BAR_HEIGHT / 2
+        background = self.bar_list[index * 2]
+        background.visible = True
+        background.position = (center_x, center_y)
+
+        width = current / maximum * HEALTH_BAR_WIDTH
+        foreground = self.bar_list[index * 2 + 1]
+        foreground.visible = width > 0
+        foreground.width = max(width, 1)
+        foreground.position = (left + width / 2, center_y)
+
+        label = self.labels[index]
+        label.visible = True
+        text = f"{current}/{maximum}"
+        if label.text != text:
+            label.text = text
+        label_y = bottom + HEALTH_BAR_HEIGHT + 2
+        if label.x != center_x or label.y != label_y:
+            label.position = (center_x, label_y)
+
+    def draw(self):
+        """
+        Draws every batch in order, then the health bars queued
+        for this frame, and counts what the frame cost.
+        """
+        draw_calls = 0
+        texture_binds = 0
+        vertices = 0
+        bound_atlas = None
+        for sprite_list, blend, atlas in self.batches:
+            if not sprite_list:
+                continue
+            sprite_list.draw(blend_function=blend)
+            draw_calls += 1
+            vertices += len(sprite_list) * QUAD_VERTICES
+            if sprite_list.atlas is not bound_atlas:
+                bound_atlas = sprite_list.atlas
+                texture_binds += 1
+
+        # Hides the health bars that were shown in the last frame
+        # but not queued for this one.
+        for index in range(self.bar_count, self.bars_shown):
+            self.bar_list[index * 2].visible = False
+            self.bar_list[index * 2 + 1].visible = False
+            self.labels[index].visible = False
+        self.bars_shown = self.bar_count
+        if self.bar_count:
+            self.bar_list.draw()
+            self.label_batch.draw()
+            draw_calls += 2
+            if self.bar_list.atlas is not bound_atlas:
+                texture_binds += 1
+            # The glyphs of the labels are in the font's own texture.
+            texture_binds += 1
+            vertices += len(self.bar_list) * QUAD_VERTICES
+            vertices += QUAD_VERTICES * sum(
+                len(label.text) for label in self.labels[:self.bar_count]
+            )
+        self.bar_count = 0
+
+        self.stats = {
+            "draw_calls": draw_calls,
+            "texture_binds": texture_binds,
+            "vertices": vertices,
+        }
+
+
+
+class LevelWatcher:
+    """
+    This class watches the map file of the level being played, and
+    the tileset files it uses, so that edits saved in Tiled show up
+    in the running game. Only the layers that changed are built
+    into sprites again, and they are patched into the live sprite
+    lists, so a reload takes milliseconds and the player stays
+    where they are.
+
+    Tile layers are compared cell by cell and only the tiles that
+    changed are replaced. Object layers hold few objects, so a
+    changed object layer is built again as a whole. Edits that
+    change the size of the map or its layers reload the level.
+    """
+    def __init__(self, game_view, map_path):
+        """
+        Remembers the parsed map and when each file was modified.
+        """
+        self.game_view = game_view
+        self.map_path = map_path
+        self.tiled_map = load_tiled_map(map_path)
+
+        # External tilesets are listed by the map file itself,
+        # relative to the folder the map is in.
+        folder = os.path.dirname(map_path)
+        self.paths = [map_path] + [
+            os.path.normpath(os.path.join(folder, tileset.get("source")))
+            for tileset in ET.parse(map_path).getroot().iter("tileset")
+            if tileset.get("source")
+        ]
+        self.modified = self.modified_times()
+        self.next_check = time.perf_counter() + HOT_RELOAD_INTERVAL
+
+    def modified_times(self):
+        """
+        Returns when each watched file was last modified.
+        """
+        times = []
+        for path in self.paths:
+            try:
+                times.append(os.path.getmtime(path))
+            except OSError:
+                times.append(None)
+        return times
+
+    def poll(self):
+        """
+        Checks the files every HOT_RELOAD_INTERVAL seconds, and
+        patches the level if one of them was saved. Returns the
+        names of the layers that were reloaded, or None.
+        """
+        now = time.perf_counter()
+        if now < self.next_check:
+            return None
+        self.next_check = now + HOT_RELOAD_INTERVAL
+        modified = self.modified_times()
+        if modified == self.modified:
+            return None
+        self.modified = modified
+
+        # A map saved with a mistake in it is reported and the
+        # level is left as it is until the file is saved again.
+        try:
+            tiled_map = pytiled_parser.parse_map(Path(self.map_path))
+        except Exception as error:
+            print(f"Could not reload {self.map_path}: {error}")
+            return None
+        tiled_map_cache[self.map_path] = (modified[0], tiled_map)
+        return self.reload(tiled_map)
+
+    def reload(self, tiled_map):
+        """
+        Patches the layers that differ between the map the level
+        was built from and the given one into the game view.
+        """
+        start = time.perf_counter()
+        old_map = self.tiled_map
+        self.tiled_map = tiled_map
+        old_layers = {layer.name: layer for layer in old_map.layers}
+        new_layers = {layer.name: layer for layer in tiled_map.layers}
+        if (
+            tiled_map.map_size != old_map.map_size
+            or tiled_map.tile_size != old_map.tile_size
+            or new_layers.keys() != old_layers.keys()
+        ):
+            self.game_view.restart_level()
+            names = list(new_layers)
+        else:
+            # New tile images change every layer that uses them.
+            tilesets_changed = tiled_map.tilesets != old_map.tilesets
+            names = []
+            for name, layer in new_layers.items():
+                old_layer = old_layers[name]
+                if layer == old_layer and not tilesets_changed:
+                    continue
+                names.append(name)
+                streamer = self.game_view.tile_streamer
+                if streamer and name in streamer.grids:
+                    streamer.reload_layer(layer, tiled_map)
+                elif (
+                    isinstance(layer, pytiled_parser.TileLayer)
+                    and not tilesets_changed
+                    and layer.data
+                    and old_layer.data
+                ):
+                    self.patch_tiles(old_layer, layer)
+                else:
+                    self.replace_layer(layer)
+            if names:
+                self.game_view.layers_reloaded(names)
+
+        if names:
+            seconds = time.perf_counter() - start
+            print(f"Reloaded {', '.join(names)} in {seconds * 1000:.1f}ms")
+            self.game_view.emit("level_reload", layers=names, seconds=seconds)
+        return names
+
+    def build_layer(self, layer, tiled_map=None):
+        """
+        Builds the sprites and objects of a single layer, in the
+        game view's hit box mode, as a tile map of its own.
+        """
+        partial_map = copy.copy(tiled_map or self.tiled_map)
+        partial_map.layers = [layer]
+        return arcade.TileMap(
+            tiled_map=partial_map,
+            scaling=TILE_SCALING,
+            hit_box_algorithm=hit_box_algorithms[self.game_view.hit_box_mode],
+        )
+
+    def replace_layer(self, layer):
+        """
+        Builds a layer again and moves its sprites and objects into
+        the live tile map, keeping the sprite list the scene and the
+        physics engine already refer to.
+        """
+        tile_map = self.game_view.tile_map
+        built = self.build_layer(layer)
+        if layer.name in tile_map.sprite_lists:
+            sprite_list = tile_map.sprite_lists[layer.name]
+            sprite_list.clear()
+            move_sprites(
+                built.sprite_lists.get(layer.name, []), sprite_list
+            )
+        if layer.name in built.object_lists:
+            tile_map.object_lists[layer.name] = built.object_lists[layer.name]
+
+    def patch_tiles(self, old_layer, layer):
+        """
+        Replaces only the tiles of a tile layer whose cells changed.
+        The tiles being removed are found by building the old tiles
+        of those cells, and matching them by position.
+        """
+        cells = [
+            (column, row)
+            for row, (old_row, new_row) in enumerate(
+                zip(old_layer.data, layer.data)
+            )
+            for column, gid in enumerate(new_row)
+            if gid != old_row[column]
+        ]
+        if not cells:
+            # Only the properties of the layer changed.
+            self.replace_layer(layer)
+            return
+
+        sprite_list = self.game_view.tile_map.sprite_lists.get(layer.name)
+        if sprite_list is None:
+            return
+        removed = {
+            (round(sprite.center_x), round(sprite.center_y))
+            for sprite in self.build_cells(old_layer, cells)
+        }
+        for sprite in [
+            sprite
+            for sprite in sprite_list
+            if (round(sprite.center_x), round(sprite.center_y)) in removed
+        ]:
+            sprite_list.remove(sprite)
+        move_sprites(self.build_cells(layer, cells), sprite_list)
+
+    def build_cells(self, layer, cells):
+        """
+        Returns the sprites of the given (column, row) cells of a
+        tile layer, leaving every other cell of the layer empty.
+        """
+        data = [[0] * len(row) for row in layer.data]
+        for column, row in cells:
+            data[row][column] = layer.data[row][column]
+        partial_layer = copy.copy(layer)
+        partial_layer.data = data
+        return self.build_layer(partial_layer).sprite_lists.get(
+            layer.name, []
+        )
+
+
+def move_sprites(source, target):
+    """
+    Moves every sprite of one sprite list to the end of another.
+    """
+    sprites = list(source)
+    if isinstance(source, arcade.SpriteList):
+        source.clear()
+    target.extend(sprites)
+
+
+
+class TileStreamer:
+    """
+    This class streams the tile layers of large levels. Instead of
+    a sprite for every tile, each streamed layer keeps its tiles in
+    a compact grid of uint16 values, split into square chunks of
+    STREAMING_CHUNK_TILES tiles. Sprites are only made for the
+    chunks within STREAMING_RADIUS of the player, so the physics
+    engine, the hazard checks and the renderer only ever see the
+    tiles near the player. The sprites of chunks left behind go
+    back to a pool and are reused for the chunks ahead.
+
+    The grid holds indexes into a palette of the tile ids a layer
+    uses rather than the ids themselves, so the flip flags Tiled
+    stores in the ids still fit in 16 bits. Index 0 is an empty
+    cell. Each palette entry has a prototype sprite built by arcade,
+    which streamed sprites copy their texture, scale and colour from.
+
+    Tiles larger than a cell overlap their neighbours, so layers
+    with such tiles are kept sorted in the order arcade draws a
+    whole layer in, row by row from the top of the map.
+    """
+    def __init__(self, tile_map, layers, hit_box_algorithm):
+        """
+        Reads the given tile layers of the map into grids, and adds
+        an empty sprite list for each to the tile map.
+        """
+        self.tile_map = tile_map
+        self.width = tile_map.width
+        self.height = tile_map.height
+        self.tile_size = tile_map.tile_width * tile_map.scaling
+        self.chunk_span = STREAMING_CHUNK_TILES * self.tile_size
+        self.hit_box_algorithm = hit_box_algorithm
+        self.grids = {}
+        self.prototypes = {}
+        self.sprite_lists = {}
+        self.overlapping = set()
+
+        # The sprites of each loaded (layer name, chunk) pair, the
+        # free sprites and the range of chunks that is loaded.
+        self.chunk_sprites = {}
+        self.pool = []
+        self.active = set()
+        self.chunk_range = None
+
+        for layer in layers:
+            self.load_layer(layer, tile_map.tiled_map)
+
+    def load_layer(self, layer, tiled_map):
+        """
+        Reads a tile layer into its grid and builds the prototype
+        sprite of every tile it uses.
+        """
+        palette = {}
+        grid = array.array("H", bytes(2 * self.width * self.height))
+        index = 0
+        for row in layer.data:
+            for gid in row:
+                if gid:
+                    grid[index] = palette.setdefault(gid, len(palette) + 1)
+                index += 1
+        self.grids[layer.name] = grid
+
+        # Arcade builds the prototypes from a layer holding every
+        # tile id of the palette once, in palette order.
+        prototype_layer = copy.copy(layer)
+        prototype_layer.data = [list(palette)]
+        prototype_map = copy.copy(tiled_map)
+        prototype_map.layers = [prototype_layer]
+        built = arcade.TileMap(
+            tiled_map=prototype_map,
+            scaling=TILE_SCALING,
+            hit_box_algorithm=self.hit_box_algorithm,
+        )
+        self.prototypes[layer.name] = [None] + list(
+            built.sprite_lists.get(layer.name, [])
+        )
+        self.overlapping.discard(layer.name)
+        if any(
+            prototype.width > self.tile_size
+            or prototype.height > self.tile_size
+            for prototype in self.prototypes[layer.name][1:]
+        ):
+            self.overlapping.add(layer.name)
+
+        if layer.name not in self.sprite_lists:
+            sprite_list = arcade.SpriteList(
+                **LAYER_OPTIONS.get(layer.name, {})
+            )
+            sprite_list.visible = layer.visible
+            self.sprite_lists[layer.name] = sprite_list
+            self.tile_map.sprite_lists[layer.name] = sprite_list
+
+    def update(self, x, y):
+        """
+        Loads the chunks within STREAMING_RADIUS of a position and
+        unloads the ones that are no longer within it.
+        """
+        last_column = (self.width - 1) // STREAMING_CHUNK_TILES
+        last_row = (self.height - 1) // STREAMING_CHUNK_TILES
+        chunk_range = (
+            max(0, int((x - STREAMING_RADIUS) // self.chunk_span)),
+            min(last_column, int((x + STREAMING_RADIUS) // self.chunk_span)),
+            max(0, int((y - STREAMING_RADIUS) // self.chunk_span)),
+            min(last_row, int((y + STREAMING_RADIUS) // self.chunk_span)),
+        )
+        if chunk_range == self.chunk_range:
+            return
+        self.chunk_range = chunk_range
+
+        left, right, bottom, top = chunk_range
+        wanted = {
+            (column, row)
+            for column in range(left, right + 1)
+            for row in range(bottom, top + 1)
+        }
+        for chunk in self.active - wanted:
+            self.unload_chunk(chunk)
+        for chunk in wanted - self.active:
+            self.load_chunk(chunk)
+        self.active = wanted
+        self.sort_overlapping()
+
+    def sort_overlapping(self):
+        """
+        Sorts the layers with overlapping tiles into draw order.
+        """
+        for name in self.overlapping:
+            self.sprite_lists[name].sort(
+                key=lambda sprite: (-round(sprite.bottom), sprite.left)
+            )
+
+    def load_chunk(self, chunk):
+        """
+        Places a sprite on every tile of a chunk, taking the sprites
+        from the pool. Chunk rows count up from the bottom of the
+        map, like the world, while the grid rows count down.
+        """
+        chunk_column, chunk_row = chunk
+        first_column = chunk_column * STREAMING_CHUNK_TILES
+        columns = range(
+            first_column,
+            min(first_column + STREAMING_CHUNK_TILES, self.width),
+        )
+        first_row = chunk_row * STREAMING_CHUNK_TILES
+        rows = range(
+            first_row, min(first_row + STREAMING_CHUNK_TILES, self.height)
+        )
+        tile_size = self.tile_size
+        for name, grid in self.grids.items():
+            prototypes = self.prototypes[name]
+            sprites = []
+            for row in reversed(rows):
+                start = (self.height - 1 - row) * self.width
+                for column in columns:
+                    value = grid[start + column]
+                    if not value:
+                        continue
+                    prototype = prototypes[value]
+                    sprite = self.pool.pop() if self.pool else arcade.Sprite()
+                    sprite.texture = prototype.texture
+                    sprite.scale = prototype.scale
+                    sprite.color = prototype.color
+                    sprite.position = (
+                        column * tile_size + sprite.width / 2,
+                        row * tile_size + sprite.height / 2,
+                    )
+                    sprites.append(sprite)
+            self.sprite_lists[name].extend(sprites)
+            self.chunk_sprites[(name, chunk)] = sprites
+
+    def unload_chunk(self, chunk):
+        """
+        Removes the sprites of a chunk and returns them to the pool.
+        """
+        for name, sprite_list in self.sprite_lists.items():
+            sprites = self.chunk_sprites.pop((name, chunk), [])
+            for sprite in sprites:
+                sprite_list.remove(sprite)
+            self.pool.extend(sprites)
+
+    def reload_layer(self, layer, tiled_map):
+        """
+        Reads a layer again after its file was edited, and places
+        the sprites of the loaded chunks again.
+        """
+        active = self.active
+        for chunk in active:
+            self.unload_chunk(chunk)
+        self.load_layer(layer, tiled_map)
+        for chunk in active:
+            self.load_chunk(chunk)
+        self.sort_overlapping()
+
+    def cells(self, name):
+        """
+        Yields the (column, row) of every tile of a streamed layer,
+        with row 0 at the bottom of the map.
+        """
+        for index, value in enumerate(self.grids[name]):
+            if value:
+                yield index % self.width, self.height - 1 - index // self.width
+
+    def sprite_count(self):
+        """
+        Returns the number of sprites made for the loaded chunks
+        and kept in the pool.
+        """
+        return len(self.pool) + sum(
+            len(sprite_list) for sprite_list in self.sprite_lists.values()
+        )
+
+    def memory_bytes(self):
+        """
+        Returns the number of bytes used by the grids.
+        """
+        return sum(
+            grid.itemsize * len(grid) for grid in self.grids.values()
+        )
+
+
+class NavigationGrid:
+    """
+    This class finds the cells enemies can walk on from the Ground
+    layer of a level, and keeps a flow field that leads every
+    walkable cell near the player towards the player.
+    A cell is walkable when it is empty and has ground below it.
+    Enemies can walk to the next column on the same row, or step
+    one row up or down, so they never walk through a wall or
+    off the edge of a ledge.
+    The flow field is only refreshed when the player moves to a
+    different walkable cell, so each enemy finds its next move
+    with a single lookup instead of searching for a path.
+    """
+    def __init__(
+        self, width, height, cell_size, solid,
+        chase_radius=NAVIGATION_CHASE_RADIUS,
+    ):
+        """
+        Builds the walkable cells from a grid of solid cells,
+        stored row by row with row 0 at the bottom of the map.
+        """
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.solid = bytes(solid)
+        self.chase_radius = chase_radius
+
+        self.walkable = bytearray(width * height)
+        for index in range(width, width * height):
+            if not self.solid[index] and self.solid[index - width]:
+                self.walkable[index] = 1
+
+        # The flow field holds one MOVE_ value per cell. Only the
+        # cells reached by the last refresh are cleared again.
+        self.moves = bytearray(width * height)
+        self.reached = []
+        self.target = None
+
+    @classmethod
+    def from_tile_map(cls, tile_map, tile_streamer=None):
+        """
+        Builds the grid from the Ground layer of a tile map, or
+        from the grid of the layer when it is streamed.
+        """
+        width = tile_map.width
+        height = tile_map.height
+        cell_size = tile_map.tile_width * tile_map.scaling
+        solid = bytearray(width * height)
+        if tile_streamer and "Ground" in tile_streamer.grids:
+            for column, row in tile_streamer.cells("Ground"):
+                solid[row * width + column] = 1
+            return cls(width, height, cell_size, solid)
+        for sprite in tile_map.sprite_lists.get("Ground", []):
+            left = max(0, int(sprite.left // cell_size))
+            right = min(width - 1, int((sprite.right - 1) // cell_size))
+            bottom = max(0, int(sprite.bottom // cell_size))
+            top = min(height - 1, int((sprite.top - 1) // cell_size))
+            for row in range(bottom, top + 1):
+                for column in range(left, right + 1):
+                    solid[row * width + column] = 1
+        return cls(width, height, cell_size, solid)
+
+    def cell_of(self, x, bottom):
+        """
+        Returns the (column, row) cell an entity standing with
+        its feet at the given position is in.
+        """
+        return int(x // self.cell_size), round(bottom / self.cell_size)
+
+    def solid_at(self, x, y):
+        """
+        Returns whether a world position is inside a Ground cell.
+        Positions outside of the map are treated as empty.
+        """
+        column = int(x // self.cell_size)
+        row = int(y // self.cell_size)
+        return (
+            0 <= column < self.width
+            and 0 <= row < self.height
+            and self.solid[row * self.width + column] == 1
+        )
+
+    def is_walkable(self, column, row):
+        """
+        Returns whether a cell can be stood on.
+        """
+        return (
+            0 <= column < self.width
+            and 0 <= row < self.height
+            and self.walkable[row * self.width + column]
+        )
+
+    def step_row(self, column, row, next_column):
+        """
+        Returns the row an enemy ends up on when it walks from
+        a cell into the next column, or None if it cannot.
+        """
+        for next_row in (row, row + 1, row - 1):
+            if self.is_walkable(next_column, next_row):
+                return next_row
+        return None
+
+    def refresh(self, player_sprite):
+        """
+        Rebuilds the flow field with a breadth first search from
+        the player's cell, if the player is standing in a
+        different walkable cell than last time. While the player
+        is in the air the enemies keep heading to where the
+        player last stood.
+        """
+        column, row = self.cell_of(
+            player_sprite.center_x, player_sprite.bottom
+        )
+        if (column, row) == self.target or not self.is_walkable(column, row):
+            return
+        self.target = (column, row)
+
+        moves = self.moves
+        for index in self.reached:
+            moves[index] = MOVE_NONE
+        start = row * self.width + column
+        moves[start] = MOVE_HERE
+        self.reached = [start]
+
+        frontier = [(column, row)]
+        for _ in range(self.chase_radius):
+            next_frontier = []
+            for column, row in frontier:
+                # The neighbours move back towards this cell, so
+                # the left neighbour moves right and the other way.
+                for next_column, move in (
+                    (column - 1, MOVE_RIGHT),
+                    (column + 1, MOVE_LEFT),
+                ):
+                    for next_row in (row, row + 1, row - 1):
+                        if not self.is_walkable(next_column, next_row):
+                            continue
+                        index = next_row * self.width + next_column
+                        if moves[index]:
+                            continue
+                        moves[index] = move
+                        self.reached.append(index)
+                        next_frontier.append((next_column, next_row))
+            frontier = next_frontier
+
+    def chase_direction(self, column, row):
+        """
+        Returns the direction (-1, 0 or 1) an enemy in a cell
+        should walk to reach the player, 0 meaning it is already
+        in the player's cell, or None if the player is out of reach.
+        """
+        if not (0 <= column < self.width and 0 <= row < self.height):
+            return None
+        move = self.moves[row * self.width + column]
+        if move == MOVE_NONE:
+            return None
+        if move == MOVE_LEFT:
+            return -1
+        if move == MOVE_RIGHT:
+            return 1
+        return 0
+
+
+class SpellPool:
+    """
+    This class holds every magic spell projectile in the level.
+    The pool is allocated once with a fixed number of slots, and
+    the state of each slot is kept in arrays, so firing a spell
+    only reuses a free slot and never creates a sprite.
+    Each slot also has a sprite, which is hidden while the
+    slot is free and only used for drawing.
+    """
+    def __init__(self, capacity=SPELL_POOL_SIZE):
+        """
+        Allocates the arrays and sprites for every slot.
+        """
+        self.capacity = capacity
+        self.x = array.array("d", bytes(8 * capacity))
+        self.y = array.array("d", bytes(8 * capacity))
+        self.change_x = array.array("d", bytes(8 * capacity))
+        self.lifetime = array.array("i", bytes(4 * capacity))
+
+        # Free slots are taken from the end of the list, and the
+        # active slots are kept in the order they were fired.
+        self.free = list(range(capacity - 1, -1, -1))
+        self.active = []
+
+        # Spells are hit tested against their radius, so the
+        # texture only needs a plain box instead of a traced outline.
+        texture = arcade.make_soft_circle_texture(
+            SPELL_RADIUS * 2,
+            SPELL_COLOR,
+            name="magic_spell",
+            hit_box_algorithm=arcade.hitbox.algo_bounding_box,
+        )
+        self.sprite_list = arcade.SpriteList(capacity=capacity)
+        self.sprites = []
+        for _ in range(capacity):
+            sprite = arcade.Sprite(texture)
+            sprite.visible = False
+            self.sprites.append(sprite)
+            self.sprite_list.append(sprite)
+
+    def clear(self):
+        """
+        Frees every slot, such as when a level is loaded.
+        """
+        for index in self.active:
+            self.release(index)
+        self.active = []
+
+    def release(self, index):
+        """
+        Hides the sprite of a slot and returns the slot to the pool.
+        """
+        self.lifetime[index] = 0
+        self.sprites[index].visible = False
+        self.free.append(index)
+
+    def fire(self, x, y, direction):
+        """
+        Fires a spell from the given position in the direction
+        the caster faces. Nothing is fired if every slot is in use.
+        """
+        if not self.free:
+            return
+        index = self.free.pop()
+        self.x[index] = x
+        self.y[index] = y
+        self.change_x[index] = (
+            -SPELL_SPEED if direction == LEFT_FACING else SPELL_SPEED
+        )
+        self.lifetime[index] = SPELL_LIFETIME
+        sprite = self.sprites[index]
+        sprite.position = (x, y)
+        sprite.visible = True
+        self.active.append(index)
+
+    def live_sprites(self):
+        """
+        Returns the sprites of the active slots.
+        """
+        return [self.sprites[index] for index in self.active]
+
+    def update(self, enemy_list, navigation):
+        """
+        Moves every active spell and resolves its collisions.
+        Spells hitting the Ground are looked up in the solid
+        cells of the navigation grid, and spells hitting enemies
+        are found by hit_enemies().
+        """
+        if not self.active:
+            return
+        x = self.x
+        y = self.y
+        lifetime = self.lifetime
+        cell_size = SPELL_BROAD_PHASE_CELL
+        hit = set()
+
+        # Spells are bucketed by cell for the broad phase.
+        buckets = {}
+        for index in self.active:
+            x[index] += self.change_x[index]
+            lifetime[index] -= 1
+            if lifetime[index] <= 0 or navigation.solid_at(x[index], y[index]):
+                hit.add(index)
+                continue
+            cell = (int(x[index] // cell_size), int(y[index] // cell_size))
+            buckets.setdefault(cell, []).append(index)
+
+        if buckets:
+            self.hit_enemies(enemy_list, buckets, hit)
+
+        for index in hit:
+            self.release(index)
+        self.active = [index for index in self.active if index not in hit]
+        for index in self.active:
+            self.sprites[index].position = (x[index], y[index])
+
+    def hit_enemies(self, enemy_list, buckets, hit):
+        """
+        Damages the enemies touched by a spell and adds those
+        spells to the hit set. Enemies more than a cell away from
+        the area covered by the buckets are skipped by comparing
+        their centre, and the rest only test the spells in the
+        broad phase cells their hit box overlaps.
+        """
+        x = self.x
+        y = self.y
+        cell_size = SPELL_BROAD_PHASE_CELL
+        columns = [column for column, _ in buckets]
+        rows = [row for _, row in buckets]
+        low_x = (min(columns) - 1) * cell_size
+        high_x = (max(columns) + 2) * cell_size
+        low_y = (min(rows) - 1) * cell_size
+        high_y = (max(rows) + 2) * cell_size
+        for enemy in enemy_list:
+            if (
+                enemy.is_dead
+                or not low_x <= enemy.center_x <= high_x
+                or not low_y <= enemy.center_y <= high_y
+            ):
+                continue
+            # The enemy's hit box, grown by the spell's radius.
+            left = enemy.left - SPELL_RADIUS
+            right = enemy.right + SPELL_RADIUS
+            bottom = enemy.bottom - SPELL_RADIUS
+            top = enemy.top + SPELL_RADIUS
+
+            for column in range(
+                int(left // cell_size), int(right // cell_size) + 1
+            ):
+                for row in range(
+                    int(bottom // cell_size), int(top // cell_size) + 1
+                ):
+                    for index in buckets.get((column, row), ()):
+                        if (
+                            index not in hit
+                            and left <= x[index] <= right
+                            and bottom <= y[index] <= top
+                        ):
+                            # Each spell only hits one enemy.
+                            hit.add(index)
+                            enemy.take_damage(SPELL_DAMAGE)
+
+class MovingPlatforms:
+    """
+    This class moves the platforms of the Moving_Platforms layer.
+    Every platform follows a path made of straight segments, and
+    its position is worked out from the tick number alone, so the
+    whole layer is moved in one pass without any build up of error.
+    The path is read from the platform's properties in the TMX file:
+
+    - change_x with boundary_left and boundary_right moves it
+      sideways, keeping its edges between the boundaries.
+    - change_y with boundary_bottom and boundary_top moves it
+      up and down in the same way.
+    - path lists waypoints as "x,y; x,y; ..." offsets in pixels
+      from where it starts, travelled at the speed property.
+      A path that ends at "0,0" is looped, any other path is
+      travelled back and forth.
+
+    The physics engine only sees the platforms near the player,
+    and the platform the player stands on carries them along.
+    """
+    def __init__(self, sprite_list, start_tick, wall_list):
+        """
+        Reads the path of every platform. The start tick is the
+        simulation tick the level was loaded on.
+        """
+        self.sprites = list(sprite_list)
+        self.start_tick = start_tick
+        self.wall_list = wall_list
+        count = len(self.sprites)
+        self.x = array.array("d", bytes(8 * count))
+        self.y = array.array("d", bytes(8 * count))
+        self.speed = array.array("d", bytes(8 * count))
+        self.offset = array.array("d", bytes(8 * count))
+        self.paths = []
+        self.moving = []
+        self.buckets = {}
+
+        for index, platform in enumerate(self.sprites):
+            self.x[index] = platform.center_x
+            self.y[index] = platform.center_y
+            points, loop, speed, start = self.read_path(platform)
+            cumulative = [0.0]
+            for (x0, y0), (x1, y1) in zip(points, points[1:]):
+                cumulative.append(
+                    cumulative[-1] + ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5
+                )
+            total = cumulative[-1]
+            self.paths.append((points, cumulative, total, loop))
+            self.speed[index] = speed
+            self.offset[index] = start
+            if speed and total:
+                self.moving.append(index)
+
+            # Buckets the platform into every column its path
+            # crosses, so the platforms near a position are found
+            # without looking at the rest of the level.
+            path_left = min(x for x, _ in points) - platform.width
+            path_right = max(x for x, _ in points) + platform.width
+            for column in range(
+                int(path_left // PLATFORM_SYNC_RANGE),
+                int(path_right // PLATFORM_SYNC_RANGE) + 1,
+            ):
+                self.buckets.setdefault(column, []).append(index)
+
+            # The platforms are only moved by this class, so the
+            # physics engine must not move them as well.
+            platform.change_x = 0
+            platform.change_y = 0
+
+        # The platforms the physics engine collides the player with.
+        self.collision_list = arcade.SpriteList()
+        self.nearby = set()
+
+        # The sprites moved by the last update, which on_draw
+        # interpolates between ticks.
+        self.moved = []
+
+    def read_path(self, platform):
+        """
+        Returns the waypoints of a platform's path, whether it
+        loops, its speed in pixels per tick, and how far along
+        the path it starts.
+        """
+        properties = platform.properties
+        x = platform.center_x
+        y = platform.center_y
+
+        if "path" in properties:
+            points = [(x, y)]
+            for waypoint in str(properties["path"]).split(";"):
+                if waypoint.strip():
+                    offset_x, offset_y = waypoint.split(",")
+                    points.append((x + float(offset_x), y + float(offset_y)))
+            loop = len(points) > 2 and points[-1] == points[0]
+            speed = abs(properties.get("speed", PLATFORM_DEFAULT_SPEED))
+            return points, loop, speed, 0.0
+
+        # Otherwise the platform goes back and forth along one axis,
+        # with the same defaults the boundaries always had.
+        if properties.get("change_y", 0):
+            change = properties["change_y"]
+            half = platform.height / 2
+            low = properties.get(
+                "boundary_bottom", y - PLATFORM_TRAVEL_DISTANCE
+            ) + half
+            high = properties.get(
+                "boundary_top", y + PLATFORM_TRAVEL_DISTANCE
+            ) - half
+            points = [(x, low), (x, high)]
+            position = y
+        else:
+            change = properties.get("change_x", 0)
+            half = platform.width / 2
+            low = properties.get(
+                "boundary_left", x - PLATFORM_TRAVEL_DISTANCE
+            ) + half
+            high = properties.get(
+                "boundary_right", x + PLATFORM_TRAVEL_DISTANCE
+            ) - half
+            points = [(low, y), (high, y)]
+            position = x
+
+        if high <= low:
+            return [(x, y)], False, 0.0, 0.0
+        start = min(max(position - low, 0.0), high - low)
+        # A platform starting in the negative direction begins on
+        # the way back along its path.
+        if change < 0:
+            start = 2 * (high - low) - start
+        return points, False, abs(change), start
+
+    def update_positions(self, tick, indices=None):
+        """
+        Works out the position of the given platforms at a tick,
+        or of every moving platform.
+        """
+        elapsed = tick - self.start_tick
+        for index in self.moving if indices is None else indices:
+            points, cumulative, total, loop = self.paths[index]
+            if not total or not self.speed[index]:
+                continue
+            distance = self.offset[index] + self.speed[index] * elapsed
+            if loop:
+                distance %= total
+            else:
+                distance %= 2 * total
+                if distance > total:
+                    distance = 2 * total - distance
+
+            segment = min(
+                bisect.bisect_right(cumulative, distance) - 1,
+                len(points) - 2,
+            )
+            (x0, y0), (x1, y1) = points[segment], points[segment + 1]
+            length = cumulative[segment + 1] - cumulative[segment]
+            fraction = (distance - cumulative[segment]) / length
+            self.x[index] = x0 + (x1 - x0) * fraction
+            self.y[index] = y0 + (y1 - y0) * fraction
+
+    def platforms_between(self, left, right):
+        """
+        Returns the platforms whose paths could reach between
+        two x positions.
+        """
+        found = set()
+        for column in range(
+            int(left // PLATFORM_SYNC_RANGE),
+            int(right // PLATFORM_SYNC_RANGE) + 1,
+        ):
+            found.update(self.buckets.get(column, ()))
+        return found
+
+    def platform_under(self, player_sprite):
+        """
+        Returns the index of the nearby platform the player is
+        standing on, or None.
+        """
+        if player_sprite.change_y > 0:
+            return None
+        for index in self.nearby:
+            platform = self.sprites[index]
+            if (
+                abs(player_sprite.bottom - platform.top)
+                <= PLATFORM_CARRY_TOLERANCE
+                and player_sprite.right > platform.left
+                and player_sprite.left < platform.right
+            ):
+                return index
+        return None
 
-class EnemyCharacter(arcade.Sprite):
+    def update(self, tick, player_sprite, view):
+        """
+        Moves the platforms to their positions at a tick and
+        carries the player with the platform under them. Only the
+        sprites near the player or inside the (left, right, bottom,
+        top) view are moved, and only the platforms near the player
+        are kept in the collision list.
+        """
+        left, right, bottom, top = view
+        left -= PLATFORM_COLLISION_RANGE
+        right += PLATFORM_COLLISION_RANGE
+        bottom -= PLATFORM_COLLISION_RANGE
+        top += PLATFORM_COLLISION_RANGE
+        player_x = player_sprite.center_x
+        player_y = player_sprite.center_y
+        candidates = self.platforms_between(
+            min(left, player_x - PLATFORM_SYNC_RANGE),
+            max(right, player_x + PLATFORM_SYNC_RANGE),
+        )
+
+        carrier = self.platform_under(player_sprite)
+        if carrier is not None:
+            start_x = self.x[carrier]
+            start_y = self.y[carrier]
+
+        self.update_positions(tick, candidates)
+
+        if carrier is not None:
+            # The player is not pushed into a wall by the platform.
+            change_x = self.x[carrier] - start_x
+            player_sprite.center_x += change_x
+            player_sprite.center_y += self.y[carrier] - start_y
+            if arcade.check_for_collision_with_list(
+                player_sprite, self.wall_list
+            ):
+                player_sprite.center_x -= change_x
+            player_x = player_sprite.center_x
+            player_y = player_sprite.center_y
+
+        self.moved = []
+        nearby = set()
+        for index in candidates:
+            x = self.x[index]
+            y = self.y[index]
+            near_x = abs(x - player_x)
+            near_y = abs(y - player_y)
+            if (
+                near_x < PLATFORM_COLLISION_RANGE
+                and near_y < PLATFORM_COLLISION_RANGE
+            ):
+                nearby.add(index)
+            in_view = left < x < right and bottom < y < top
+            in_range = (
+                near_x < PLATFORM_SYNC_RANGE and near_y < PLATFORM_SYNC_RANGE
+            )
+            if self.speed[index] and (in_view or in_range):
+                sprite = self.sprites[index]
+                sprite.position = (x, y)
+                self.moved.append(sprite)
+
+        for index in self.nearby - nearby:
+            self.collision_list.remove(self.sprites[index])
+        for index in nearby - self.nearby:
+            self.collision_list.append(self.sprites[index])
+        self.nearby = nearby
+
+
+class RewindBuffer:
     """
-    This class represents the  enemy
-    character in the game. The enemy can walk back
-    and forth between  boundaries, detect and chase the player,
-    attack when in range, take damage with animation
-    and sound feedback, and eventually die.
+    This class keeps a history of the last few seconds of play so
+    that it can be stepped back one tick at a time. Each tick is
+    stored as one record of numbers: the player's values followed
+    by the values of every enemy, each ending with the index of the
+    sprite's appearance, which is its texture or the animation its
+    sprite list plays. Moving platforms are not stored, since their
+    positions follow from the tick number.
+
+    Every few ticks a keyframe holds the whole record, and the
+    ticks in between only hold the (position, value) pairs that
+    changed since the tick before. All buffers are allocated up
+    front and reused as rings. When the history is full the oldest
+    keyframe and the ticks after it are dropped together, so the
+    remaining history always starts at a keyframe.
     """
     def __init__(
         self,
-        x,
-        y,
-        max_health,
-        left_boundary,
-        right_boundary,
+        player_sprite,
+        enemy_list,
+        seconds=REWIND_SECONDS,
+        keyframe_interval=REWIND_KEYFRAME_INTERVAL,
+        delta_capacity=REWIND_DELTA_CAPACITY,
+    ):
+        """
+        Allocates the history for the player and the enemies of
+        a level. The enemies must stay the same for the level.
+        """
+        self.entities = [(player_sprite, PLAYER_REWIND_FIELDS)]
+        self.entities += [(enemy, ENEMY_REWIND_FIELDS) for enemy in enemy_list]
+        self.getters = {
+            fields: operator.attrgetter(
+                *(name for name, _ in fields), "appearance"
+            )
+            for fields in (PLAYER_REWIND_FIELDS, ENEMY_REWIND_FIELDS)
+        }
+        self.offsets = []
+        record_size = 0
+        for _, fields in self.entities:
+            self.offsets.append(record_size)
+            record_size += len(fields) + 1
+        self.record_size = record_size
+
+        # The ring of stored ticks. Records are numbered from the
+        # first one ever stored, and record n lives in slot
+        # n % capacity.
+        self.capacity = max(2, round(seconds / SIMULATION_TICK_RATE))
+        self.keyframe_interval = keyframe_interval
+        self.ticks = array.array("q", bytes(8 * self.capacity))
+        self.keyframe_slot = array.array("i", [-1] * self.capacity)
+        self.delta_start = array.array("q", bytes(8 * self.capacity))
+        self.delta_count = array.array("i", bytes(4 * self.capacity))
+        self.first = 0
+        self.count = 0
+
+        # Keyframes are at least keyframe_interval records apart,
+        # so this many slots always cover the stored ticks.
+        self.keyframe_count = self.capacity // keyframe_interval + 2
+        self.keyframes = array.array(
+            "d", bytes(8 * self.keyframe_count * record_size)
+        )
+        self.next_keyframe = 0
+        self.last_keyframe = None
+
+        # The pool of changed values, used as a ring between
+        # delta_tail and delta_head. A tick can always fit.
+        self.delta_capacity = max(delta_capacity, record_size)
+        self.delta_positions = array.array(
+            "I", bytes(4 * self.delta_capacity)
+        )
+        self.delta_values = array.array("d", bytes(8 * self.delta_capacity))
+        self.delta_head = 0
+        self.delta_tail = 0
+
+        # The newest record, and the values each sprite had in it,
+        # which are compared to find what changed.
+        self.current = array.array("d", bytes(8 * record_size))
+        self.previous = [None] * len(self.entities)
+
+        # The entities that are compared each tick. Enemies that
+        # have settled, such as baked corpses, are left out until
+        # stepping back changes them again.
+        self.watched = list(range(len(self.entities)))
+        self.settled = set()
+        self.entity_index = {
+            sprite: index for index, (sprite, _) in enumerate(self.entities)
+        }
+
+        # The record that was newest before stepping back, which
+        # restore() compares to so it only touches changed sprites.
+        self.before = array.array("d", bytes(8 * record_size))
+        self.textures = []
+        self.texture_index = {}
+
+    def evict(self):
+        """
+        Drops the oldest keyframe and the ticks that follow it.
+        """
+        self.first += 1
+        self.count -= 1
+        while (
+            self.count
+            and self.keyframe_slot[self.first % self.capacity] < 0
+        ):
+            self.first += 1
+            self.count -= 1
+        if self.count:
+            self.delta_tail = self.delta_start[self.first % self.capacity]
+        else:
+            self.delta_tail = self.delta_head
+            self.last_keyframe = None
+
+    def capture(self, tick):
+        """
+        Stores the state of the player and the enemies at a tick.
+        """
+        changes = []
+        current = self.current
+        entities = self.entities
+        for index in self.watched:
+            sprite, fields = entities[index]
+            values = self.getters[fields](sprite)
+            previous = self.previous[index]
+            if values == previous:
+                continue
+            self.previous[index] = values
+            offset = self.offsets[index]
+            texture = values[-1]
+            for position, value in enumerate(values[:-1], offset):
+                if previous is None or value != previous[position - offset]:
+                    current[position] = value
+                    changes.append(position)
+            if previous is None or texture is not previous[-1]:
+                if texture not in self.texture_index:
+                    self.texture_index[texture] = len(self.textures)
+                    self.textures.append(texture)
+                position = offset + len(fields)
+                current[position] = self.texture_index[texture]
+                changes.append(position)
+
+        if self.count == self.capacity:
+            self.evict()
+        number = self.first + self.count
+        slot = number % self.capacity
+        keyframe = (
+            self.last_keyframe is None
+            or number - self.last_keyframe >= self.keyframe_interval
+        )
+        if not keyframe:
+            while (
+                self.delta_capacity - (self.delta_head - self.delta_tail)
+                < len(changes)
+            ):
+                self.evict()
+            # Evicting everything leaves no keyframe to build on.
+            keyframe = self.last_keyframe is None
+
+        self.ticks[slot] = tick
+        self.delta_start[slot] = self.delta_head
+        if keyframe:
+            start = self.next_keyframe * self.record_size
+            self.keyframes[start:start + self.record_size] = current
+            self.keyframe_slot[slot] = self.next_keyframe
+            self.next_keyframe = (
+                self.next_keyframe + 1
+            ) % self.keyframe_count
+            self.last_keyframe = number
+            self.delta_count[slot] = 0
+        else:
+            head = self.delta_head
+            for position in changes:
+                ring = head % self.delta_capacity
+                self.delta_positions[ring] = position
+                self.delta_values[ring] = current[position]
+                head += 1
+            self.keyframe_slot[slot] = -1
+            self.delta_count[slot] = len(changes)
+            self.delta_head = head
+        if self.count == 0:
+            self.delta_tail = self.delta_start[slot]
+        self.count += 1
+
+    def settle(self, sprites):
+        """
+        Stops comparing the given sprites each tick, since their
+        state will not change again unless they are stepped back.
+        Their values stay in the records as they were last stored.
+        """
+        if not sprites:
+            return
+        self.settled.update(self.entity_index[sprite] for sprite in sprites)
+        self.watched = [
+            index for index in self.watched if index not in self.settled
+        ]
+
+    def step_back(self):
+        """
+        Drops the newest tick from the history and rebuilds the
+        record of the tick before it, which restore() then puts
+        back on the sprites. Returns the tick number of that
+        record, or None when there is no older tick to go back to.
+        """
+        if self.count < 2:
+            return None
+        self.count -= 1
+        newest = self.first + self.count
+        self.delta_head = self.delta_start[newest % self.capacity]
+
+        # Starts from the nearest keyframe and replays the changes
+        # of the ticks after it.
+        number = newest - 1
+        while self.keyframe_slot[number % self.capacity] < 0:
+            number -= 1
+        self.last_keyframe = number
+        start = self.keyframe_slot[number % self.capacity] * self.record_size
+        current = self.current
+        self.before[:] = current
+        current[:] = self.keyframes[start:start + self.record_size]
+        first = self.delta_start[(number + 1) % self.capacity]
+        last = self.delta_start[newest % self.capacity]
+        for start, end in self.delta_ranges(first, last):
+            for position, value in zip(
+                self.delta_positions[start:end], self.delta_values[start:end]
+            ):
+                current[position] = value
+        return self.ticks[(newest - 1) % self.capacity]
+
+    def delta_ranges(self, first, last):
+        """
+        Returns the (start, end) ranges of the delta pool that
+        hold the changes numbered from first up to last, which
+        are split in two where the ring wraps around.
+        """
+        if first == last:
+            return ()
+        start = first % self.delta_capacity
+        end = start + last - first
+        if end <= self.delta_capacity:
+            return ((start, end),)
+        return ((start, self.delta_capacity), (0, end - self.delta_capacity))
+
+    def restore(self):
+        """
+        Puts the values of the newest record back on the sprites.
+        Only the values that differ from the sprite's are set.
+        """
+        current = self.current
+        before = self.before
+        unsettled = []
+        for index, (sprite, fields) in enumerate(self.entities):
+            offset = self.offsets[index]
+            end = offset + len(fields) + 1
+            restored = current[offset:end]
+            if restored == before[offset:end]:
+                continue
+            if index in self.settled:
+                unsettled.append(index)
+            values = self.previous[index]
+            for (name, kind), value, old in zip(fields, restored, values):
+                if value != old:
+                    setattr(sprite, name, kind(value))
+            texture = self.textures[int(restored[-1])]
+            if texture is not values[-1]:
+                sprite.appearance = texture
+            self.previous[index] = self.getters[fields](sprite)
+
+        # Settled sprites that were stepped back are compared again.
+        if unsettled:
+            self.settled.difference_update(unsettled)
+            self.watched = sorted(self.watched + unsettled)
+
+    def seconds(self):
+        """
+        Returns how many seconds of play the history holds.
+        """
+        return self.count * SIMULATION_TICK_RATE
+
+    def memory_bytes(self):
+        """
+        Returns the bytes allocated for the history, which stay
+        the same however long the level is played.
+        """
+        buffers = (
+            self.ticks,
+            self.keyframe_slot,
+            self.delta_start,
+            self.delta_count,
+            self.keyframes,
+            self.delta_positions,
+            self.delta_values,
+            self.current,
+            self.before,
+        )
+        return sum(len(buffer) * buffer.itemsize for buffer in buffers)
+
+    def bytes_per_second(self):
+        """
+        Returns the bytes of keyframes and changes used by each
+        second of the history that is stored.
+        """
+        if not self.count:
+            return 0.0
+        keyframes = sum(
+            self.keyframe_slot[(self.first + offset) % self.capacity] >= 0
+            for offset in range(self.count)
+        )
+        used = (
+            keyframes * self.record_size * self.keyframes.itemsize
+            + (self.delta_head - self.delta_tail)
+            * (self.delta_positions.itemsize + self.delta_values.itemsize)
+        )
+        return used / self.seconds()
+
+
+class AnimatedSpriteList(arcade.SpriteList):
+    """
+    This sprite list draws characters whose animations are played
+    on the GPU. The textures of an animation, in both directions,
+    are added to the texture atlas once, and their atlas slots are
+    kept in a frame table. Each sprite then only has the entry of
+    its animation in the table, how many frames it has, how long
+    each frame is shown and the tick the animation started on, and
+    the vertex shader works out the frame from the current tick.
+
+    The animation of a sprite is only written when it changes, so
+    a sprite that keeps playing the same animation costs nothing to
+    draw. Sprites that never play an animation are drawn with their
+    own texture, like in any other sprite list.
+
+    The list adds its buffer and shader through the internals of
+    arcade's SpriteList, so it refuses to run on any other version
+    of arcade than ANIMATED_SPRITE_ARCADE_VERSION.
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        Creates the sprite list with an empty frame table. The
+        clock is the tick the animations are drawn at, and is set
+        by the game every tick.
+        """
+        if arcade.version.VERSION != ANIMATED_SPRITE_ARCADE_VERSION:
+            raise RuntimeError(
+                f"Animating on the GPU needs arcade "
+                f"{ANIMATED_SPRITE_ARCADE_VERSION}, but arcade "
+                f"{arcade.version.VERSION} is installed. Install that "
+                f"version or run the game with --cpu-animation."
+            )
+        self.clock = 0
+        self.clips = {}
+        self.clip_textures = []
+        self.frame_textures = []
+        self.frame_table = None
+        self.frame_table_size = 0
+        self.animation_buffer = None
+        self._sprite_animation_data = array.array("f")
+        self._sprite_animation_changed = True
+        super().__init__(*args, **kwargs)
+
+    def clip(self, textures, direction):
+        """
+        Returns the entry in the frame table of the frames of an
+        animation facing a direction, adding the frames of both
+        directions the first time the animation is played.
+        """
+        key = (id(textures), direction)
+        offset = self.clips.get(key)
+        if offset is None:
+            # The texture lists are kept, so their ids stay unique.
+            self.clip_textures.append(textures)
+            for facing in (RIGHT_FACING, LEFT_FACING):
+                self.clips[(id(textures), facing)] = len(
+                    self.frame_textures
+                )
+                self.frame_textures += [pair[facing] for pair in textures]
+            offset = self.clips[key]
+        return offset
+
+    def play(self, sprite, textures, direction, ticks, ticks_per_frame,
+             loop):
+        """
+        Plays an animation on a sprite, which has been playing for
+        the given number of ticks. A looping animation starts over
+        after its last frame, and any other animation stays on it.
+        """
+        frames = len(textures)
+        origin = self.clock - ticks
+        if loop:
+            origin %= frames * ticks_per_frame
+        else:
+            frames = -frames
+        self.set_animation(
+            sprite,
+            (self.clip(textures, direction), frames, ticks_per_frame, origin),
+        )
+
+    def show(self, sprite, textures, direction, frame):
+        """
+        Shows one frame of an animation on a sprite until it is
+        told to show something else.
+        """
+        self.set_animation(
+            sprite, (self.clip(textures, direction) + frame, -1, 1, 0)
+        )
+
+    def set_animation(self, sprite, animation):
+        """
+        Writes the animation of a sprite into its slot, if it is
+        not the one the sprite already plays.
+        """
+        if animation == sprite.animation_state:
+            return
+        sprite.animation_state = animation
+        # A sprite that was taken out of the list keeps its
+        # animation, which is written if it is added again.
+        slot = self.sprite_slot.get(sprite)
+        if slot is None:
+            return
+        slot *= 4
+        self._sprite_animation_data[slot:slot + 4] = array.array(
+            "f", animation
+        )
+        self._sprite_animation_changed = True
+
+    def _update_all(self, sprite):
+        """
+        Writes all the data of a sprite into its slot, including
+        its animation, which is empty for sprites without one.
+        """
+        super()._update_all(sprite)
+        if len(self._sprite_animation_data) < self._buf_capacity * 4:
+            self.fit_animation_data()
+        animation = getattr(sprite, "animation_state", None)
+        slot = self.sprite_slot[sprite] * 4
+        self._sprite_animation_data[slot:slot + 4] = array.array(
+            "f", animation or (0, 0, 1, 0)
+        )
+        self._sprite_animation_changed = True
+
+    def _grow_sprite_buffers(self):
+        """
+        Grows the animation data along with the other sprite data.
+        """
+        super()._grow_sprite_buffers()
+        self.fit_animation_data()
+
+    def fit_animation_data(self):
+        """
+        Makes the animation data, and its buffer once the list has
+        been initialized, as large as the capacity of the list.
+        """
+        missing = self._buf_capacity * 4 - len(self._sprite_animation_data)
+        if missing > 0:
+            self._sprite_animation_data.extend([0.0] * missing)
+        elif missing < 0:
+            del self._sprite_animation_data[missing:]
+        if (
+            self.animation_buffer is not None
+            and self.animation_buffer.size != self._buf_capacity * 16
+        ):
+            self.animation_buffer.orphan(size=self._buf_capacity * 16)
+        self._sprite_animation_changed = True
+
+    def clear(self, *args, **kwargs):
+        """
+        Removes every sprite, emptying their animation data too.
+        """
+        self._sprite_animation_data = array.array("f")
+        super().clear(*args, **kwargs)
+        self.fit_animation_data()
+
+    def _init_deferred(self):
+        """
+        Creates the OpenGL resources of the list, with a buffer for
+        the animations of the sprites next to arcade's buffers and
+        the shader that reads them.
+        """
+        if self._initialized:
+            return
+        super()._init_deferred()
+        data = self._data
+        self.animation_buffer = self.ctx.buffer(
+            reserve=self._buf_capacity * 16
+        )
+        self.fit_animation_data()
+        data._geometry = self.ctx.geometry(
+            [
+                gl.BufferDescription(
+                    data._storage_pos_angle, "4f", ["in_pos"]
+                ),
+                gl.BufferDescription(data._storage_size, "2f", ["in_size"]),
+                gl.BufferDescription(
+                    data._storage_texture_id, "1f", ["in_texture"]
+                ),
+                gl.BufferDescription(
+                    data._storage_color, "4f1", ["in_color"]
+                ),
+                gl.BufferDescription(
+                    self.animation_buffer, "4f", ["in_animation"]
+                ),
+            ],
+            index_buffer=data._storage_index,
+            index_element_size=4,
+        )
+        data.program = animated_sprite_program(self.ctx)
+        self.frame_table = None
+        self.frame_table_size = 0
+        self._sprite_animation_changed = True
+
+    def _write_sprite_buffers_to_gpu(self):
+        """
+        Writes the changed sprite data to the GPU, including the
+        animations and any frames added to the frame table.
+        """
+        super()._write_sprite_buffers_to_gpu()
+        if self._sprite_animation_changed:
+            self.animation_buffer.orphan()
+            self.animation_buffer.write(self._sprite_animation_data)
+            self._sprite_animation_changed = False
+        if self.frame_table_size != len(self.frame_textures):
+            self.write_frame_table()
+
+    def write_frame_table(self):
+        """
+        Adds the frames to the texture atlas and writes their atlas
+        slots into the frame table.
+        """
+        slots = array.array(
+            "f",
+            (self._atlas.add(texture)[0] for texture in self.frame_textures),
+        )
+        rows = -(-len(slots) // ANIMATION_TABLE_WIDTH)
+        slots.extend([0.0] * (rows * ANIMATION_TABLE_WIDTH - len(slots)))
+        if self.frame_table is None or self.frame_table.height != rows:
+            self.frame_table = self.ctx.texture(
+                (ANIMATION_TABLE_WIDTH, rows),
+                components=1,
+                dtype="f4",
+                filter=(self.ctx.NEAREST, self.ctx.NEAREST),
+            )
+        self.frame_table.write(slots)
+        self.frame_table_size = len(self.frame_textures)
+
+    def draw(self, **kwargs):
+        """
+        Draws the sprites with their animations at the clock's tick.
+        """
+        if not len(self):
+            return
+        self._init_deferred()
+        self._write_sprite_buffers_to_gpu()
+        program = self._data.program
+        program["clock"] = self.clock
+        if self.frame_table is not None:
+            self.frame_table.use(2)
+        super().draw(**kwargs)
+
+
+def animated_sprite_program(ctx):
+    """
+    Returns the shader program of the animated sprite lists of a
+    context, loading it the first time. It is arcade's sprite list
+    program with the vertex shader that plays the animations.
+    """
+    program = animated_sprite_programs.get(ctx)
+    if program is None:
+        program = ctx.load_program(
+            vertex_shader=os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                ANIMATED_SPRITE_SHADER,
+            ),
+            geometry_shader=(
+                ":system:shaders/sprites/sprite_list_geometry_cull_geo.glsl"
+            ),
+            fragment_shader=(
+                ":system:shaders/sprites/sprite_list_geometry_fs.glsl"
+            ),
+        )
+        program["sprite_texture"] = 0
+        program["uv_texture"] = 1
+        program["frame_table"] = 2
+        animated_sprite_programs[ctx] = program
+    return program
+
+
+# The animated sprite program of each OpenGL context.
+animated_sprite_programs = {}
+
+
+class AnimatedCharacter:
+    """
+    This class gives the player and enemy characters the methods
+    that show the frames of their animations. When a character has
+    an animator, which is the AnimatedSpriteList drawing it, the
+    list is told which animation plays and since when, and the GPU
+    advances the frames. Otherwise the texture of the frame is set.
+
+    The textures and direction of the animation the animator was
+    last told to play are kept, so a character can skip telling it
+    again while that animation carries on.
+    """
+    __slots__ = ()
+
+    def play_animation(self, textures, direction, ticks,
+                       ticks_per_frame=UPDATES_PER_FRAME, loop=False):
+        """
+        Shows the frame of an animation that has been playing for
+        the given number of ticks. A looping animation starts over
+        after its last frame, and any other animation stays on it.
+        """
+        if self.animator is not None:
+            self.playing_textures = textures
+            self.playing_direction = direction
+            self.animator.play(
+                self, textures, direction, ticks, ticks_per_frame, loop
+            )
+            return
+        frame = ticks // ticks_per_frame
+        if loop:
+            frame %= len(textures)
+        else:
+            frame = min(frame, len(textures) - 1)
+        self.texture = textures[frame][direction]
+
+    def show_frame(self, textures, direction, frame):
+        """
+        Shows one frame of an animation, such as the frames of
+        the jump that follow the player's speed instead of time.
+        """
+        if self.animator is not None:
+            self.playing_textures = None
+            self.animator.show(self, textures, direction, frame)
+            return
+        self.texture = textures[frame][direction]
+
+    @property
+    def appearance(self):
+        """
+        What the character looks like: its animation when it has
+        an animator, and its texture otherwise. It is stored in the
+        rewind history and put back when stepping back.
+        """
+        if self.animator is not None:
+            return self.animation_state
+        return self.texture
+
+    @appearance.setter
+    def appearance(self, appearance):
+        self.playing_textures = None
+        if self.animator is not None:
+            if appearance is not None:
+                self.animator.set_animation(self, appearance)
+            return
+        self.texture = appearance
+
+
+class EnemyArchetype:
+    """
+    This class holds what all the enemies of one type share, their
+    textures and their tuning from ENEMY_ARCHETYPES, along with the
+    game view they belong to. It is made once per type, so every
+    enemy only keeps its own state and a reference to its type.
+    """
+    def __init__(
+        self,
+        name,
+        game_view,
         walk_textures,
         attack_textures,
         takedamage_textures,
         death_textures,
-        game_view,
     ):
         """
-        Initializes the enemy's position, health, movement limits,
-        animations, and game context. Upon creation,
-        the enemy starts walking from its spawn
-        point and is prepared with
-        texture sets for all possible actions. It also stores a
-        reference to the main game view
-        to access sounds when taking damage.
+        Initializes the archetype with the textures for each
+        animation and the tuning of the named type.
         """
-        super().__init__(walk_textures[0][0], scale=ENEMY_SCALING)
-        self.center_x = x
-        self.center_y = y
-
+        spec = ENEMY_ARCHETYPES[name]
+        self.name = name
+        self.index = list(ENEMY_ARCHETYPES).index(name)
         self.game_view = game_view
 
-        self.max_health = max_health
-        self.current_health = max_health
-        self.left_boundary = left_boundary
-        self.right_boundary = right_boundary
-
         # Textures for animations in each state
         self.walk_textures = walk_textures
         self.attack_textures = attack_textures
         self.takedamage_textures = takedamage_textures
         self.death_textures = death_textures
 
+        self.max_health = spec["health"]
+        self.damage = spec["damage"]
+        self.patrol_speed = spec["patrol_speed"]
+        self.chase_speed = spec["chase_speed"]
+        self.attack_cooldown = spec["attack_cooldown"]
+        self.attack_range_x, self.attack_range_y = spec["attack_range"]
+        self.detection_range_x, self.detection_range_y = (
+            spec["detection_range"]
+        )
+        self.color = spec["color"]
+
+
+class EnemyCharacter(AnimatedCharacter, arcade.BasicSprite):
+    """
+    This class represents the  enemy
+    character in the game. The enemy can walk back
+    and forth between  boundaries, detect and chase the player,
+    attack when in range, take damage with animation
+    and sound feedback, and eventually die.
+    Its textures and tuning come from its EnemyArchetype. It is a
+    BasicSprite, which unlike arcade.Sprite has no dictionary or
+    physics state, and the state it keeps for itself is held in
+    slots.
+    """
+    __slots__ = (
+        "archetype",
+        "change_x",
+        "current_health",
+        "left_boundary",
+        "right_boundary",
+        "is_attacking",
+        "is_taking_damage",
+        "is_dead",
+        "has_dealt_damage",
+        "cur_texture",
+        "direction",
+        "takedamage_frame",
+        "attack_cooldown",
+        "navigation",
+        "ground_column",
+        "ground_row",
+        "animator",
+        "animation_state",
+        "playing_textures",
+        "playing_direction",
+    )
+
+    def __init__(self, x, y, archetype, left_boundary, right_boundary):
+        """
+        Initializes the enemy's position, health and movement
+        limits. Upon creation, the enemy starts walking from its
+        spawn point with the first walking texture of its archetype.
+        """
+        super().__init__(
+            archetype.walk_textures[0][0], scale=ENEMY_SCALING
+        )
+        self.center_x = x
+        self.center_y = y
+        if archetype.color != (255, 255, 255):
+            self.color = archetype.color
+
+        self.archetype = archetype
+        self.current_health = archetype.max_health
+        self.left_boundary = left_boundary
+        self.right_boundary = right_boundary
+
         # Boolean flags to track current behavior
         # used to prevent repeated damage per attack.        
         self.is_attacking = False
@@ -153,13 +3279,94 @@ class EnemyCharacter(arcade.Sprite):
         self.direction = RIGHT_FACING
         self.takedamage_frame = 0
         self.attack_cooldown = 0
-        self.attack_cooldown_max = ENEMY_ATTACK_COOLDOWN
 
-        self.change_x = 1
+        self.change_x = archetype.patrol_speed
+
+        # The navigation grid of the level and the cell the enemy
+        # stands in. Without a grid the enemy ignores the terrain.
+        self.navigation = None
+        self.ground_column = 0
+        self.ground_row = 0
+
+        # The sprite list that plays the enemy's animations on the
+        # GPU, if any, and the animation it was last told to play.
+        self.animator = None
+        self.animation_state = None
+        self.playing_textures = None
+        self.playing_direction = RIGHT_FACING
+
+    @property
+    def max_health(self):
+        """
+        The health the enemy starts with, from its archetype.
+        """
+        return self.archetype.max_health
+
+    @property
+    def is_corpse(self):
+        """
+        Whether the enemy is dead and its death animation has
+        finished, after which nothing about it changes any more.
+        """
+        return (
+            self.is_dead
+            and self.cur_texture
+            >= len(self.archetype.death_textures) * UPDATES_PER_FRAME
+        )
+
+    def place_on_navigation(self, navigation):
+        """
+        Puts the enemy on the navigation grid of the level, if it
+        is standing on a walkable cell.
+        """
+        column, row = navigation.cell_of(self.center_x, self.bottom)
+        if navigation.is_walkable(column, row):
+            self.navigation = navigation
+            self.ground_column = column
+            self.ground_row = row
+
+    def follow_ground(self):
+        """
+        Keeps the enemy on walkable cells after it has moved.
+        When it walks into the next column it steps up or down
+        with the ground, and if there is nowhere to stand it
+        steps back and turns around.
+        """
+        navigation = self.navigation
+        column = int(self.center_x // navigation.cell_size)
+        if column == self.ground_column:
+            return
+        row = navigation.step_row(self.ground_column, self.ground_row, column)
+        if row is None:
+            self.center_x -= self.change_x
+            self.change_x = -self.change_x
+            self.direction = (
+                LEFT_FACING if self.change_x < 0 else RIGHT_FACING
+            )
+            return
+        self.center_y += (row - self.ground_row) * navigation.cell_size
+        self.ground_column = column
+        self.ground_row = row
+
+    def chase_direction(self, raw_x):
+        """
+        Returns the direction (-1 or 1) to walk in to chase the
+        player, or None if the player cannot be reached.
+        The direction comes from the level's flow field, and
+        straight towards the player without one.
+        """
+        if self.navigation:
+            direction = self.navigation.chase_direction(
+                self.ground_column, self.ground_row
+            )
+            # Inside the player's cell it walks straight at them.
+            if direction != 0:
+                return direction
+        return -1 if raw_x < 0 else 1
 
-    def draw_health_bar(self):
+    def queue_health_bar(self, render_queue):
         """
-        Draws a visual health bar above the enemy's
+        Queues a visual health bar above the enemy's
         head if they are alive. The bar includes a red background
         showing maximum health and a green
         foreground indicating current health.
@@ -167,37 +3374,11 @@ class EnemyCharacter(arcade.Sprite):
         """
         if self.is_dead:
             return
-
-        bottom = self.center_y + HEALTH_BAR_Y_OFFSET
-        top = bottom + HEALTH_BAR_HEIGHT
-        left = self.center_x - HEALTH_BAR_WIDTH / 2
-        right = left + HEALTH_BAR_WIDTH
-
-        # Draw the health bar background and current health
-        arcade.draw_lrbt_rectangle_filled(
-            left, right, bottom, top, arcade.color.RED
-        )
-
-        # Calculate the width of the current health
-        current_health_width = (
-            self.current_health / self.max_health
-        ) * HEALTH_BAR_WIDTH
-        arcade.draw_lrbt_rectangle_filled(
-            left,
-            left + current_health_width,
-            bottom,
-            top,
-            arcade.color.GREEN,
-        )
-        # Draw the health value as text
-        health_string = f"{self.current_health}/{self.max_health}"
-        arcade.draw_text(
-            health_string,
+        render_queue.add_health_bar(
             self.center_x,
-            top + 2,
-            arcade.color.WHITE,
-            HEALTH_BAR_TEXT_SIZE,
-            anchor_x="center",
+            self.center_y + HEALTH_BAR_Y_OFFSET,
+            self.current_health,
+            self.max_health,
         )
 
     def update(self):
@@ -212,11 +3393,13 @@ class EnemyCharacter(arcade.Sprite):
             return
         # Update position based on current change_x
         self.center_x += self.change_x
+        if self.navigation:
+            self.follow_ground()
         if self.center_x < self.left_boundary:
-            self.change_x = 1
+            self.change_x = self.archetype.patrol_speed
             self.direction = RIGHT_FACING
         elif self.center_x > self.right_boundary:
-            self.change_x = -1
+            self.change_x = -self.archetype.patrol_speed
             self.direction = LEFT_FACING
 
         # Reduce attack cooldown if it's greater than zero
@@ -229,57 +3412,66 @@ class EnemyCharacter(arcade.Sprite):
         state of the enemy. This method plays different animation
         sequences depending on whether the enemy is walking,
         attacking, taking damage, or dying.
-        It ensures the correct texture is
+        It ensures the correct frame is
         shown each frame, timed by frame rate constants.
         """
+        archetype = self.archetype
+        loop = False
         if self.is_dead:
             # If the enemy is dead, play death animation
             # it works by cycling through the death textures
             # and stops when the animation is complete.
-            frame = min(
-                self.cur_texture // UPDATES_PER_FRAME,
-                len(self.death_textures) - 1,
-            )
-            self.texture = self.death_textures[frame][self.direction]
+            textures = archetype.death_textures
+            ticks = self.cur_texture
             self.cur_texture += 1
-            return
 
-        if self.is_taking_damage:
+        elif self.is_taking_damage:
             # If the enemy is taking damage,
             # play takedamage animation
             # works by the same logic as the death animation.
             if (
                 self.takedamage_frame
-                < len(self.takedamage_textures) * UPDATES_PER_FRAME
+                >= len(archetype.takedamage_textures) * UPDATES_PER_FRAME
             ):
-                frame = self.takedamage_frame // UPDATES_PER_FRAME
-                self.texture = self.takedamage_textures[frame][
-                    self.direction
-                ]
-                self.takedamage_frame += 1
-            else:
                 self.is_taking_damage = False
-            return
+                return
+            textures = archetype.takedamage_textures
+            ticks = self.takedamage_frame
+            self.takedamage_frame += 1
 
-        if self.is_attacking:
+        elif self.is_attacking:
             # If the enemy is attacking, play attack animation
             # works by the same logic as the death animation.
             frame = self.cur_texture // UPDATES_PER_FRAME
 
-            if frame >= len(self.attack_textures):
+            if frame >= len(archetype.attack_textures):
                 self.cur_texture = 0
                 self.is_attacking = False
-                self.attack_cooldown = self.attack_cooldown_max
-            else:
-                self.texture = self.attack_textures[frame][self.direction]
-                self.cur_texture += 1
-            return
+                self.attack_cooldown = archetype.attack_cooldown
+                return
+            textures = archetype.attack_textures
+            ticks = self.cur_texture
+            self.cur_texture += 1
 
-        self.cur_texture += 1
-        if self.cur_texture >= len(self.walk_textures) * UPDATES_PER_FRAME:
-            self.cur_texture = 0
-        frame = self.cur_texture // UPDATES_PER_FRAME
-        self.texture = self.walk_textures[frame][self.direction]
+        else:
+            self.cur_texture += 1
+            walk_frames = len(archetype.walk_textures)
+            if self.cur_texture >= walk_frames * UPDATES_PER_FRAME:
+                self.cur_texture = 0
+            textures = archetype.walk_textures
+            ticks = self.cur_texture
+            loop = True
+
+        # An animator plays an animation by itself once it has been
+        # told about it, so it is only told again when the enemy
+        # starts another animation, turns, or starts one over.
+        if (
+            ticks
+            and textures is self.playing_textures
+            and self.direction == self.playing_direction
+        ):
+            return
+        self.play_animation(textures, self.direction, ticks, loop=loop)
 
     def detect_player(self, player_sprite):
         """
@@ -294,6 +3486,7 @@ class EnemyCharacter(arcade.Sprite):
         """
         if self.is_dead:
             return
+        archetype = self.archetype
 
         # Calculate the distance to the player
         raw_x = player_sprite.center_x - self.center_x
@@ -307,6 +3500,11 @@ class EnemyCharacter(arcade.Sprite):
             <= player_sprite.center_x
             <= self.right_boundary
         )
+        # The player is only chased if they can be reached
+        # by walking.
+        direction = None
+        if player_in_boundaries:
+            direction = self.chase_direction(raw_x)
         current_frame = self.cur_texture // UPDATES_PER_FRAME
 
         if self.is_attacking:
@@ -321,45 +3519,48 @@ class EnemyCharacter(arcade.Sprite):
                 # and not invulnerable,
                 # deal damage to the player.
                 if (
-                    distance_x < ENEMY_ATTACK_RANGE_X
-                    and distance_y < ENEMY_ATTACK_RANGE_Y
+                    distance_x < archetype.attack_range_x
+                    and distance_y < archetype.attack_range_y
                 ):
                     if player_sprite.invulnerable_timer <= 0:
-                        player_sprite.take_damage(MUSHROOM_ENEMY_DAMAGE)
+                        player_sprite.take_damage(archetype.damage)
                         self.has_dealt_damage = True
             # Reset the attack state after the animation to 
             # allow for future attacks.
-            if current_frame >= len(self.attack_textures) - 1:
+            if current_frame >= len(archetype.attack_textures) - 1:
                 self.has_dealt_damage = False
             return
 
-        if player_in_boundaries:
+        if direction is not None:
             # Faces the player and either chases or attacks
             # based on the distance.
             self.direction = LEFT_FACING if raw_x < 0 else RIGHT_FACING
 
             # Detects if the player is within attack range.
             if (
-                distance_x < ENEMY_DETECTION_RANGE_X
-                and distance_y < ENEMY_DETECTION_RANGE_Y
+                distance_x < archetype.detection_range_x
+                and distance_y < archetype.detection_range_y
             ):
                 if self.attack_cooldown <= 0:
                     self.is_attacking = True
                     self.change_x = 0
                     self.cur_texture = 0
             else:
-                # Chases the player.
-                self.change_x = (
-                    -ENEMY_CHASE_SPEED if raw_x < 0 else ENEMY_CHASE_SPEED
+                # Chases the player along the walkable path, facing
+                # the way it walks.
+                self.change_x = direction * archetype.chase_speed
+                self.direction = (
+                    LEFT_FACING if direction < 0 else RIGHT_FACING
                 )
         else:
-            # Resumes patrol if player is out of bounds.
+            # Resumes patrol if player is out of bounds
+            # or cannot be reached.
             if self.direction == RIGHT_FACING:
-                self.change_x = 1
+                self.change_x = archetype.patrol_speed
                 if self.center_x >= self.right_boundary:
                     self.direction = LEFT_FACING
             else:
-                self.change_x = -1
+                self.change_x = -archetype.patrol_speed
                 if self.center_x <= self.left_boundary:
                     self.direction = RIGHT_FACING
 
@@ -375,7 +3576,14 @@ class EnemyCharacter(arcade.Sprite):
             return
 
         self.current_health -= amount
-        arcade.play_sound(self.game_view.hit_sound, volume=HIT_SOUND_VOLUME)
+        game_view = self.archetype.game_view
+        arcade.play_sound(game_view.hit_sound, volume=HIT_SOUND_VOLUME)
+        game_view.emit(
+            "damage",
+            target="enemy",
+            amount=amount,
+            health=self.current_health,
+        )
 
         # Triggers hurt animation and canecels any attack.
         self.is_taking_damage = True
@@ -389,7 +3597,137 @@ class EnemyCharacter(arcade.Sprite):
             self.cur_texture = 0
 
 
-class PlayerCharacter(arcade.Sprite):
+class EnemyLifecycle:
+    """
+    This class moves the enemies of a level from living to dying
+    to being corpses. Only living enemies are simulated, hit by
+    the player's attacks and spells, and given health bars, so an
+    enemy leaves those sets as soon as it dies. Its death animation
+    is then played until it has finished, when its last frame is
+    baked into the corpse layer, a sprite list that never changes
+    again, and the enemy is hidden.
+
+    Hidden enemies are taken out of the enemy list a few at a time,
+    at most CORPSE_REMOVALS_PER_TICK every tick, since removing a
+    sprite searches the list for it. When many enemies die at once
+    the cost is spread over the ticks that follow, while the hidden
+    ones left in the list cost next to nothing. The enemies list
+    keeps every enemy of the level in the order they were loaded,
+    for the rewind history and the state digest.
+    """
+    def __init__(self, enemy_list):
+        """
+        Starts the lifecycle of the enemies in the enemy list,
+        which are all alive.
+        """
+        self.enemy_list = enemy_list
+        self.enemies = list(enemy_list)
+        self.living = list(enemy_list)
+        self.dying = []
+        self.buried = []
+        self.corpses = {}
+        self.corpse_list = arcade.SpriteList()
+
+    def update(self, animate=True):
+        """
+        Runs once every tick, after the enemies have acted. The
+        dying enemies are animated, unless the enemy workers
+        animate them, and the enemies that died this tick join
+        them. Enemies whose death animation has finished are
+        baked. Returns the enemies taken out of the enemy list,
+        which will not change again.
+        """
+        compacted = []
+        if self.buried:
+            compacted = self.compact()
+
+        if animate:
+            for enemy in self.dying:
+                enemy.update_animation(SIMULATION_TICK_RATE)
+        living = self.living
+        if any(enemy.is_dead for enemy in living):
+            self.dying += [enemy for enemy in living if enemy.is_dead]
+            living[:] = [enemy for enemy in living if not enemy.is_dead]
+
+        if any(enemy.is_corpse for enemy in self.dying):
+            for enemy in self.dying:
+                if enemy.is_corpse:
+                    self.bake(enemy)
+            self.dying = [
+                enemy for enemy in self.dying if not enemy.is_corpse
+            ]
+        return compacted
+
+    def bake(self, enemy):
+        """
+        Adds the last frame of the enemy's death animation to the
+        corpse layer, and hides the enemy until it is taken out
+        of the enemy list.
+        """
+        corpse = arcade.BasicSprite(
+            enemy.archetype.death_textures[-1][enemy.direction],
+            scale=ENEMY_SCALING,
+            center_x=enemy.center_x,
+            center_y=enemy.center_y,
+        )
+        corpse.color = enemy.color
+        self.corpse_list.append(corpse)
+        self.corpses[enemy] = corpse
+        enemy.visible = False
+        self.buried.append(enemy)
+
+    def compact(self):
+        """
+        Takes the enemies that were hidden first out of the enemy
+        list, up to CORPSE_REMOVALS_PER_TICK of them, and returns
+        them. The draw order of the rest is kept.
+        """
+        removed = self.buried[:CORPSE_REMOVALS_PER_TICK]
+        del self.buried[:CORPSE_REMOVALS_PER_TICK]
+        for enemy in removed:
+            self.enemy_list.remove(enemy)
+        return removed
+
+    def restore(self):
+        """
+        Sorts the enemies again after stepping back through the
+        rewind history. Stepping back only brings enemies back to
+        life, or back to dying, so nothing has changed when as
+        many enemies are living and dying as before.
+        """
+        living = [enemy for enemy in self.enemies if not enemy.is_dead]
+        dying = [
+            enemy
+            for enemy in self.enemies
+            if enemy.is_dead and not enemy.is_corpse
+        ]
+        if len(living) == len(self.living) and len(dying) == len(self.dying):
+            return
+        self.living[:] = living
+        self.dying = dying
+
+        # Enemies that are no longer corpses leave the corpse layer
+        # and are shown in the enemy list again.
+        for enemy in [enemy for enemy in self.corpses if not enemy.is_corpse]:
+            self.corpse_list.remove(self.corpses.pop(enemy))
+            enemy.visible = True
+            if self.enemy_list not in enemy.sprite_lists:
+                self.enemy_list.append(enemy)
+        self.buried = [enemy for enemy in self.buried if enemy.is_corpse]
+
+    def clear(self):
+        """
+        Empties the corpse layer and lets go of the enemies.
+        """
+        self.corpse_list.clear()
+        self.corpses = {}
+        self.enemies = []
+        self.living.clear()
+        self.dying = []
+        self.buried = []
+
+
+class PlayerCharacter(AnimatedCharacter, arcade.Sprite):
     """
     This class defines the player character in the game.
     It manages the character's animation states
@@ -408,6 +3746,7 @@ class PlayerCharacter(arcade.Sprite):
         attack_textures,
         takedamage_textures,
         death_textures,
+        magicspell_textures,
         enemy_list,
         game_view,
     ):
@@ -433,11 +3772,13 @@ class PlayerCharacter(arcade.Sprite):
         self.attack_frame = 0
         self.takedamage_frame = 0
         self.death_frame = 0
+        self.cast_frame = 0
         self.invulnerable_timer = 0
 
         # Flags representing the player's state.
         # These flags are used to control the player's behaviour.
         self.is_attacking = False
+        self.is_casting = False
         self.is_taking_damage = False
         self.is_dead = False
         self.has_dealt_damage = False
@@ -450,6 +3791,14 @@ class PlayerCharacter(arcade.Sprite):
         self.attack_textures = attack_textures
         self.takedamage_textures = takedamage_textures
         self.death_textures = death_textures
+        self.magicspell_textures = magicspell_textures
+
+        # The sprite list that plays the player's animations on the
+        # GPU, if any, and the animation it was last told to play.
+        self.animator = None
+        self.animation_state = None
+        self.playing_textures = None
+        self.playing_direction = RIGHT_FACING
 
         # Stores a list of enemies to check for attacks.
         # This allows the player to interact with enemies.
@@ -483,52 +3832,32 @@ class PlayerCharacter(arcade.Sprite):
         self.invulnerable_timer = INVULNERABILITY_FRAMES
         self.is_taking_damage = True
         self.takedamage_frame = 0
+        self.game_view.emit(
+            "damage",
+            target="player",
+            amount=damage,
+            health=self.current_health,
+        )
 
         # If the player's health drops to zero, this triggers death.
         if self.current_health <= 0:
             self.current_health = 0
             self.is_dead = True
             self.death_frame = 0
+            self.game_view.emit("death", cause="enemy")
             
 
-    def draw_health_bar(self):
+    def queue_health_bar(self, render_queue):
         """
-        Draws the health bar above the player,
+        Queues the health bar above the player,
         showing remaining health with a red background
         and a green foreground bar.
         """
-        # Calculates the vertical and horizontal positions of 
-        # the health bar based on the player's position.
-        bottom = self.center_y + HEALTH_BAR_Y_OFFSET
-        top = bottom + HEALTH_BAR_HEIGHT
-        left = self.center_x - HEALTH_BAR_WIDTH / 2
-        right = left + HEALTH_BAR_WIDTH
-
-        # Draws the health bar background and current health
-        # a full red rectangle is drawn first,
-        # then a green rectangle representing current health.
-        arcade.draw_lrbt_rectangle_filled(
-            left, right, bottom, top, arcade.color.RED
-        )
-        current_health_width = (
-            self.current_health / self.max_health
-        ) * HEALTH_BAR_WIDTH
-        arcade.draw_lrbt_rectangle_filled(
-            left,
-            left + current_health_width,
-            bottom,
-            top,
-            arcade.color.GREEN,
-        )
-
-        health_string = f"{self.current_health}/{self.max_health}"
-        arcade.draw_text(
-            health_string,
+        render_queue.add_health_bar(
             self.center_x,
-            top + 2,
-            arcade.color.WHITE,
-            HEALTH_BAR_TEXT_SIZE,
-            anchor_x="center",
+            self.center_y + HEALTH_BAR_Y_OFFSET,
+            self.current_health,
+            self.max_health,
         )
 
     def start_attack(self):
@@ -547,6 +3876,20 @@ class PlayerCharacter(arcade.Sprite):
                               volume=ATTACK_SOUND_VOLUME)
             self.cur_texture = 0
 
+    def start_cast(self):
+        """
+        Begins casting a magic spell if the player is
+        on solid ground and not already attacking or casting.
+        The spell is fired part way through the animation.
+        """
+        if (
+            not self.is_attacking
+            and not self.is_casting
+            and self.change_y == 0
+        ):
+            self.is_casting = True
+            self.cast_frame = 0
+
     def update_animation(self, delta_time: float = 1 / 60):
         """
         Updates the player’s sprite texture based on current 
@@ -571,9 +3914,11 @@ class PlayerCharacter(arcade.Sprite):
             self.death_frame += 1
             frame = self.death_frame // UPDATES_PER_FRAME
             if frame < len(self.death_textures):
-                self.texture = self.death_textures[frame][
-                    self.character_face_direction
-                ]
+                self.play_animation(
+                    self.death_textures,
+                    self.character_face_direction,
+                    self.death_frame,
+                )
                 # Stops all movement when dead so 
                 # that the player cannot move or jump.
                 self.change_x = 0
@@ -585,10 +3930,11 @@ class PlayerCharacter(arcade.Sprite):
         if self.is_taking_damage:
             max_frame = len(self.takedamage_textures) * UPDATES_PER_FRAME
             if self.takedamage_frame < max_frame:
-                frame = self.takedamage_frame // UPDATES_PER_FRAME
-                self.texture = self.takedamage_textures[frame][
-                    self.character_face_direction
-                ]
+                self.play_animation(
+                    self.takedamage_textures,
+                    self.character_face_direction,
+                    self.takedamage_frame,
+                )
                 self.takedamage_frame += 1
                 self.change_x = 0
             else:
@@ -601,18 +3947,22 @@ class PlayerCharacter(arcade.Sprite):
             self.jump_frame = min(
                 self.jump_frame + 1, len(self.jump_textures) - 1
             )
-            self.texture = self.jump_textures[self.jump_frame][
-                self.character_face_direction
-            ]
+            self.show_frame(
+                self.jump_textures,
+                self.character_face_direction,
+                self.jump_frame,
+            )
             return
         # If the player is falling, updates the fall frame.
         elif self.change_y < 0:
             self.jump_frame = min(
                 self.jump_frame + 1, len(self.fall_textures) - 1
             )
-            self.texture = self.fall_textures[self.jump_frame][
-                self.character_face_direction
-            ]
+            self.show_frame(
+                self.fall_textures,
+                self.character_face_direction,
+                self.jump_frame,
+            )
             return
         else:
             # If the player is on the ground, resets the jump frame.
@@ -665,9 +4015,34 @@ class PlayerCharacter(arcade.Sprite):
                 self.attack_frame = 0
                 self.is_attacking = False
             else:
-                self.texture = self.attack_textures[current_frame][
-                    self.character_face_direction
-                ]
+                self.play_animation(
+                    self.attack_textures,
+                    self.character_face_direction,
+                    self.attack_frame - 1,
+                )
+            return
+
+        # While casting, the player stands still and the spell
+        # is fired from the player's hand on the spell frame.
+        if self.is_casting:
+            self.change_x = 0
+            if self.cast_frame == PLAYER_SPELL_FRAME * UPDATES_PER_FRAME:
+                self.game_view.spells.fire(
+                    self.center_x, self.center_y,
+                    self.character_face_direction,
+                )
+
+            self.cast_frame += 1
+            max_frame = len(self.magicspell_textures) * UPDATES_PER_FRAME
+            if self.cast_frame >= max_frame:
+                self.cast_frame = 0
+                self.is_casting = False
+            else:
+                self.play_animation(
+                    self.magicspell_textures,
+                    self.character_face_direction,
+                    self.cast_frame - 1,
+                )
             return
 
         # If the player is not attacking, then the movement
@@ -677,10 +4052,12 @@ class PlayerCharacter(arcade.Sprite):
             max_texture = len(self.run_textures) * UPDATES_PER_FRAME
             if self.cur_texture >= max_texture:
                 self.cur_texture = 0
-            frame = self.cur_texture // UPDATES_PER_FRAME
-            self.texture = self.run_textures[frame][
-                self.character_face_direction
-            ]
+            self.play_animation(
+                self.run_textures,
+                self.character_face_direction,
+                self.cur_texture,
+                loop=True,
+            )
         # If the player is not moving then
         # the idle animation should play.
         else:
@@ -688,13 +4065,107 @@ class PlayerCharacter(arcade.Sprite):
             max_texture = len(self.idle_textures) * IDLE_UPDATES_PER_FRAME
             if self.cur_texture >= max_texture:
                 self.cur_texture = 0
-            frame = self.cur_texture // IDLE_UPDATES_PER_FRAME
-            self.texture = self.idle_textures[frame][
-                self.character_face_direction
-            ]
+            self.play_animation(
+                self.idle_textures,
+                self.character_face_direction,
+                self.cur_texture,
+                IDLE_UPDATES_PER_FRAME,
+                loop=True,
+            )
+
+
+class MenuScreen(arcade.View):
+    """
+    This class is the base of the start, death and end screens.
+    Their text is laid out once into arcade.Text objects that share
+    one batch, so drawing a frame only draws the batch instead of
+    laying the text out again.
+
+    Menus mostly sit still, so while nothing on the screen moves
+    the window updates and draws at the low MENU_IDLE_RATE instead
+    of the game's rate. Key presses are still handled as soon as
+    they happen.
+    """
+    def __init__(self):
+        """
+        Creates the batch the text of the screen is added to.
+        The text objects are kept, since their layout is freed
+        from the batch once they are garbage collected.
+        """
+        super().__init__()
+        self.text_batch = pyglet.graphics.Batch()
+        self.texts = []
+        self.animating = False
+
+    def add_text(self, text, x, y, color, font_size, **kwargs):
+        """
+        Lays out a line of text once and adds it to the batch.
+        """
+        text = arcade.Text(
+            text,
+            x,
+            y,
+            color,
+            font_size,
+            anchor_x="center",
+            batch=self.text_batch,
+            **kwargs,
+        )
+        self.texts.append(text)
+        return text
+
+    def set_animating(self, animating):
+        """
+        Runs the window at the game's rate while something on the
+        screen moves, and at the idle rate once it stops.
+        """
+        self.animating = animating
+        frame_pacer = getattr(self.window, "frame_pacer", None)
+        if frame_pacer:
+            frame_pacer.set_low_power("static screen", not animating)
+            return
+        rate = RENDER_RATE if animating else MENU_IDLE_RATE
+        self.window.set_update_rate(rate)
+        self.window.set_draw_rate(rate)
+
+    def on_show_view(self):
+        """
+        Called when this view is shown.
+        Sets the background color of the window.
+        """
+        self.window.background_color = arcade.color.BLACK
+        self.set_animating(self.animating)
+
+    def on_hide_view(self):
+        """
+        Gives the window back the game's rate when another view
+        is shown.
+        """
+        frame_pacer = getattr(self.window, "frame_pacer", None)
+        if frame_pacer:
+            frame_pacer.set_low_power("static screen", False)
+            return
+        self.window.set_update_rate(RENDER_RATE)
+        self.window.set_draw_rate(RENDER_RATE)
+
+    def request_frame(self):
+        """
+        Draws the screen again as soon as possible after it has
+        changed, instead of at the idle rate.
+        """
+        frame_pacer = getattr(self.window, "frame_pacer", None)
+        if frame_pacer:
+            frame_pacer.request_frame()
+
+    def on_draw(self):
+        """
+        Draws the text of the screen.
+        """
+        self.clear()
+        self.text_batch.draw()
 
 
-class StartScreen(arcade.View):
+class StartScreen(MenuScreen):
     """
     This class represents the start screen of the game.
     It displays the game title and shows gameplay instructions. 
@@ -715,75 +4186,92 @@ class StartScreen(arcade.View):
         self.title_y = WINDOW_HEIGHT + 100
         self.title_drop_speed = 200
         self.title_target_y = WINDOW_HEIGHT * 0.7
+        self.animating = True
+
+        # The title starts above the window, so while the game is
+        # starting it is laid out after the first frame, which saves
+        # loading its font and drawing its large glyphs before then.
+        self.title = None
+        startup = getattr(self.window, "startup", None)
+        if startup:
+            startup.defer("title", self.lay_out_title)
+        else:
+            self.lay_out_title()
 
-    def on_show(self):
-        """
-        Called when this view is shown.
-        Sets the background color of the window.
-        """        
-        arcade.set_background_color(arcade.color.BLACK)
-
-    def on_draw(self):
-
-        self.clear()
-        """
-        Draws the contents of the start screen,
-        including the game title, subtitle, and instructions.
-        """
-        # Draws the title at the center of the screen
-        title = "Adventurer's Impact"
-        arcade.draw_text(
-            title,
-            WINDOW_WIDTH // 2,
-            self.title_y,
-            arcade.color.WHITE,
-            TITLE_FONT_SIZE,
-            anchor_x="center",
-            font_name="Press Start 2P",
-        )
-
-        # Draws the subtitle below the title 
-        arcade.draw_text(
+        # Lays out the subtitle below the title 
+        self.add_text(
             "Press any key to start",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2,
             arcade.color.WHITE,
             SUBTITLE_FONT_SIZE,
-            anchor_x="center",
         )
 
-        # Draws the gameplay instructions for jumping, moving
+        # Lays out the gameplay instructions for jumping, moving
         # and attacking.
-        arcade.draw_text(
-            "Arrow Keys/WASD to Move | SPACE to Attack |",
+        self.add_text(
+            "Arrow Keys/WASD to Move | SPACE to Attack | "
+            "F to Cast | R to Rewind",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 - 50,
             arcade.color.LIGHT_GRAY,
             INSTRUCTION_FONT_SIZE,
-            anchor_x="center",
         )
 
-        # Draws the instructions for spikes.
-        arcade.draw_text(
+        # Lays out the instructions for spikes.
+        self.add_text(
             "Spikes are instant death!",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 - 100,
             arcade.color.LIGHT_GRAY,
             INSTRUCTION_FONT_SIZE,
-            anchor_x="center",
+        )
+
+        # Lays out the instructions for choosing a level.
+        self.add_text(
+            "L to Choose a Level",
+            WINDOW_WIDTH // 2,
+            WINDOW_HEIGHT // 2 - 150,
+            arcade.color.LIGHT_GRAY,
+            INSTRUCTION_FONT_SIZE,
+        )
+
+    def lay_out_title(self):
+        """
+        Lays out the title at the center of the screen, at the
+        height it has fallen to.
+        """
+        self.title = self.add_text(
+            "Adventurer's Impact",
+            WINDOW_WIDTH // 2,
+            self.title_y,
+            arcade.color.WHITE,
+            TITLE_FONT_SIZE,
+            font_name="Press Start 2P",
         )
 
     def on_update(self, delta_time):
         """
         Updates the position of the title to create a
-        falling effect."""
+        falling effect. The screen goes idle once the title
+        has landed."""
+        if not self.animating:
+            return
         if self.title_y > self.title_target_y:
             self.title_y -= delta_time * self.title_drop_speed
+            if self.title:
+                self.title.y = self.title_y
+        else:
+            self.set_animating(False)
 
     def on_key_press(self, key, _modifiers):
         """
-        Called when any key is pressed.
+        Called when any key is pressed. 'L' opens the level
+        select screen, and any other key starts the game.
         """
+        if key == arcade.key.L:
+            self.window.show_view(LevelSelectScreen())
+            return
         self.start_game()
 
     def start_game(self):
@@ -797,7 +4285,203 @@ class StartScreen(arcade.View):
         self.window.show_view(game_view)
 
 
-class DeathScreen(arcade.View):
+class LevelSelectScreen(MenuScreen):
+    """
+    This class represents the level select screen. It shows a
+    thumbnail of each level with its size and how many enemies,
+    moving platform tiles and spikes it has, all read from the
+    level catalog, so no map is parsed until a level is started.
+    The levels are shown a page at a time, and the arrow keys
+    move the selection.
+    """
+    def __init__(self):
+        """
+        Initialize the level select screen by checking the level
+        catalog for maps that were added or changed, and lays out
+        the title and the instructions. The pages of levels are
+        laid out when they are first shown.
+        """
+        super().__init__()
+        self.levels = level_catalog.refresh()
+        self.selected = 0
+        self.per_page = LEVEL_SELECT_COLUMNS * LEVEL_SELECT_ROWS
+        self.pages = {}
+        self.cell_width = WINDOW_WIDTH / LEVEL_SELECT_COLUMNS
+        self.cell_height = (WINDOW_HEIGHT - 220) / LEVEL_SELECT_ROWS
+
+        # The frame around the thumbnail of the selected level.
+        self.highlight = arcade.SpriteSolidColor(
+            *LEVEL_THUMBNAIL_SIZE, color=arcade.color.GOLD
+        )
+        self.highlight_list = arcade.SpriteList()
+        self.highlight_list.append(self.highlight)
+
+        # Lays out the title and the instructions.
+        self.add_text(
+            "Choose a Level",
+            WINDOW_WIDTH // 2,
+            WINDOW_HEIGHT - 70,
+            arcade.color.WHITE,
+            SUBTITLE_FONT_SIZE,
+            font_name="Press Start 2P",
+        )
+        self.add_text(
+            "Arrow Keys to Choose | ENTER to Play | ESC to Go Back",
+            WINDOW_WIDTH // 2,
+            40,
+            arcade.color.LIGHT_GRAY,
+            INSTRUCTION_FONT_SIZE,
+        )
+        if not self.levels:
+            self.add_text(
+                "No levels were found",
+                WINDOW_WIDTH // 2,
+                WINDOW_HEIGHT // 2,
+                arcade.color.RED,
+                SUBTITLE_FONT_SIZE,
+            )
+        self.select(0)
+
+    def cell_center(self, index):
+        """
+        Returns the centre of the thumbnail of the level at an
+        index, on the page the level is on.
+        """
+        column = index % self.per_page % LEVEL_SELECT_COLUMNS
+        row = index % self.per_page // LEVEL_SELECT_COLUMNS
+        return (
+            (column + 0.5) * self.cell_width,
+            WINDOW_HEIGHT
+            - 130
+            - LEVEL_THUMBNAIL_SIZE[1] / 2
+            - row * self.cell_height,
+        )
+
+    def page(self, number):
+        """
+        Returns the thumbnails and text of a page of levels,
+        laying them out the first time the page is shown.
+        """
+        if number in self.pages:
+            return self.pages[number]
+        thumbnails = arcade.SpriteList()
+        batch = pyglet.graphics.Batch()
+        texts = []
+        first = number * self.per_page
+        for index in range(first, min(first + self.per_page, len(self))):
+            entry = self.levels[index]
+            x, y = self.cell_center(index)
+            texture = arcade.Texture(
+                LevelCatalog.thumbnail(entry).convert("RGBA"),
+                hash=f"level_thumbnail_{entry['hash']}",
+                hit_box_algorithm=arcade.hitbox.algo_bounding_box,
+            )
+            thumbnails.append(arcade.Sprite(texture, center_x=x, center_y=y))
+            bottom = y - LEVEL_THUMBNAIL_SIZE[1] / 2
+            for offset, line in (
+                (20, f"Level {index + 1}"),
+                (
+                    44,
+                    f"{entry['width']}x{entry['height']} tiles | "
+                    f"{entry['enemies']} enemies",
+                ),
+                (
+                    64,
+                    f"{entry['platforms']} platform tiles | "
+                    f"{entry['spikes']} spikes",
+                ),
+            ):
+                texts.append(
+                    arcade.Text(
+                        line,
+                        x,
+                        bottom - offset,
+                        arcade.color.WHITE,
+                        LEVEL_SELECT_FONT_SIZE,
+                        anchor_x="center",
+                        batch=batch,
+                    )
+                )
+        pages = -(-len(self) // self.per_page)
+        if pages > 1:
+            texts.append(
+                arcade.Text(
+                    f"Page {number + 1} of {pages}",
+                    WINDOW_WIDTH // 2,
+                    75,
+                    arcade.color.LIGHT_GRAY,
+                    LEVEL_SELECT_FONT_SIZE,
+                    anchor_x="center",
+                    batch=batch,
+                )
+            )
+        self.pages[number] = (thumbnails, batch, texts)
+        return self.pages[number]
+
+    def __len__(self):
+        """
+        Returns the number of levels on the screen.
+        """
+        return len(self.levels)
+
+    def select(self, index):
+        """
+        Selects the level at an index, if there is one, and fits
+        the frame around its thumbnail.
+        """
+        if not 0 <= index < len(self):
+            return
+        self.selected = index
+        thumbnails = self.page(index // self.per_page)[0]
+        thumbnail = thumbnails[index % self.per_page]
+        self.highlight.position = thumbnail.position
+        self.highlight.width = thumbnail.width + 12
+        self.highlight.height = thumbnail.height + 12
+        self.request_frame()
+
+    def on_key_press(self, key, _modifiers):
+        """
+        Handles input from the user. The arrow keys move the
+        selection, ENTER starts the selected level and ESC goes
+        back to the start screen.
+        """
+        if key in (arcade.key.LEFT, arcade.key.A):
+            self.select(self.selected - 1)
+        elif key in (arcade.key.RIGHT, arcade.key.D):
+            self.select(self.selected + 1)
+        elif key in (arcade.key.UP, arcade.key.W):
+            self.select(self.selected - LEVEL_SELECT_COLUMNS)
+        elif key in (arcade.key.DOWN, arcade.key.S):
+            self.select(self.selected + LEVEL_SELECT_COLUMNS)
+        elif key in (arcade.key.ENTER, arcade.key.SPACE) and self.levels:
+            game_view = GameView()
+            game_view.level = self.selected + 1
+            game_view.setup()
+            self.window.show_view(game_view)
+        elif key == arcade.key.ESCAPE:
+            start_screen = StartScreen()
+            start_screen.title_y = start_screen.title_target_y
+            if start_screen.title:
+                start_screen.title.y = start_screen.title_y
+            self.window.show_view(start_screen)
+
+    def on_draw(self):
+        """
+        Draws the page of the selected level, with a frame around
+        its thumbnail, and the text of the screen.
+        """
+        self.clear()
+        if self.levels:
+            thumbnails, batch, _texts = self.page(
+                self.selected // self.per_page
+            )
+            self.highlight_list.draw()
+            thumbnails.draw(pixelated=True)
+            batch.draw()
+        self.text_batch.draw()
+
+
+class DeathScreen(MenuScreen):
     """
     This class represents the screen shown 
     when the player dies in the game.
@@ -820,32 +4504,22 @@ class DeathScreen(arcade.View):
         self.game_view = game_view
         self.current_level = game_view.level
         arcade.play_sound(self.game_view.game_over_sound)
-        
-        
-    def on_draw(self):
-        """
-        Render the "Game Over" message and 
-        instructions to restart the game.
-        """
-        self.clear()
 
-        # Draws the main game over text. 
-        arcade.draw_text(
+        # Lays out the main game over text. 
+        self.add_text(
             "GAME OVER",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 + 50,
             arcade.color.RED,
             GAME_OVER_FONT_SIZE,
-            anchor_x="center",
         )
-        # Draws the instructions to restart the game.
-        arcade.draw_text(
+        # Lays out the instructions to restart the game.
+        self.add_text(
             "Press any key to restart",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 - 50,
             arcade.color.WHITE,
             END_SCREEN_OPTION_SIZE,
-            anchor_x="center",
         )
 
     def on_key_press(self, key, _modifiers):
@@ -855,14 +4529,18 @@ class DeathScreen(arcade.View):
         the previous level is reloaded, 
         and the game starts again.
         """
-        # Set the level to the one where the player died.
+        # Releases the game the player died in before building
+        # the new one, then sets the level to the one where the
+        # player died.
+        self.game_view.teardown()
+        self.game_view = None
         game_view = GameView()
         game_view.level = self.current_level
         game_view.setup()
         self.window.show_view(game_view)
 
 
-class EndScreen(arcade.View):
+class EndScreen(MenuScreen):
     """
     This class represents the end screen 
     shown when the player completes the game.
@@ -872,46 +4550,36 @@ class EndScreen(arcade.View):
     def __init__(self, game_view):
         """
         Initialize the end screen with a reference
-        to the previous game view
+        to the previous game view, and lays out its
+        thank you message and restart/quit options.
         """
         super().__init__()
         self.game_view = game_view
 
-    def on_draw(self):
-        """
-        Render the end screen with a thank you
-        message and restart/quit options.
-        """
-        self.clear()
-        arcade.set_background_color(arcade.color.BLACK)
-
-        # Draws the "Thanks for playing!" text.
-        arcade.draw_text(
+        # Lays out the "Thanks for playing!" text.
+        self.add_text(
             "THANKS FOR PLAYING!",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 + 100,
             arcade.color.GOLD,
             END_SCREEN_TITLE_SIZE,
-            anchor_x="center",
             font_name="Kenney Future",
         )
-        # Draws the restart option.
-        arcade.draw_text(
+        # Lays out the restart option.
+        self.add_text(
             "R - Restart Game",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2,
             arcade.color.WHITE,
             END_SCREEN_OPTION_SIZE,
-            anchor_x="center",
         )
-        # Draws the quit option.
-        arcade.draw_text(
+        # Lays out the quit option.
+        self.add_text(
             "Q - Quit Game",
             WINDOW_WIDTH // 2,
             WINDOW_HEIGHT // 2 - 50,
             arcade.color.WHITE,
             END_SCREEN_OPTION_SIZE,
-            anchor_x="center",
         )
 
     def on_key_press(self, key, _modifiers):
@@ -922,6 +4590,8 @@ class EndScreen(arcade.View):
         # If either 'R' or 'Q' is pressed,
         # it will either restart the game or quit.
         if key == arcade.key.R:
+            self.game_view.teardown()
+            self.game_view = None
             game_view = GameView()
             game_view.setup()
             self.window.show_view(game_view)
@@ -929,275 +4599,729 @@ class EndScreen(arcade.View):
             arcade.close_window()
 
 
-class GameView(arcade.View):
-    """
-    The main game view class responsible for setting up and managing
-    the game state, including sprites, tile maps, textures, physics,
-    cameras, and sound effects.
-    """
-    def __init__(self):
-        """
-        Initialize the game view. 
-        Sets up core components like sound effects,
-        state variables, camera systems, and the setup method to 
-        prepare the game environment.
-        """
-        super().__init__()
+class GameView(arcade.View):
+    """
+    The main game view class responsible for setting up and managing
+    the game state, including sprites, tile maps, textures, physics,
+    cameras, and sound effects.
+    """
+    def __init__(self):
+        """
+        Initialize the game view. 
+        Sets up core components like sound effects,
+        state variables and camera systems. The level itself is
+        loaded by setup(), once the level to play has been chosen.
+        """
+        super().__init__()
+
+        # Game objects
+        self.tile_map = None
+        self.scene = None
+        self.player_list = None
+        self.enemy_list = None
+        self.enemy_lifecycle = None
+        self.wall_list = None
+        self.player_sprite = None
+        self.physics_engine = None
+
+        # Game state
+        # map_path can be set to load a map other than the
+        # numbered levels, such as a generated stress level.
+        self.level = 1
+        self.map_path = None
+        self.game_over = False
+
+        # Fixed timestep state. The accumulator holds the time that
+        # has not been simulated yet, and the previous positions
+        # are used to draw sprites between two simulation ticks.
+        self.accumulator = 0.0
+        self.previous_positions = []
+
+        # Counts the simulation ticks since this view was created.
+        # Key events are recorded against this counter so that
+        # they can be replayed on exactly the same tick.
+        self.tick = 0
+        self.input_recorder = getattr(self.window, "input_recorder", None)
+
+        # Key events waiting for the next simulation tick, and the
+        # ticks left for a buffered jump and for jumping after
+        # walking off a ledge.
+        self.input_queue = InputQueue()
+        self.jump_buffer = 0
+        self.coyote_ticks = 0
+
+        # Number of worker processes used to simulate enemies,
+        # and the pool running them when the mode is enabled.
+        self.enemy_workers = getattr(self.window, "enemy_workers", 0)
+        self.enemy_pool = None
+        self.navigation = None
+        self.platforms = None
+
+        # The history of recent ticks that holding R steps back
+        # through. It is not kept while recording input or while
+        # the enemies are simulated in worker processes.
+        self.rewind = None
+        self.rewind_pressed = False
+
+        # The session telemetry events are sent to, if enabled,
+        # with the frame times counted since they were last sent
+        # and when the current level was started.
+        self.telemetry = getattr(self.window, "telemetry", None)
+        self.frame_time_counts = [0] * (len(FRAME_TIME_BUCKETS) + 1)
+        self.frame_time_elapsed = 0.0
+        self.level_start_tick = 0
+        self.level_start_time = 0.0
+
+        # Levels with at least this many cells stream their tile
+        # layers around the player instead of loading every tile.
+        self.streaming_min_tiles = getattr(
+            self.window, "streaming_min_tiles", STREAMING_MIN_TILES
+        )
+        self.tile_streamer = None
+
+        # How the hit boxes of sprites and tiles are made, either
+        # outlining their pixels or as a box around them.
+        self.hit_box_mode = getattr(self.window, "hit_box_mode", HIT_BOX_MODE)
+
+        # Watches the files of the level for edits, when levels
+        # are reloaded while the game runs.
+        self.hot_reload = getattr(self.window, "hot_reload", False)
+        self.level_watcher = None
+
+        # Whether the animations of the characters are played on
+        # the GPU, or their textures are set every tick.
+        self.gpu_animation = getattr(self.window, "gpu_animation", True)
+
+        # The pool of magic spell projectiles. It is allocated once
+        # and reused by every level.
+        self.spells = SpellPool()
+
+        # Draws the level, the characters and the spells, and counts
+        # the draw calls each frame makes.
+        self.render_queue = RenderQueue()
+        self.render_budget_warned = False
+
+        # Camera
+        self.camera = None
+        self.gui_camera = None
+        self.camera_bounds = None
+
+        # Sound Effects
+        self.jump_sound = load_sound("resources/sounds/jump.wav")
+        self.sword_sound = load_sound("resources/sounds/sword.mp3")
+        self.hit_sound = load_sound("resources/sounds/hit.wav")
+        self.game_over_sound = load_sound("resources/sounds/game_over.mp3")
+
+    def setup(self):
+        """
+        Initialises sprite lists, load textures, 
+        create player and enemy objects, load tile map layers, 
+        configure physics and camera systems.
+        """
+        load_start = time.perf_counter()
+
+        # Releases the previous level before the next one is loaded,
+        # so the two are never held in memory at the same time.
+        self.unload_level()
+
+        # Player and enemy sprite lists
+        # These lists will hold all player and enemy sprites, and
+        # play their animations on the GPU unless that is disabled.
+        sprite_list_class = (
+            AnimatedSpriteList if self.gpu_animation else arcade.SpriteList
+        )
+        self.player_list = sprite_list_class()
+        self.enemy_list = sprite_list_class()
+
+        # Reset key states
+        self.left_pressed = False
+        self.right_pressed = False
+        self.up_pressed = False
+        self.space_pressed = False
+        self.rewind_pressed = False
+        self.input_queue.clear()
+        self.jump_buffer = 0
+        self.coyote_ticks = 0
+
+        self.load_textures()
+        self.spells.clear()
+
+        # Therefore, the player sprite is created
+        # with the loaded textures and initial position.
+        self.player_sprite = PlayerCharacter(
+            PLAYER_HEALTH,
+            self.idle_textures,
+            self.run_textures,
+            self.jump_textures,
+            self.fall_textures,
+            self.attack_textures,
+            self.takedamage_textures,
+            self.death_textures,
+            self.magicspell_textures,
+            self.enemy_list,
+            self,
+        )
+        self.player_list.append(self.player_sprite)
+        if self.gpu_animation:
+            self.player_sprite.animator = self.player_list
+
+        # Load map
+        # The map of the level is found through the level catalog,
+        # which raises an error for a level that does not exist.
+        map_path = self.map_path or level_catalog.map_path(self.level)
+        tiled_map = load_tiled_map(map_path)
+
+        # Sets the initial position of the player sprite
+        # to the spawn point of the map.
+        self.player_sprite.position = level_spawn(tiled_map)
+
+        # Large levels stream their tile layers, so arcade only
+        # builds sprites for the rest of the layers.
+        streamed = []
+        if (
+            tiled_map.map_size.width * tiled_map.map_size.height
+            >= self.streaming_min_tiles
+        ):
+            streamed = [
+                layer
+                for layer in tiled_map.layers
+                if isinstance(layer, pytiled_parser.TileLayer)
+                and layer.name in STREAMED_LAYERS
+            ]
+        if streamed:
+            streamed_ids = {id(layer) for layer in streamed}
+            tiled_map = copy.copy(tiled_map)
+            tiled_map.layers = [
+                layer
+                for layer in tiled_map.layers
+                if id(layer) not in streamed_ids
+            ]
+
+        # Loads the tile map from the specified path
+        # with the defined scaling and layer options.
+        self.tile_map = arcade.TileMap(
+            tiled_map=tiled_map,
+            scaling=TILE_SCALING,
+            layer_options=LAYER_OPTIONS,
+            hit_box_algorithm=hit_box_algorithms[self.hit_box_mode],
+        )
+        if streamed:
+            self.tile_streamer = TileStreamer(
+                self.tile_map,
+                streamed,
+                hit_box_algorithms[self.hit_box_mode],
+            )
+            self.tile_streamer.update(*self.player_sprite.position)
+
+        # Create the scene from the tile map, builds the
+        # navigation grid and loads the enemies from the map.
+        self.scene = arcade.Scene.from_tilemap(self.tile_map)
+        self.navigation = NavigationGrid.from_tile_map(
+            self.tile_map, self.tile_streamer
+        )
+        self.load_enemies_from_map()
+        self.start_enemy_lifecycle()
+
+        self.start_enemy_pool()
+
+        # This assigns references to the specific tile layers.
+        self.boundaries_list = self.tile_map.sprite_lists["Boundaries"]
+        self.wall_list = self.tile_map.sprite_lists["Ground"]
+        self.finish_list = self.tile_map.sprite_lists["Finish"]
+        self.spikes_list = self.tile_map.sprite_lists["Spikes"]
+        self.decorations = self.scene["Decorations"]
+        self.background_filler = self.scene["Background_Filler"]
+        self.background = self.scene["Background"]
+        self.midground = self.scene["Midground"]
+        self.foreground = self.scene["Foreground"]
+
+        # Loads the moving platforms.
+        # This works by checking if the "Moving_Platforms"
+        # layer exists in the tile map, then reading the path
+        # of each platform from its properties.
+        # The layer has no spatial hash, since its sprites move
+        # every tick.
+        self.moving_platforms = self.tile_map.sprite_lists.get(
+            "Moving_Platforms", arcade.SpriteList()
+        )
+        self.platforms = MovingPlatforms(
+            self.moving_platforms, self.tick, self.wall_list
+        )
+
+        # If the tile map has a background color, set it as it is.
+        if self.tile_map.background_color:
+            self.window.background_color = self.tile_map.background_color
 
-        # Game objects
-        self.tile_map = None
-        self.scene = None
-        self.player_list = None
-        self.enemy_list = None
-        self.wall_list = None
-        self.player_sprite = None
-        self.physics_engine = None
+        # For efficient collision detection,
+        # only the moving platforms near the player are given
+        # to the physics engine, along with the ground.
+        self.physics_engine = arcade.PhysicsEnginePlatformer(
+            self.player_sprite,
+            [self.wall_list, self.platforms.collision_list],
+            gravity_constant=GRAVITY,
+        )
 
-        # Game state
-        self.level = 1
-        self.game_over = False
+        # Sets the camera for the game view and GUI.
+        self.camera = arcade.Camera2D()
+        self.gui_camera = arcade.Camera2D()
 
-        # Camera
-        self.camera = None
-        self.gui_camera = None
-        self.camera_bounds = None
+        max_x = GRID_PIXEL_SIZE * self.tile_map.width
+        max_y = GRID_PIXEL_SIZE * self.tile_map.height
+        self.camera_bounds = arcade.LRBT(
+            self.window.width / CAMERA_BOUNDS_PADDING,
+            max_x - self.window.width / CAMERA_BOUNDS_PADDING,
+            0,
+            max_y,
+        )
 
-        # Sound Effects
-        self.jump_sound = arcade.load_sound("resources/sounds/jump.wav")
-        self.sword_sound = arcade.load_sound("resources/sounds/sword.mp3")
-        self.hit_sound = arcade.load_sound("resources/sounds/hit.wav")
-        self.game_over_sound = arcade.load_sound("" \
-        "resources/sounds/game_over.mp3")
+        self.pan_camera_to_user()
+        self.game_over = False
+        self.previous_positions = []
+
+        self.start_rewind()
+        self.build_render_queue()
+        self.render_budget_warned = False
+
+        # Starts watching the level's files for edits.
+        if self.hot_reload:
+            self.level_watcher = LevelWatcher(self, map_path)
+
+        # Reports how long the level took to load, and starts
+        # timing how long it takes to finish.
+        self.level_start_tick = self.tick
+        self.level_start_time = time.perf_counter()
+        self.emit(
+            "level_start",
+            load_seconds=self.level_start_time - load_start,
+            enemies=len(self.enemy_list),
+        )
 
-        self.setup()
+        # Reports the memory in use once the level has loaded, so
+        # that growth across levels and restarts can be seen.
+        if getattr(self.window, "memory_report", False):
+            import memory_telemetry
+            print(
+                f"Level {self.level} loaded: "
+                + memory_telemetry.format_snapshot(
+                    memory_telemetry.snapshot()
+                )
+            )
 
-    def setup(self):
+    def load_textures(self):
         """
-        Initialises sprite lists, load textures, 
-        create player and enemy objects, load tile map layers, 
-        configure physics and camera systems.
+        Loads the animation textures for the player. Every frame is
+        loaded together with its mirrored version so that sprites
+        can face both left and right, with hit boxes made in the
+        game view's hit box mode. The textures of the enemies are
+        loaded by enemy_archetype once a level uses them.
         """
-        # Player and enemy sprite lists
-        # These lists will hold all player and enemy sprites.
-        self.player_list = arcade.SpriteList()
-        self.enemy_list = arcade.SpriteList()
-
-        # Reset key states
-        self.left_pressed = False
-        self.right_pressed = False
-        self.up_pressed = False
-        self.space_pressed = False
-
-        # Load textures
         character_path = "resources/sprites/blue_player"
-        enemy_path = "resources/sprites/mushroom_enemy"
-
-        # This is a helper function to load textures
-        # for the player and enemy sprites. This is used as
-        # a convenience to avoid repeating the same code
-        # for loading textures for each animation state.
-        def _load_texture_pair(path):
-            tex = arcade.load_texture(path)
-            return (tex, tex.flip_left_right())
+        mode = self.hit_box_mode
+        self.enemy_archetypes = {}
+        self.enemy_textures = {}
 
         # This works by loading all the textures for the player
-        # and enemy sprites from their respective directories.
+        # sprite from its directory.
         # the for loop iterates through the frames
         # and loads each texture pair for the animations.
         self.run_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_run/player_run{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_run/player_run{i}.png", mode
             )
             for i in range(PLAYER_RUN_FRAMES)
         ]
 
         self.jump_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_jump/player_jump{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_jump/player_jump{i}.png", mode
             )
             for i in range(PLAYER_JUMP_FRAMES)
         ]
 
         self.fall_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_fall/player_fall{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_fall/player_fall{i}.png", mode
             )
             for i in range(PLAYER_FALL_FRAMES)
         ]
 
         self.idle_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_idle/player_idle{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_idle/player_idle{i}.png", mode
             )
             for i in range(PLAYER_IDLE_FRAMES)
         ]
 
         self.attack_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_attack/player_attack{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_attack/player_attack{i}.png", mode
             )
             for i in range(PLAYER_ATTACK_FRAMES)
         ]
 
         self.takedamage_textures = [
-            _load_texture_pair(f"{character_path}/player_takedamage/"
-                            f"player_takedamage{i}.png")
+            load_texture_pair(f"{character_path}/player_takedamage/"
+                            f"player_takedamage{i}.png", mode)
             for i in range(PLAYER_TAKEDAMAGE_FRAMES)
         ]
 
         self.death_textures = [
-            _load_texture_pair(
-                f"{character_path}/player_death/player_death{i}.png"
+            load_texture_pair(
+                f"{character_path}/player_death/player_death{i}.png", mode
             )
             for i in range(PLAYER_DEATH_FRAMES)
         ]
 
-        # Enemy textures
-        self.enemy_walk_textures = [
-            _load_texture_pair(
-                f"{enemy_path}/mushroom_idle/mushroom_idle{i}.png"
-            )
-            for i in range(ENEMY_WALK_FRAMES)
+        self.magicspell_textures = [
+            load_texture_pair(f"{character_path}/player_magicspell/"
+                            f"player_magicspell{i}.png", mode)
+            for i in range(PLAYER_MAGICSPELL_FRAMES)
         ]
 
-        self.enemy_attack_textures = [
-            _load_texture_pair(
-                f"{enemy_path}/mushroom_attack/mushroom_attack{i}.png"
+    def enemy_archetype(self, name):
+        """
+        Returns the archetype of the named enemy type, loading its
+        textures the first time a level uses the type. Types that
+        share a texture folder share the textures too.
+        """
+        archetype = self.enemy_archetypes.get(name)
+        if archetype is not None:
+            return archetype
+
+        folder = ENEMY_ARCHETYPES[name]["textures"]
+        textures = self.enemy_textures.get(folder)
+        if textures is None:
+            enemy_path = f"resources/sprites/{folder}_enemy"
+            mode = self.hit_box_mode
+            textures = tuple(
+                [
+                    load_texture_pair(
+                        f"{enemy_path}/{folder}_{animation}/"
+                        f"{folder}_{animation}{i}.png",
+                        mode,
+                    )
+                    for i in range(frames)
+                ]
+                for animation, frames in (
+                    ("idle", ENEMY_WALK_FRAMES),
+                    ("attack", ENEMY_ATTACK_FRAMES),
+                    ("takedamage", ENEMY_TAKEDAMAGE_FRAMES),
+                    ("death", ENEMY_DEATH_FRAMES),
+                )
             )
-            for i in range(ENEMY_ATTACK_FRAMES)
-        ]
+            self.enemy_textures[folder] = textures
+
+        archetype = EnemyArchetype(name, self, *textures)
+        self.enemy_archetypes[name] = archetype
+        return archetype
+
+    def start_enemy_lifecycle(self):
+        """
+        Starts the lifecycle of the enemies loaded from the map,
+        and points the player's attacks at the living ones.
+        """
+        self.enemy_lifecycle = EnemyLifecycle(self.enemy_list)
+        self.player_sprite.enemy_list = self.enemy_lifecycle.living
 
-        self.enemy_death_textures = [
-            _load_texture_pair(
-                f"{enemy_path}/mushroom_death/mushroom_death{i}.png"
+    def start_enemy_pool(self):
+        """
+        Moves the enemies into worker processes when the
+        multi-process enemy mode is enabled and the level
+        has enough enemies to benefit from it.
+        """
+        if (
+            self.enemy_workers
+            and len(self.enemy_lifecycle.enemies) >= ENEMY_WORKER_MIN_ENEMIES
+        ):
+            import enemy_workers
+            self.enemy_pool = enemy_workers.EnemyWorkerPool(
+                self.enemy_lifecycle.enemies,
+                self.enemy_workers,
+                self.navigation,
             )
-            for i in range(ENEMY_DEATH_FRAMES)
-        ]
+            # Only the enemies the pool keeps up to date can be hit.
+            self.player_sprite.enemy_list = self.enemy_pool.targets
 
-        self.enemy_takedamage_textures = [
-            _load_texture_pair(
-                f"{enemy_path}/mushroom_takedamage/"
-                f"mushroom_takedamage{i}.png"
+    def start_rewind(self):
+        """
+        Starts the rewind history from the current state of the
+        level, unless input is recorded or the enemies are
+        simulated in worker processes.
+        """
+        self.rewind = None
+        if not self.input_recorder and not self.enemy_pool:
+            self.rewind = RewindBuffer(
+                self.player_sprite, self.enemy_lifecycle.enemies
             )
-            for i in range(ENEMY_TAKEDAMAGE_FRAMES)
-        ]
+            self.rewind.capture(self.tick)
 
-        # Therefore, the player sprite is created
-        # with the loaded textures and initial position.
-        self.player_sprite = PlayerCharacter(
-            PLAYER_HEALTH,
-            self.idle_textures,
-            self.run_textures,
-            self.jump_textures,
-            self.fall_textures,
-            self.attack_textures,
-            self.takedamage_textures,
-            self.death_textures,
-            self.enemy_list,
-            self,
+    def build_render_queue(self):
+        """
+        Adds the layers of the level, the characters and the
+        spells to the render queue, in the order they are drawn.
+        The layers of the tile map hold the same sprites for the
+        whole level, so they are merged into one batch, unless
+        they are streamed.
+        """
+        self.render_queue.clear()
+        streamed = []
+        if self.tile_streamer:
+            streamed = self.tile_streamer.sprite_lists.values()
+        for sprite_list in (
+            self.background,
+            self.midground,
+            self.foreground,
+            self.background_filler,
+            self.decorations,
+            self.wall_list,
+            self.moving_platforms,
+            self.finish_list,
+            self.spikes_list,
+        ):
+            self.render_queue.add(
+                RENDER_LAYER_LEVEL,
+                sprite_list,
+                static=not any(sprite_list is other for other in streamed),
+            )
+        self.render_queue.add(
+            RENDER_LAYER_CHARACTERS, self.enemy_lifecycle.corpse_list
         )
-        # Sets the initial position of the player sprite
-        # to the spawn point defined by constants.
-        self.player_sprite.center_x = PLAYER_SPAWN_X
-        self.player_sprite.center_y = PLAYER_SPAWN_Y
-        self.player_list.append(self.player_sprite)
+        self.render_queue.add(RENDER_LAYER_CHARACTERS, self.enemy_list)
+        self.render_queue.add(RENDER_LAYER_CHARACTERS, self.player_list)
+        self.render_queue.add(RENDER_LAYER_EFFECTS, self.spells.sprite_list)
+        self.render_queue.build()
 
-        # Load map
-        file_path = os.path.dirname(os.path.abspath(__file__))
-        map_path = os.path.join(
-            file_path, f"resources/maps/level{self.level}.tmx"
-        )
-
-        # Configures the tile map layer properties.
-        # This sets whether spatial hashing
-        # is used for collision detection
-        layer_options = {
-            "Mushroom_Enemies": {"use_spatial_hash": True},
-            "Finish": {"use_spatial_hash": True},
-            "Spikes": {"use_spatial_hash": True},
-            "Ground": {"use_spatial_hash": True},
-            "Boundaries": {"use_spatial_hash": True},
-            "Decorations": {"use_spatial_hash": False},
-            "Background_Filler": {"use_spatial_hash": False},
-            "Background": {"use_spatial_hash": False},
-            "Midground": {"use_spatial_hash": False},
-            "Foreground": {"use_spatial_hash": False},
-            "Moving_Platforms": {"use_spatial_hash": True},
-        }
-        # Loads the tile map from the specified path
-        # with the defined scaling and layer options.
-        self.tile_map = arcade.load_tilemap(
-            map_path, TILE_SCALING, layer_options
+    def check_render_budget(self):
+        """
+        Reports the first frame of a level that needed more draw
+        calls than DRAW_CALL_BUDGET.
+        """
+        draw_calls = self.render_queue.stats["draw_calls"]
+        if draw_calls <= DRAW_CALL_BUDGET or self.render_budget_warned:
+            return
+        self.render_budget_warned = True
+        print(
+            f"Level {self.level} used {draw_calls} draw calls in one "
+            f"frame, over the budget of {DRAW_CALL_BUDGET}"
+        )
+        self.emit(
+            "draw_call_budget", draw_calls=draw_calls, budget=DRAW_CALL_BUDGET
         )
 
-        # Create the scene from the tile map and loads the
-        # enemies from the map.
-        self.scene = arcade.Scene.from_tilemap(self.tile_map)
-        self.load_enemies_from_map()
+    def layers_reloaded(self, names):
+        """
+        Brings the rest of the level up to date after the watcher
+        patched the given layers into the live tile map. The enemy
+        workers and the rewind history are started again when the
+        enemies or the ground they walk on changed.
+        """
+        if "Ground" in names:
+            self.navigation = NavigationGrid.from_tile_map(
+                self.tile_map, self.tile_streamer
+            )
+            for enemy in self.enemy_lifecycle.enemies:
+                enemy.place_on_navigation(self.navigation)
+        if "Mushroom_Enemies" in names:
+            self.enemy_lifecycle.clear()
+            self.enemy_list.clear()
+            self.load_enemies_from_map()
+            self.start_enemy_lifecycle()
+        if "Moving_Platforms" in names:
+            self.platforms = MovingPlatforms(
+                self.moving_platforms, self.platforms.start_tick,
+                self.wall_list,
+            )
+            self.platforms.update(
+                self.tick, self.player_sprite, self.visible_area()
+            )
+            # Setting the platforms of the physics engine adds to
+            # them, so the old ones are removed first.
+            del self.physics_engine.platforms
+            self.physics_engine.platforms = [
+                self.wall_list, self.platforms.collision_list
+            ]
+        if "Ground" in names or "Mushroom_Enemies" in names:
+            self.close_enemy_pool()
+            self.start_enemy_pool()
+            self.start_rewind()
+        self.build_render_queue()
+        self.previous_positions = []
+
+    def restart_level(self):
+        """
+        Loads the level again from its files, keeping the state
+        of the player, for edits the watcher cannot patch in.
+        """
+        player_state = [
+            getattr(self.player_sprite, name)
+            for name, _ in PLAYER_REWIND_FIELDS
+        ]
+        self.setup()
+        for (name, _), value in zip(PLAYER_REWIND_FIELDS, player_state):
+            setattr(self.player_sprite, name, value)
+        self.start_rewind()
 
-        # This assigns references to the specific tile layers.
-        self.boundaries_list = self.tile_map.sprite_lists["Boundaries"]
-        self.wall_list = self.tile_map.sprite_lists["Ground"]
-        self.finish_list = self.tile_map.sprite_lists["Finish"]
-        self.spikes_list = self.tile_map.sprite_lists["Spikes"]
-        self.decorations = self.scene["Decorations"]
-        self.background_filler = self.scene["Background_Filler"]
-        self.background = self.scene["Background"]
-        self.midground = self.scene["Midground"]
-        self.foreground = self.scene["Foreground"]
+    def close_enemy_pool(self):
+        """
+        Stops the enemy worker processes if they are running.
+        The enemies are then simulated in the main process again.
+        """
+        if self.enemy_pool:
+            self.enemy_pool.close()
+            self.enemy_pool = None
+            if self.player_sprite:
+                self.player_sprite.enemy_list = self.enemy_lifecycle.living
 
-        # Loads and configures the moving platforms.
-        # This works by checking if the "Moving_Platforms" 
-        # layer exists in the tile map and then 
-        # iterating through its sprites.
-        # then it sets the boundaries and movement speed
-        # for each platform based on its properties.
-        self.moving_platforms = arcade.SpriteList()
-        if "Moving_Platforms" in self.tile_map.sprite_lists:
-            for platform in self.tile_map.sprite_lists["Moving_Platforms"]:
-                platform.boundary_left = platform.properties.get(
-                    "boundary_left",
-                    platform.center_x - ENEMY_PATROL_DISTANCE,
-                )
-                platform.boundary_right = platform.properties.get(
-                    "boundary_right",
-                    platform.center_x + ENEMY_PATROL_DISTANCE,
-                )
-                platform.change_x = platform.properties.get("change_x", 0)
-                self.moving_platforms.append(platform)
+    def unload_level(self):
+        """
+        Releases the resources of the loaded level: the enemy
+        worker processes, the sprites of the tile map and the
+        sprite lists, physics engine and navigation built for it.
+        Textures, maps and sounds stay in their caches, since
+        they are shared by every level and game view.
+        """
+        self.close_enemy_pool()
+        if self.render_queue:
+            self.render_queue.clear()
+        if self.tile_map:
+            for sprite_list in self.tile_map.sprite_lists.values():
+                sprite_list.clear()
+        for sprite_list in (self.player_list, self.enemy_list):
+            if sprite_list:
+                sprite_list.clear()
+        if self.enemy_lifecycle:
+            self.enemy_lifecycle.clear()
+
+        # The player refers back to the game view and the enemy
+        # list, so the references are broken to free it at once.
+        if self.player_sprite:
+            self.player_sprite.game_view = None
+            self.player_sprite.enemy_list = None
+        self.player_sprite = None
+        self.tile_map = None
+        self.tile_streamer = None
+        self.enemy_lifecycle = None
+        self.scene = None
+        self.physics_engine = None
+        self.navigation = None
+        self.platforms = None
+        self.rewind = None
+        self.level_watcher = None
 
-        # If the tile map has a background color, set it as it is.
-        if self.tile_map.background_color:
-            self.window.background_color = self.tile_map.background_color
+    def teardown(self):
+        """
+        Releases everything the game view holds once it will not
+        be shown again, such as after the player restarts from the
+        death screen or the end screen.
+        """
+        self.unload_level()
+        self.spells = None
+        self.render_queue = None
 
-        # For efficient collision detection,
-        # it appends the moving platforms to the list.
-        # This is done to ensure that the physics engine
-        # can handle collisions with both static 
-        # and moving platforms.
-        platforms = [self.wall_list]
-        if self.moving_platforms:
-            platforms.append(self.moving_platforms)
+    def on_hide_view(self):
+        """
+        Called when another view is shown instead of this one.
+        """
+        self.close_enemy_pool()
+        self.emit_frame_times()
+        frame_pacer = getattr(self.window, "frame_pacer", None)
+        if frame_pacer:
+            frame_pacer.set_simulating(False)
 
-        self.physics_engine = arcade.PhysicsEnginePlatformer(
-            self.player_sprite, platforms, gravity_constant=GRAVITY
+    def visible_area(self):
+        """
+        Returns the (left, right, bottom, top) area of the
+        world that the camera is showing.
+        """
+        x, y = self.camera.position
+        half_width = self.window.width / 2
+        half_height = self.window.height / 2
+        return (
+            x - half_width,
+            x + half_width,
+            y - half_height,
+            y + half_height,
         )
 
-        # Sets the camera for the game view and GUI.
-        self.camera = arcade.Camera2D()
-        self.gui_camera = arcade.Camera2D()
-
-        max_x = GRID_PIXEL_SIZE * self.tile_map.width
-        max_y = GRID_PIXEL_SIZE * self.tile_map.height
-        self.camera_bounds = arcade.LRBT(
-            self.window.width / CAMERA_BOUNDS_PADDING,
-            max_x - self.window.width / CAMERA_BOUNDS_PADDING,
-            0,
-            max_y,
+    def reach(self):
+        """
+        Returns the (left, right, bottom, top) area the player's
+        attack and the magic spells in flight can hit enemies in.
+        """
+        player = self.player_sprite
+        left = player.center_x - player.attack_range
+        right = player.center_x + player.attack_range
+        bottom = player.center_y - player.attack_height
+        top = player.center_y + player.attack_height
+        spells = self.spells
+        for index in spells.active:
+            left = min(left, spells.x[index] - SPELL_SPEED)
+            right = max(right, spells.x[index] + SPELL_SPEED)
+            bottom = min(bottom, spells.y[index])
+            top = max(top, spells.y[index])
+        return (
+            left - SPELL_RADIUS,
+            right + SPELL_RADIUS,
+            bottom - SPELL_RADIUS,
+            top + SPELL_RADIUS,
         )
 
-        self.pan_camera_to_user()
-        self.game_over = False
+    def on_show_view(self):
+        """
+        Called when this view is shown. Starts a new
+        recording take if input recording is enabled, and keeps
+        the game updating while the window is unfocused.
+        """
+        if self.input_recorder:
+            self.input_recorder.begin(self.level)
+        frame_pacer = getattr(self.window, "frame_pacer", None)
+        if frame_pacer:
+            frame_pacer.set_simulating(True)
+
+    def state_digest(self):
+        """
+        Returns a short hash of the gameplay state, covering the
+        player, enemies and moving platforms. It is used to check
+        that a replay stays in sync with its recording.
+        """
+        player = self.player_sprite
+        values = [
+            self.level,
+            player.center_x,
+            player.center_y,
+            player.change_x,
+            player.change_y,
+            player.current_health,
+        ]
+        for enemy in self.enemy_lifecycle.enemies:
+            values += [enemy.center_x, enemy.center_y, enemy.current_health]
+        # Platforms are hashed from their computed positions, since
+        # the sprites far from the player are not moved.
+        self.platforms.update_positions(self.tick)
+        for x, y in zip(self.platforms.x, self.platforms.y):
+            values += [x, y]
+        for spell in self.spells.live_sprites():
+            values += [spell.center_x, spell.center_y]
+
+        state = ",".join(f"{value:.3f}" for value in values)
+        return hashlib.sha1(state.encode()).hexdigest()[:16]
+
+    def store_previous_positions(self):
+        """
+        Remembers where every moving sprite is before a simulation
+        tick, so that on_draw can interpolate between the previous
+        and the current tick.
+        """
+        self.previous_positions = [
+            (sprite, sprite.position)
+            for sprite_list in (
+                self.player_list,
+                self.enemy_list,
+                self.platforms.moved,
+                self.spells.live_sprites(),
+            )
+            for sprite in sprite_list
+        ]
 
     def load_enemies_from_map(self):
         """Load enemies from the tilemap object layer 
@@ -1224,22 +5348,29 @@ class GameView(arcade.View):
                 "right_boundary", x + ENEMY_PATROL_DISTANCE
             )
 
+            # Picks the type of enemy, falling back to the default
+            # type for types that are not known.
+            name = enemy_obj.properties.get("type", DEFAULT_ENEMY_TYPE)
+            if name not in ENEMY_ARCHETYPES:
+                print(f"Unknown enemy type {name!r}, using "
+                      f"{DEFAULT_ENEMY_TYPE!r}")
+                name = DEFAULT_ENEMY_TYPE
+
             # Creates the enemy character instance.
             enemy = EnemyCharacter(
                 x=x,
                 y=0,
+                archetype=self.enemy_archetype(name),
                 left_boundary=left,
                 right_boundary=right,
-                max_health=MUSHROOM_ENEMY_HEALTH,
-                walk_textures=self.enemy_walk_textures,
-                attack_textures=self.enemy_attack_textures,
-                takedamage_textures=self.enemy_takedamage_textures,
-                death_textures=self.enemy_death_textures,
-                game_view=self,
             )
             enemy.bottom = y
-            # Adds the enemy to the game's enemy list.
+            enemy.place_on_navigation(self.navigation)
+            # Adds the enemy to the game's enemy list, which plays
+            # its animations.
             self.enemy_list.append(enemy)
+            if self.gpu_animation:
+                enemy.animator = self.enemy_list
 
     def on_draw(self):
         """Render all game elements including background, 
@@ -1247,59 +5378,89 @@ class GameView(arcade.View):
         Called every frame to update the display.
         """
 
+        # Moves every sprite to its interpolated position between the
+        # previous and current simulation tick. The current positions
+        # are restored once drawing is done.
+        alpha = self.accumulator / SIMULATION_TICK_RATE
+        current_positions = []
+        for sprite, (previous_x, previous_y) in self.previous_positions:
+            current_x, current_y = sprite.position
+            current_positions.append((sprite, (current_x, current_y)))
+            sprite.position = (
+                previous_x + (current_x - previous_x) * alpha,
+                previous_y + (current_y - previous_y) * alpha,
+            )
+
         # Activate the camera.
         self.camera.use()
         self.clear()
 
-        # Draw the background layers in the proper order.
-        self.scene["Background"].draw()
-        self.scene["Midground"].draw()
-        self.scene["Foreground"].draw()
-        self.scene["Background_Filler"].draw()
-        self.scene["Decorations"].draw()
-
-
-        # Draw all in game objects and level elements.
-        self.wall_list.draw()
-        self.moving_platforms.draw()
-        self.finish_list.draw()
-        self.spikes_list.draw()
-        self.enemy_list.draw()
-        self.player_list.draw()
-
-        # Draws the health bars for player and enemies.
-        # this is done by iterating through the player and
-        # enemy lists
-        # and calling the draw_health_bar method for each sprite.
+        # Queues the health bars of the player and the enemies
+        # on screen, then draws everything in as few draw calls
+        # as the render queue can.
         for sprite in self.player_list:
-            sprite.draw_health_bar()
-
-
-        for enemy in self.enemy_list:
-            enemy.draw_health_bar()
+            sprite.queue_health_bar(self.render_queue)
+        left, right, bottom, top = self.visible_area()
+        for enemy in self.enemy_lifecycle.living:
+            if (
+                left - HEALTH_BAR_WIDTH <= enemy.center_x
+                <= right + HEALTH_BAR_WIDTH
+                and bottom - HEALTH_BAR_WIDTH <= enemy.center_y
+                <= top + HEALTH_BAR_WIDTH
+            ):
+                enemy.queue_health_bar(self.render_queue)
+        self.render_queue.draw()
+        self.check_render_budget()
 
         # Draw the GUI camera for UI elements.
         self.gui_camera.use()
 
+        for sprite, position in current_positions:
+            sprite.position = position
+        self.input_queue.presented()
+
     def on_key_press(self, key, modifiers):
-        """Handles key presses for player movement and actions.
+        """Queues key presses for player movement and actions.
+        They are applied at the start of the next simulation tick
+        by apply_key_press.
+        """
+        # Rewinding works even after the player has died, and is
+        # never recorded, since recordings do not keep a history.
+        # It is not queued, as it is checked once per tick anyway.
+        if key == REWIND_KEY:
+            self.rewind_pressed = True
+            return
+        if self.input_recorder:
+            self.input_recorder.record(self.tick, "press", key, modifiers)
+        self.input_queue.push("press", key, modifiers)
+
+    def on_key_release(self, key, modifiers):
+        """Queues key releases for player movement and actions.
+        They are applied at the start of the next simulation tick
+        by apply_key_release.
+        """
+        if key == REWIND_KEY:
+            self.rewind_pressed = False
+            return
+        if self.input_recorder:
+            self.input_recorder.record(self.tick, "release", key, modifiers)
+        self.input_queue.push("release", key, modifiers)
+
+    def apply_key_press(self, key):
+        """Applies a queued key press for player movement and actions.
         Sets the corresponding flags for movement and actions.
         """
-        # Handles key presses for player movement and actions.
-        # This sets the flags for movement and actions 
+        # This sets the flags for movement and actions
         # based on the key pressed. If the player presses the up
         # arrow or W key, it sets the up_pressed flag to True and
-        # checks if the player can jump. If so, it sets the player's
-        # vertical speed to the jump speed and plays the jump sound.
+        # buffers a jump, which resolve_jump performs as soon as
+        # the player can jump.
         # the rest of the keys follow the same logic.
-
         if self.player_sprite.is_dead:
             return
         if key == arcade.key.UP or key == arcade.key.W:
             self.up_pressed = True
-            if self.physics_engine.can_jump():
-                self.player_sprite.change_y = JUMP_SPEED
-                arcade.play_sound(self.jump_sound, volume=JUMP_SOUND_VOLUME)
+            self.jump_buffer = JUMP_BUFFER_TICKS
         elif key == arcade.key.LEFT or key == arcade.key.A:
             self.left_pressed = True
         elif key == arcade.key.RIGHT or key == arcade.key.D:
@@ -1307,12 +5468,13 @@ class GameView(arcade.View):
         elif key == arcade.key.SPACE:
             self.space_pressed = True
             self.player_sprite.start_attack()
+        elif key == arcade.key.F:
+            self.player_sprite.start_cast()
 
-    def on_key_release(self, key, modifiers):
-        """Handles key releases for player movement and actions.
-        Resets the corresponding flags for movement and actions.
+    def apply_key_release(self, key):
+        """Applies a queued key release for player movement and
+        actions. Resets the corresponding flags.
         """
-        # Handles key releases for player movement and actions.
         # This resets the flags for movement and actions
         # based on the key released. If the player releases the up
         # arrow or W key, it sets the up_pressed flag to False.
@@ -1326,10 +5488,94 @@ class GameView(arcade.View):
         elif key == arcade.key.SPACE:
             self.space_pressed = False
 
+    def resolve_jump(self, can_act=True):
+        """
+        Jumps if a jump is buffered, the player can act, and the
+        player is standing on the ground or walked off a ledge less
+        than COYOTE_TICKS ago. Otherwise the buffered jump waits for
+        up to JUMP_BUFFER_TICKS.
+        """
+        if self.physics_engine.can_jump():
+            self.coyote_ticks = COYOTE_TICKS
+        elif self.coyote_ticks:
+            self.coyote_ticks -= 1
+
+        if not self.jump_buffer:
+            return
+        if can_act and self.coyote_ticks:
+            self.player_sprite.change_y = JUMP_SPEED
+            arcade.play_sound(self.jump_sound, volume=JUMP_SOUND_VOLUME)
+            self.jump_buffer = 0
+            self.coyote_ticks = 0
+        else:
+            self.jump_buffer -= 1
+
     def on_update(self, delta_time):
-        """Updates the game state, which handles player death and 
-        screen transitions, player movement, enemy behaviour and AI,
-        moving platforms, physics updates, and camera panning."""
+        """Advances the simulation by as many fixed ticks as the
+        elapsed time allows, then pans the camera.
+        The number of catch-up ticks per frame is capped so that a
+        slow frame cannot cause the game to spiral further behind.
+        """
+        self.accumulator += delta_time
+
+        # Patches in any edits saved to the level's files.
+        if self.level_watcher:
+            self.level_watcher.poll()
+
+        # Counts the frame time for the telemetry histogram.
+        if self.telemetry:
+            self.frame_time_counts[
+                bisect.bisect_left(FRAME_TIME_BUCKETS, delta_time * 1000)
+            ] += 1
+            self.frame_time_elapsed += delta_time
+            if self.frame_time_elapsed >= TELEMETRY_HISTOGRAM_INTERVAL:
+                self.emit_frame_times()
+
+        ticks = 0
+        while (
+            self.accumulator >= SIMULATION_TICK_RATE
+            and ticks < MAX_CATCHUP_TICKS
+        ):
+            self.store_previous_positions()
+            self.fixed_update()
+            self.accumulator -= SIMULATION_TICK_RATE
+            ticks += 1
+
+            # Stops simulating once another screen has been shown.
+            if self.window.current_view is not self:
+                return
+
+        # Drops any time that could not be caught up on.
+        if ticks == MAX_CATCHUP_TICKS:
+            self.accumulator %= SIMULATION_TICK_RATE
+
+        # Smoothly moves the camera to follow the player.
+        self.pan_camera_to_user(CAMERA_PAN_SPEED)
+
+    def fixed_update(self):
+        """Runs a single simulation tick, which handles player death
+        and screen transitions, player movement, enemy behaviour and
+        AI, moving platforms, physics updates and collisions."""
+        # Streams in the tiles around the player before anything
+        # collides with them.
+        if self.tile_streamer:
+            self.tile_streamer.update(*self.player_sprite.position)
+
+        # Applies the key events that arrived since the last tick.
+        for action, key, _modifiers in self.input_queue.drain():
+            if action == "press":
+                self.apply_key_press(key)
+            else:
+                self.apply_key_release(key)
+
+        # Steps back through the history instead of simulating
+        # while the rewind key is held.
+        if self.rewind_pressed and self.rewind:
+            self.rewind_step()
+            return
+
+        self.tick += 1
+        self.set_animation_clock()
 
         # Handles player death and screen transitions.
         if self.player_sprite.is_dead:
@@ -1348,11 +5594,13 @@ class GameView(arcade.View):
         # player is dead or the game is over.
         if not self.game_over:
             # Only update movement if player is not
-            # attacking and not dead
-            if (
+            # attacking, casting or dead
+            can_act = (
                 not self.player_sprite.is_attacking
+                and not self.player_sprite.is_casting
                 and not self.player_sprite.is_dead
-            ):
+            )
+            if can_act:
                 if self.left_pressed and not self.right_pressed:
                     self.player_sprite.change_x = -MOVEMENT_SPEED
                 elif self.right_pressed and not self.left_pressed:
@@ -1360,69 +5608,179 @@ class GameView(arcade.View):
                 else:
                     self.player_sprite.change_x = 0
             else:
-                # Stop movement if attacking or dead
+                # Stop movement if attacking, casting or dead
                 self.player_sprite.change_x = 0
                 self.player_sprite.change_y = 0
 
+            # The jump timers count down every tick, so a jump
+            # pressed during an attack expires like any other.
+            self.resolve_jump(can_act)
+
             # Move platforms FIRST
-            for platform in self.moving_platforms:
-                platform.center_x += platform.change_x
-                if (
-                    platform.change_x > 0
-                    and platform.center_x > platform.boundary_right
-                ):
-                    platform.change_x *= -1
-                elif (
-                    platform.change_x < 0
-                    and platform.center_x < platform.boundary_left
-                ):
-                    platform.change_x *= -1
+            self.platforms.update(
+                self.tick, self.player_sprite, self.visible_area()
+            )
 
             # Then update physics so that the player
             # can interact with them.
             self.physics_engine.update()
-            self.player_sprite.update_animation(delta_time)
+            self.player_sprite.update_animation(SIMULATION_TICK_RATE)
 
             # Check for collisions with the finish line.
             # If the player collides with the finish line,
             # it checks if the level is complete.
             # If the level is complete, it either shows the end screen
             # or advances to the next level.
-            # If the player is on the last level
-            # it shows the end screen.
+            # If the player is on the last level of the level
+            # catalog it shows the end screen.
             if arcade.check_for_collision_with_list(
                 self.player_sprite, self.finish_list
             ):
-                if self.level == FINAL_LEVEL:
+                self.emit(
+                    "level_finish",
+                    ticks=self.tick - self.level_start_tick,
+                    seconds=time.perf_counter() - self.level_start_time,
+                    health=self.player_sprite.current_health,
+                )
+                self.emit_frame_times()
+                if self.level >= len(level_catalog):
                     end_screen = EndScreen(self)
                     self.window.show_view(end_screen)
+                    return
                 else:
                     self.level += 1
                     self.setup()
 
             # This is a list of hazards that the 
-            # player can collide with.
+            # player can collide with, and the cause of death
+            # reported for each.
             self.hazards = [self.spikes_list, self.boundaries_list]
+            causes = ["spike", "boundary"]
 
             # Then check collisions in one loop
-            for hazard in self.hazards:
+            for hazard, cause in zip(self.hazards, causes):
                 if arcade.check_for_collision_with_list(
                     self.player_sprite, hazard
                 ):
+                    if not self.player_sprite.is_dead:
+                        self.emit("death", cause=cause)
                     self.player_sprite.current_health = 0
                     self.player_sprite.is_dead = True
                     # Exit early if any hazard hits
                     break  
             
-            # Updates all the enemies in the game.
-            # This iterates through the enemy list and updates.
-            for enemy in self.enemy_list:
-                enemy.update()
-                enemy.detect_player(self.player_sprite)
-                enemy.update_animation(delta_time)
+            # Moves the magic spells and resolves their hits before
+            # the enemies act, against the enemies the player can hit.
+            self.spells.update(self.player_sprite.enemy_list, self.navigation)
+
+            # Updates all the enemies in the game, after pointing
+            # the flow field at the player's current cell.
+            # This iterates through the living enemies and updates,
+            # unless the enemies are simulated by worker processes.
+            self.navigation.refresh(self.player_sprite)
+            stepped = False
+            if self.enemy_pool:
+                stepped = self.enemy_pool.step(
+                    self.player_sprite, self.visible_area(), self.reach()
+                )
+                if self.enemy_pool.abandoned:
+                    print(
+                        "An enemy worker stopped answering, so the "
+                        "enemies are simulated in this process again."
+                    )
+                    self.enemy_pool = None
+                    self.player_sprite.enemy_list = (
+                        self.enemy_lifecycle.living
+                    )
+            if not stepped:
+                for enemy in self.enemy_lifecycle.living:
+                    enemy.update()
+                    enemy.detect_player(self.player_sprite)
+                    enemy.update_animation(SIMULATION_TICK_RATE)
+
+            # Moves the enemies that died out of the simulation, and
+            # the corpses out of the enemy list and the history.
+            settled = self.enemy_lifecycle.update(
+                animate=not self.enemy_pool
+            )
+            if self.rewind:
+                self.rewind.settle(settled)
+
+        # Stores a digest of the game state at a fixed interval
+        # so that replays of this recording can be verified.
+        if (
+            self.input_recorder
+            and self.tick % RECORDING_HASH_INTERVAL == 0
+        ):
+            self.input_recorder.checkpoint(self.tick, self.state_digest())
+
+        # Adds this tick to the rewind history.
+        if self.rewind:
+            self.rewind.capture(self.tick)
+
+    def emit(self, event, **fields):
+        """
+        Sends an event to the session telemetry, if it is enabled,
+        along with the current level and tick.
+        """
+        if self.telemetry:
+            self.telemetry.emit(
+                event, level=self.level, tick=self.tick, **fields
+            )
 
-        # Smoothly moves the camera to follow the player.
-        self.pan_camera_to_user(CAMERA_PAN_SPEED)
+    def emit_frame_times(self):
+        """
+        Sends the histograms of frame times and input latencies
+        counted since they were last sent, then starts counting
+        again.
+        """
+        if not self.telemetry:
+            return
+        if any(self.input_queue.simulation_counts):
+            self.emit("input_latency", **self.input_queue.histograms())
+            self.input_queue.reset_counts()
+        if not any(self.frame_time_counts):
+            return
+        self.emit(
+            "frame_times",
+            buckets_ms=FRAME_TIME_BUCKETS,
+            counts=self.frame_time_counts,
+            seconds=self.frame_time_elapsed,
+        )
+        self.frame_time_counts = [0] * (len(FRAME_TIME_BUCKETS) + 1)
+        self.frame_time_elapsed = 0.0
+
+    def rewind_step(self):
+        """
+        Steps the game back by one tick of the rewind history.
+        The platforms are moved to the earlier tick before the
+        player is restored, so they do not carry the player.
+        Magic spells in flight are removed, since they are not
+        part of the history, and enemies brought back to life
+        leave the corpse layer.
+        """
+        tick = self.rewind.step_back()
+        if tick is None:
+            return
+        self.tick = tick
+        self.set_animation_clock()
+        self.platforms.update(
+            self.tick, self.player_sprite, self.visible_area()
+        )
+        self.rewind.restore()
+        self.enemy_lifecycle.restore()
+        self.spells.clear()
+        self.jump_buffer = 0
+        self.coyote_ticks = 0
+
+    def set_animation_clock(self):
+        """
+        Tells the sprite lists that play the animations of the
+        characters which tick it is.
+        """
+        if self.gpu_animation:
+            self.player_list.clock = self.tick
+            self.enemy_list.clock = self.tick
 
     def pan_camera_to_user(self, panning_fraction: float = 1.0):
         """Smoothly moves the camera to follow the player position
@@ -1447,10 +5805,138 @@ def main():
     """
     Main Function of the code
     """
-    window = arcade.Window(WINDOW_WIDTH, WINDOW_HEIGHT, WINDOW_TITLE)
+    # Times the start of the game, which began with the imports.
+    startup = StartupPipeline(STARTUP_START)
+    startup.phase("imports")
+
+    parser = argparse.ArgumentParser(description=WINDOW_TITLE)
+    parser.add_argument(
+        "--record",
+        metavar="PATH",
+        help="record key input to a file that replay.py can play back",
+    )
+    parser.add_argument(
+        "--enemy-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="simulate enemies in N worker processes on large levels",
+    )
+    parser.add_argument(
+        "--hit-boxes",
+        choices=HIT_BOX_MODES,
+        default=HIT_BOX_MODE,
+        help="outline sprite pixels or use boxes around them",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="print memory use and live sprite counts on each level load",
+    )
+    parser.add_argument(
+        "--telemetry",
+        metavar="PATH",
+        help="append gameplay and frame time events to a .jsonl.gz file",
+    )
+    parser.add_argument(
+        "--hot-reload",
+        action="store_true",
+        help="reload the level's layers when its map files are saved",
+    )
+    parser.add_argument(
+        "--cpu-animation",
+        action="store_true",
+        help="pick character animation frames on the CPU, not the GPU",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=1 / RENDER_RATE,
+        help="frames drawn per second",
+    )
+    parser.add_argument(
+        "--update-fps",
+        type=float,
+        help="updates per second, at least --fps (default: --fps)",
+    )
+    parser.add_argument(
+        "--idle-fps",
+        type=float,
+        default=1 / MENU_IDLE_RATE,
+        help="frames per second when unfocused or idle, which menus "
+        "also update at",
+    )
+    parser.add_argument(
+        "--pacing-report",
+        action="store_true",
+        help="print missed frame deadlines and frame time jitter",
+    )
+    parser.add_argument(
+        "--startup-trace",
+        action="store_true",
+        help="print how long each phase of starting the game took",
+    )
+    parser.add_argument(
+        "--quit-after-startup",
+        action="store_true",
+        help="close the game once it has started, for timing the start",
+    )
+    args = parser.parse_args()
+    startup.trace = args.startup_trace
+    startup.quit_when_done = args.quit_after_startup
+    startup.phase("arguments")
+    draw_rate = 1 / args.fps
+    update_rate = min(draw_rate, 1 / (args.update_fps or args.fps))
+
+    window = arcade.Window(
+        WINDOW_WIDTH,
+        WINDOW_HEIGHT,
+        WINDOW_TITLE,
+        update_rate=update_rate,
+        draw_rate=draw_rate,
+    )
+    startup.phase("window")
+    window.startup = startup
+    window.input_recorder = None
+    window.enemy_workers = args.enemy_workers
+    window.hit_box_mode = args.hit_boxes
+    window.memory_report = args.memory_report
+    window.hot_reload = args.hot_reload
+    window.gpu_animation = not args.cpu_animation
+    window.telemetry = None
+    if args.telemetry:
+        window.telemetry = TelemetryWriter(args.telemetry)
+    if args.memory_report:
+        import memory_telemetry
+        memory_telemetry.start()
+    if args.record:
+        window.input_recorder = InputRecorder(args.record)
+
+    # Paces the updates and frames of the window from now on.
+    window.frame_pacer = FramePacer(
+        window,
+        update_rate=update_rate,
+        draw_rate=draw_rate,
+        idle_rate=1 / args.idle_fps,
+        report=args.pacing_report,
+    )
+    startup.phase("options")
+
     start_view = StartScreen()
     window.show_view(start_view)
-    arcade.run()
+    startup.phase("start screen")
+    window.frame_pacer.run()
+
+    # Saves the recording once the window has been closed.
+    if window.input_recorder:
+        window.input_recorder.save()
+
+    # Keeps any hit boxes that were not compiled yet for next time.
+    save_hit_box_cache()
+
+    # Writes out the rest of the telemetry of the session.
+    if window.telemetry:
+        window.telemetry.close()
 
 # Runs the code.
 if __name__ == "__main__":
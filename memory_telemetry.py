@@ -0,0 +1,121 @@
+"""
+Adventurer's Impact - Memory Telemetry
+
+Reports how much memory the game is using, so leaks across level
+transitions and restarts can be spotted. A snapshot covers:
+
+    rss              resident memory of the process in bytes
+    python_heap      bytes allocated by Python, if tracemalloc runs
+    sprites          live arcade Sprite objects
+    sprite_lists     live arcade SpriteList objects
+    textures         live arcade Texture objects
+    gpu_textures     live OpenGL textures
+    gpu_texture_bytes  bytes held by those OpenGL textures
+
+Counting live objects walks every object tracked by the garbage
+collector, so snapshots are meant for tools and debugging, not for
+taking every frame.
+
+Usage:
+    import memory_telemetry
+    memory_telemetry.start()
+    print(memory_telemetry.format_snapshot(memory_telemetry.snapshot()))
+"""
+
+# Importing the libraries that are used for the memory telemetry.
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+
+# Constants for the memory telemetry
+STATM_PATH = "/proc/self/statm"
+TRACEMALLOC_FRAMES = 1
+
+
+def start():
+    """
+    Starts tracing Python allocations, so that snapshots include
+    the size of the Python heap.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+def process_rss():
+    """
+    Returns the resident memory of the process in bytes. Where
+    /proc is not available the peak resident memory is returned.
+    """
+    try:
+        with open(STATM_PATH) as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def snapshot():
+    """
+    Returns a dictionary with the current memory usage of the
+    game. Garbage is collected first, so objects only kept alive
+    by reference cycles are not counted.
+    """
+    import arcade
+
+    gc.collect()
+    counts = {
+        "sprites": 0,
+        "sprite_lists": 0,
+        "textures": 0,
+        "gpu_textures": 0,
+        "gpu_texture_bytes": 0,
+    }
+    for obj in gc.get_objects():
+        if isinstance(obj, arcade.BasicSprite):
+            counts["sprites"] += 1
+        elif isinstance(obj, arcade.SpriteList):
+            counts["sprite_lists"] += 1
+        elif isinstance(obj, arcade.Texture):
+            counts["textures"] += 1
+        elif isinstance(obj, arcade.gl.Texture2D):
+            counts["gpu_textures"] += 1
+            counts["gpu_texture_bytes"] += obj.byte_size
+
+    python_heap = None
+    if tracemalloc.is_tracing():
+        python_heap = tracemalloc.get_traced_memory()[0]
+    return dict(counts, rss=process_rss(), python_heap=python_heap)
+
+
+def difference(before, after):
+    """
+    Returns how much each value of a snapshot grew between two
+    snapshots. Values that were not measured are left out.
+    """
+    return {
+        name: after[name] - before[name]
+        for name in after
+        if after[name] is not None and before.get(name) is not None
+    }
+
+
+def format_snapshot(values, signed=False):
+    """
+    Returns a snapshot, or a difference between two snapshots
+    when signed is set, as one line of text with sizes in
+    megabytes.
+    """
+    sign = "+" if signed else ""
+    parts = []
+    for name, value in values.items():
+        if value is None:
+            continue
+        if name in ("rss", "python_heap", "gpu_texture_bytes"):
+            parts.append(f"{name} {value / 1024 / 1024:{sign}.1f}MB")
+        else:
+            parts.append(f"{name} {value:{sign}d}")
+    return " ".join(parts)
@@ -0,0 +1,216 @@
+"""
+Adventurer's Impact - Observation Grid
+
+Encodes the map around the player as a grid of cells, one cell per
+tile, for automated agents and debugging tools.
+
+All channels of the level are kept in one preallocated bytearray,
+laid out as [channel][row][column] with row 0 at the bottom of the
+map. The grid is padded by the window radius on every side, so the
+window around the player never has to be clipped. Each call to
+window() copies the rows around the player into a second
+preallocated bytearray with one slice assignment per channel, and
+the window's row views of that bytearray are built once with the
+grid.
+
+The static channels (solid, spike, boundary and finish) are filled
+once when the grid is built. The dynamic channels (enemy and platform)
+hold a count of entities per cell and are updated incrementally, only
+touching the cells of entities that moved to a different cell.
+"""
+
+# Constants for the observation grid
+CHANNELS = ("solid", "spike", "boundary", "finish", "enemy", "platform")
+SOLID = 0
+SPIKE = 1
+BOUNDARY = 2
+FINISH = 3
+ENEMY = 4
+PLATFORM = 5
+OBSERVATION_RADIUS = 8
+MAX_CELL_COUNT = 255
+
+
+class ObservationWindow:
+    """
+    This class is a view of the cells around the player.
+    rows[channel][row] is a memoryview of one row of the window
+    for that channel, ordered from the bottom row to the top row.
+    The grid reuses the same window for every observation, so its
+    cells are overwritten by the next call to window().
+    """
+    __slots__ = ("rows", "size")
+
+    def __init__(self, rows, size):
+        """
+        Initializes the window with its row views and its width.
+        """
+        self.rows = rows
+        self.size = size
+
+    def cell(self, channel, x, y):
+        """
+        Returns the value of a channel at a window cell, where
+        (0, 0) is the bottom left corner of the window.
+        """
+        return self.rows[channel][y][x]
+
+
+class ObservationGrid:
+    """
+    This class keeps the multi-channel grid of a loaded level
+    and returns the window of cells centred on the player.
+    A new grid has to be built whenever GameView.setup() loads
+    another level.
+    """
+    def __init__(self, game_view, radius=OBSERVATION_RADIUS):
+        """
+        Builds the grid from the tile layers of the game view's
+        current level and places the enemies and platforms.
+        """
+        tile_map = game_view.tile_map
+        self.game_view = game_view
+        self.radius = radius
+        self.cell_size = tile_map.tile_width * tile_map.scaling
+        self.map_width = tile_map.width
+        self.map_height = tile_map.height
+        self.width = tile_map.width + 2 * radius
+        self.height = tile_map.height + 2 * radius
+        self.plane_size = self.width * self.height
+        self.cells = bytearray(len(CHANNELS) * self.plane_size)
+        self.view = memoryview(self.cells)
+
+        # The window is copied into its own buffer, laid out with
+        # the same row stride as the grid, so the rows of a channel
+        # are one contiguous span. The row views are made once here
+        # instead of on every observation.
+        self.size = 2 * radius + 1
+        self.span = (self.size - 1) * self.width + self.size
+        self.window_cells = bytearray(len(CHANNELS) * self.span)
+        window_view = memoryview(self.window_cells)
+        self.observation = ObservationWindow(
+            [
+                [
+                    window_view[start:start + self.size]
+                    for start in range(
+                        channel * self.span,
+                        channel * self.span + self.size * self.width,
+                        self.width,
+                    )
+                ]
+                for channel in range(len(CHANNELS))
+            ],
+            self.size,
+        )
+
+        static_layers = (
+            (SOLID, "Ground", game_view.wall_list),
+            (SPIKE, "Spikes", game_view.spikes_list),
+            (BOUNDARY, "Boundaries", game_view.boundaries_list),
+            (FINISH, "Finish", game_view.finish_list),
+        )
+        # Streamed layers only have sprites near the player, so
+        # their cells are read from the streamer's grids instead.
+        tile_streamer = game_view.tile_streamer
+        for channel, name, sprite_list in static_layers:
+            if tile_streamer and name in tile_streamer.grids:
+                for column, row in tile_streamer.cells(name):
+                    self.cells[self.index(channel, column, row)] = 1
+                continue
+            for sprite in sprite_list:
+                self.fill_sprite(channel, sprite)
+
+        # Remembers the cell each dynamic entity was last placed in.
+        self.entity_cells = {}
+        self.update()
+
+    def index(self, channel, x, y):
+        """
+        Returns the position in the bytearray of a map cell.
+        """
+        return (
+            channel * self.plane_size
+            + (y + self.radius) * self.width
+            + x
+            + self.radius
+        )
+
+    def cell_of(self, x, y):
+        """
+        Returns the map cell containing a world position, clamped
+        to the edges of the map.
+        """
+        column = int(x // self.cell_size)
+        row = int(y // self.cell_size)
+        column = max(0, min(column, self.map_width - 1))
+        row = max(0, min(row, self.map_height - 1))
+        return column, row
+
+    def fill_sprite(self, channel, sprite):
+        """
+        Marks every cell covered by a static sprite.
+        """
+        left, bottom = self.cell_of(sprite.left, sprite.bottom)
+        right, top = self.cell_of(sprite.right - 1, sprite.top - 1)
+        for row in range(bottom, top + 1):
+            for column in range(left, right + 1):
+                self.cells[self.index(channel, column, row)] = 1
+
+    def move_entity(self, channel, sprite, cell):
+        """
+        Moves an entity's count from its previous cell to a new
+        cell. A cell of None removes the entity from the grid.
+        """
+        previous = self.entity_cells.get(sprite)
+        if previous == cell:
+            return
+        if previous is not None:
+            position = self.index(channel, *previous)
+            if self.cells[position]:
+                self.cells[position] -= 1
+        if cell is not None:
+            position = self.index(channel, *cell)
+            if self.cells[position] < MAX_CELL_COUNT:
+                self.cells[position] += 1
+            self.entity_cells[sprite] = cell
+        else:
+            self.entity_cells.pop(sprite, None)
+
+    def update(self):
+        """
+        Updates the dynamic channels for enemies and platforms that
+        moved to a different cell since the last update. Dead
+        enemies are removed from the enemy channel.
+        """
+        for enemy in self.game_view.enemy_lifecycle.enemies:
+            cell = None
+            if not enemy.is_dead:
+                cell = self.cell_of(enemy.center_x, enemy.center_y)
+            self.move_entity(ENEMY, enemy, cell)
+        for platform in self.game_view.moving_platforms:
+            self.move_entity(
+                PLATFORM,
+                platform,
+                self.cell_of(platform.center_x, platform.center_y),
+            )
+
+    def window(self):
+        """
+        Copies the window of cells centred on the player into the
+        window buffer and returns it. The same window is returned
+        every time, so it has to be read before the next call.
+        """
+        player = self.game_view.player_sprite
+        column, row = self.cell_of(player.center_x, player.center_y)
+        span = self.span
+        # The padding cancels out the radius, so the bottom left
+        # cell of the window is at the player's unpadded position.
+        source = row * self.width + column
+        target = 0
+        for _ in range(len(CHANNELS)):
+            self.window_cells[target:target + span] = (
+                self.view[source:source + span]
+            )
+            source += self.plane_size
+            target += span
+        return self.observation
@@ -0,0 +1,141 @@
+"""
+Adventurer's Impact - Replay Driver
+
+Plays back a recording made with `python main.py --record PATH`.
+The recorded key events are fed into GameView through the same
+on_key_press/on_key_release handlers on the tick they were recorded
+on, while the simulation is stepped at a fixed timestep.
+State digests are compared against the recording so any
+divergence is reported, which lets recordings be used as
+both benchmarks and regression tests.
+
+Usage:
+    python replay.py recording.json [--take N] [--render] [--headless]
+"""
+
+# Importing the libraries that are used for the replay driver.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+
+def parse_args():
+    """
+    Reads the command line options for the replay driver.
+    """
+    parser = argparse.ArgumentParser(description="Replay a recording.")
+    parser.add_argument("recording", help="recording file to play back")
+    parser.add_argument(
+        "--take", type=int, default=0, help="index of the take to replay"
+    )
+    parser.add_argument(
+        "--render", action="store_true", help="draw every simulated tick"
+    )
+    parser.add_argument(
+        "--headless", action="store_true", help="run without a window"
+    )
+    return parser.parse_args()
+
+
+def replay(take, render=False):
+    """
+    Replays a single take and returns a tuple of the number
+    of ticks simulated, the wall time it took, and a list of
+    (tick, expected, actual) digests that did not match.
+    """
+    # Imported here so that ARCADE_HEADLESS can be set first.
+    import arcade
+    import main
+
+    window = arcade.get_window()
+    window.input_recorder = None
+
+    # Seeds the random number generator the same way
+    # the recorder did before the game view is created.
+    random.seed(take["seed"])
+    game_view = main.GameView()
+    game_view.level = take["level"]
+    game_view.setup()
+    window.show_view(game_view)
+
+    events = take["events"]
+    expected = dict(take["hashes"])
+    last_tick = max(
+        [event[0] for event in events] + list(expected) + [0]
+    )
+    mismatches = []
+    event_index = 0
+
+    start = time.perf_counter()
+    while game_view.tick <= last_tick:
+        # Dispatches every event that was processed before this tick.
+        while (
+            event_index < len(events)
+            and events[event_index][0] <= game_view.tick
+        ):
+            _, action, key, modifiers = events[event_index]
+            if action == "press":
+                game_view.on_key_press(key, modifiers)
+            else:
+                game_view.on_key_release(key, modifiers)
+            event_index += 1
+
+        game_view.on_update(main.SIMULATION_TICK_RATE)
+
+        # Stops once the game view is replaced by another screen.
+        if window.current_view is not game_view:
+            break
+
+        if render:
+            game_view.on_draw()
+            window.flip()
+
+        if game_view.tick in expected:
+            digest = game_view.state_digest()
+            if digest != expected[game_view.tick]:
+                mismatches.append(
+                    (game_view.tick, expected[game_view.tick], digest)
+                )
+    elapsed = time.perf_counter() - start
+
+    return game_view.tick, elapsed, mismatches
+
+
+def main():
+    """
+    Main function of the replay driver.
+    """
+    args = parse_args()
+    if args.headless:
+        os.environ["ARCADE_HEADLESS"] = "1"
+
+    with open(args.recording) as file:
+        recording = json.load(file)
+    take = recording["takes"][args.take]
+
+    # The game loads its resources relative to its own folder.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    import arcade
+    import main as game
+
+    arcade.Window(
+        game.WINDOW_WIDTH, game.WINDOW_HEIGHT, game.WINDOW_TITLE,
+        visible=not args.headless,
+    )
+    ticks, elapsed, mismatches = replay(take, args.render)
+
+    print(f"Replayed {ticks} ticks of level {take['level']} "
+          f"in {elapsed:.3f}s ({ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    for tick, expected, actual in mismatches:
+        print(f"Diverged at tick {tick}: expected {expected}, got {actual}")
+
+    return 1 if mismatches else 0
+
+
+# Runs the replay driver.
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#version 330
+
+// Vertex shader of AnimatedSpriteList in main.py. It is the vertex
+// shader of arcade's sprite lists, except that a sprite playing an
+// animation takes the texture of its current frame from the frame
+// table, so the frames advance without the sprite being updated.
+
+in vec4 in_pos;
+in vec2 in_size;
+in float in_texture;
+in vec4 in_color;
+// The first entry of the animation in the frame table, its number
+// of frames (negative when it holds its last frame instead of
+// looping), the ticks each frame is shown for and the tick the
+// animation started on. Sprites without an animation have no frames.
+in vec4 in_animation;
+
+// The atlas slot of the texture of every frame.
+uniform sampler2D frame_table;
+// The current simulation tick.
+uniform float clock;
+
+out float v_angle;
+out vec4 v_color;
+out vec2 v_size;
+out float v_texture;
+
+void main() {
+    gl_Position = vec4(in_pos.xyz, 1.0);
+    v_angle = in_pos.w;
+    v_color = in_color;
+    v_size = in_size;
+    v_texture = in_texture;
+
+    int frames = int(round(in_animation.y));
+    if (frames != 0) {
+        // The ticks are whole numbers, so the frame is worked out
+        // with integers to avoid rounding errors.
+        int ticks_per_frame = int(round(in_animation.z));
+        int elapsed = int(round(clock - in_animation.w));
+        int frame;
+        if (frames > 0) {
+            int period = frames * ticks_per_frame;
+            frame = (elapsed % period + period) % period / ticks_per_frame;
+        } else {
+            frame = clamp(elapsed / ticks_per_frame, 0, -frames - 1);
+        }
+        int entry = int(round(in_animation.x)) + frame;
+        int width = textureSize(frame_table, 0).x;
+        v_texture = texelFetch(
+            frame_table, ivec2(entry % width, entry / width), 0
+        ).r;
+    }
+}